@@ -0,0 +1,334 @@
+import argparse
+import concurrent.futures
+import fnmatch
+import json
+import numbers
+import os
+import time
+
+from binformat import FIELD_ORDER, MODIFIER_BITS
+from catalog import file_digest
+from recformat import RECORDING_PATTERNS, find_recordings, read_recording
+
+ANALYZER_VERSION = 2
+CACHE_FILE = 'analysis_cache.json'
+REPORT_FILE = 'analysis_report.json'
+
+# 每个文件最多保留的问题明细数，其余只计数
+MAX_ISSUES = 100
+
+MODIFIER_NAMES = {name for name, _ in MODIFIER_BITS}
+ACTIONS = ('pressed', 'released')
+COORD_KEYS = ('x', 'y', 'start_x', 'start_y', 'end_x', 'end_y', 'dx', 'dy', 'width', 'height')
+
+
+class FileAnalysis:
+    """单个录制文件的校验与统计"""
+
+    def __init__(self):
+        self.issues = []
+        self.issue_counts = {}
+        self.counts = {}
+        self.keys = {}
+        self.buttons = {}
+        self.modifiers = {}
+        self.per_second = {}
+        self.longest_gap = 0.0
+
+    def issue(self, index, code, message):
+        self.issue_counts[code] = self.issue_counts.get(code, 0) + 1
+        if len(self.issues) < MAX_ISSUES:
+            self.issues.append({'index': index, 'code': code, 'message': message})
+
+    def check_schema(self, index, event):
+        """按 InputRecorder 录制的字段检查单个事件，返回事件是否可以继续检查"""
+        if not isinstance(event, dict):
+            self.issue(index, 'not_object', "事件不是对象")
+            return False
+        event_type = event.get('type')
+        fields = FIELD_ORDER.get(event_type)
+        if fields is None:
+            self.issue(index, 'unknown_type', f"未知的事件类型: {event_type!r}")
+            return False
+
+        missing = [field for field in fields if field not in event]
+        if missing:
+            self.issue(index, 'missing_field', f"{event_type} 缺少字段: {', '.join(missing)}")
+            return False
+        extra = [field for field in event if field not in fields]
+        if extra:
+            self.issue(index, 'extra_field', f"{event_type} 有多余字段: {', '.join(extra)}")
+
+        timestamp = event['timestamp']
+        if not isinstance(timestamp, numbers.Real) or isinstance(timestamp, bool) or timestamp < 0:
+            self.issue(index, 'bad_timestamp', f"时间戳无效: {timestamp!r}")
+            return False
+        for key in COORD_KEYS:
+            if key in event and (not isinstance(event[key], numbers.Real) or isinstance(event[key], bool)):
+                self.issue(index, 'bad_coordinate', f"坐标 {key} 无效: {event[key]!r}")
+        if 'event' in event and event['event'] not in ACTIONS:
+            self.issue(index, 'bad_action', f"动作无效: {event['event']!r}")
+            return False
+
+        if event_type == 'sync' and not isinstance(event['hash'], str):
+            self.issue(index, 'bad_hash', f"同步点哈希无效: {event['hash']!r}")
+
+        modifiers = event.get('modifiers', [])
+        if not isinstance(modifiers, list) or any(mod not in MODIFIER_NAMES for mod in modifiers):
+            self.issue(index, 'bad_modifiers', f"修饰键无效: {modifiers!r}")
+        return True
+
+    def analyze(self, events):
+        held_buttons = {}   # 按钮 -> 按下事件的序号
+        held_keys = {}
+        last_time = None
+        start = end = None
+
+        for index, event in enumerate(events):
+            if not self.check_schema(index, event):
+                continue
+
+            event_type = event['type']
+            timestamp = event['timestamp']
+            self.counts[event_type] = self.counts.get(event_type, 0) + 1
+            second = int(timestamp)
+            self.per_second[second] = self.per_second.get(second, 0) + 1
+            for mod in event.get('modifiers', []):
+                self.modifiers[mod] = self.modifiers.get(mod, 0) + 1
+
+            if last_time is not None:
+                if timestamp < last_time:
+                    self.issue(index, 'non_monotonic',
+                               f"时间戳倒退: {timestamp:.6f} < {last_time:.6f}")
+                else:
+                    self.longest_gap = max(self.longest_gap, timestamp - last_time)
+            last_time = timestamp if last_time is None else max(last_time, timestamp)
+            start = timestamp if start is None else min(start, timestamp)
+            end = timestamp if end is None else max(end, timestamp)
+
+            if event_type == 'mouse':
+                button = event['button']
+                if event['event'] == 'pressed':
+                    self.buttons[button] = self.buttons.get(button, 0) + 1
+                    if button in held_buttons:
+                        self.issue(index, 'double_press', f"{button} 在释放前再次按下")
+                    held_buttons[button] = index
+                elif held_buttons.pop(button, None) is None:
+                    self.issue(index, 'release_without_press', f"{button} 释放前没有按下")
+
+            elif event_type in ('mouse_drag', 'mouse_drag_end'):
+                button = event['button']
+                if button not in held_buttons:
+                    code = 'drag_end_without_press' if event_type == 'mouse_drag_end' else 'drag_without_press'
+                    self.issue(index, code, f"{event_type} 之前没有按下 {button}")
+
+            elif event_type == 'keyboard':
+                key = event['key']
+                if is_stop_chord(event):
+                    self.issue(index, 'stop_chord', "录制中包含停止录制的 Ctrl+Esc")
+                if event['event'] == 'pressed':
+                    self.keys[key] = self.keys.get(key, 0) + 1
+                    held_keys[key] = index
+                elif held_keys.pop(key, None) is None:
+                    self.issue(index, 'release_without_press', f"按键 {key!r} 释放前没有按下")
+
+        for button, index in held_buttons.items():
+            self.issue(index, 'press_without_release', f"{button} 按下后没有释放")
+        for key, index in held_keys.items():
+            self.issue(index, 'press_without_release', f"按键 {key!r} 按下后没有释放")
+
+        duration = (end - start) if start is not None else 0.0
+        event_count = sum(self.counts.values())
+        return {
+            'valid': not self.issue_counts,
+            'event_count': event_count,
+            'duration': duration,
+            'events_per_second': event_count / duration if duration > 0 else 0.0,
+            'peak_events_per_second': max(self.per_second.values(), default=0),
+            'longest_gap': self.longest_gap,
+            'counts': self.counts,
+            'keys': self.keys,
+            'buttons': self.buttons,
+            'modifiers': self.modifiers,
+            'issue_counts': self.issue_counts,
+            'issues': self.issues,
+        }
+
+
+def is_stop_chord(event):
+    """停止录制的 Ctrl+Esc 是否被录进了事件
+
+    Esc 在部分平台上录制为控制字符 '\\x1b'，单独按 Esc 不算停止组合键。
+    """
+    return event['key'] in ('Key.esc', '\x1b') and 'ctrl' in event.get('modifiers', [])
+
+
+def analyze_file(path):
+    """在工作进程中读取并分析一个录制文件"""
+    try:
+        start_time, events = read_recording(path)
+    except Exception as e:
+        return {'valid': False, 'error': f"{type(e).__name__}: {e}",
+                'issue_counts': {'unreadable': 1}, 'issues': []}
+    result = FileAnalysis().analyze(events)
+    result['start_time'] = start_time
+    return result
+
+
+def scan_directory(directory, recursive=False):
+    """列出目录中的录制文件，recursive 为 True 时包括子目录"""
+    if not recursive:
+        return find_recordings(directory)
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if any(fnmatch.fnmatch(name, pattern) for pattern in RECORDING_PATTERNS):
+                files.append(os.path.normpath(os.path.join(root, name)))
+    return sorted(files)
+
+
+def load_cache(filename):
+    """缓存: {'files': {路径: [mtime_ns, size, sha256]}, 'results': {sha256: 结果}}"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == ANALYZER_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {'version': ANALYZER_VERSION, 'files': {}, 'results': {}}
+
+
+def save_cache(filename, cache):
+    temp_file = f'{filename}.{os.getpid()}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(temp_file, filename)
+
+
+def analyze_corpus(files, workers=None, cache=None):
+    """并行分析所有录制文件，返回 ({路径: 结果}, 复用缓存的文件数)
+
+    内容哈希未变化的文件直接使用缓存结果；修改时间与大小都未变化时连哈希也不重新计算。
+    """
+    cache = cache if cache is not None else {'version': ANALYZER_VERSION, 'files': {}, 'results': {}}
+    known_files = cache['files']
+    known_results = cache['results']
+    digests = {}
+    stale = []
+
+    for path in files:
+        stat = os.stat(path)
+        entry = known_files.get(path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            digests[path] = entry[2]
+        else:
+            stale.append((path, stat))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # 先并行计算变化过的文件的哈希，内容没变的文件不需要重新分析
+        for (path, stat), digest in zip(stale, executor.map(file_digest, [p for p, _ in stale])):
+            digests[path] = digest
+            known_files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+
+        pending = {}
+        for path in files:
+            if digests[path] not in known_results:
+                pending.setdefault(digests[path], path)
+
+        futures = {executor.submit(analyze_file, path): digest for digest, path in pending.items()}
+        for future in concurrent.futures.as_completed(futures):
+            known_results[futures[future]] = future.result()
+
+    # 删除已不存在的文件和不再被引用的结果
+    for path in list(known_files):
+        if path not in digests and not os.path.exists(path):
+            del known_files[path]
+    used = {entry[2] for entry in known_files.values()}
+    for digest in list(known_results):
+        if digest not in used:
+            del known_results[digest]
+
+    results = {}
+    for path in files:
+        result = dict(known_results[digests[path]])
+        result['sha256'] = digests[path]
+        results[path] = result
+    return results, len(files) - len(pending)
+
+
+def merge_counts(target, counts):
+    for name, count in counts.items():
+        target[name] = target.get(name, 0) + count
+
+
+def build_report(results, reused, wall_time):
+    """汇总所有文件的结果"""
+    totals = {
+        'files': len(results),
+        'valid': 0,
+        'invalid': 0,
+        'reused_from_cache': reused,
+        'events': 0,
+        'duration': 0.0,
+        'issue_counts': {},
+        'counts': {},
+        'keys': {},
+        'buttons': {},
+        'modifiers': {},
+    }
+    for result in results.values():
+        totals['valid' if result['valid'] else 'invalid'] += 1
+        totals['events'] += result.get('event_count', 0)
+        totals['duration'] += result.get('duration', 0.0)
+        for name in ('issue_counts', 'counts', 'keys', 'buttons', 'modifiers'):
+            merge_counts(totals[name], result.get(name, {}))
+
+    return {
+        'generated': time.time(),
+        'analyzer_version': ANALYZER_VERSION,
+        'wall_time': wall_time,
+        'totals': totals,
+        'files': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并行校验并统计目录中的所有录制文件')
+    parser.add_argument('directory', nargs='?', default='.', help='录制文件所在目录')
+    parser.add_argument('-r', '--recursive', action='store_true', help='包括子目录')
+    parser.add_argument('--workers', type=int, help='工作进程数，默认为 CPU 数')
+    parser.add_argument('--report', default=REPORT_FILE, help='汇总报告文件')
+    parser.add_argument('--cache', default=CACHE_FILE, help='按内容哈希缓存每个文件的结果')
+    parser.add_argument('--no-cache', action='store_true', help='忽略缓存，重新分析所有文件')
+    args = parser.parse_args()
+
+    files = scan_directory(args.directory, args.recursive)
+    if not files:
+        print("没有找到任何录制文件")
+        return 1
+
+    cache = None if args.no_cache else load_cache(args.cache)
+    started = time.perf_counter()
+    results, reused = analyze_corpus(files, args.workers, cache)
+    report = build_report(results, reused, time.perf_counter() - started)
+    if cache is not None:
+        save_cache(args.cache, cache)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for path, result in results.items():
+        if not result['valid']:
+            problems = ', '.join(f"{code} x{count}" for code, count in result['issue_counts'].items())
+            print(f"[问题] {path}: {problems}")
+
+    totals = report['totals']
+    print(f"\n共 {totals['files']} 个文件 ({reused} 个使用缓存), 有效 {totals['valid']}, "
+          f"有问题 {totals['invalid']}, 事件 {totals['events']}, 耗时 {report['wall_time']:.1f}s")
+    print(f"报告已保存到: {args.report}")
+    return 0 if totals['invalid'] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import itertools
+import time
+
+from playplan import OP_KEY_PRESS, OP_KEY_RELEASE, OP_TYPE, backend_handlers, load_plan
+from scheduler import summarize_lateness
+
+
+KEYBOARD_OPS = frozenset((OP_KEY_PRESS, OP_KEY_RELEASE, OP_TYPE))
+
+
+def split_tracks(steps):
+    """按操作码把回放计划拆成键盘与鼠标两条独立的轨道
+
+    只含键盘操作的步骤进入键盘轨道，其余进入鼠标轨道。合并修饰键(coalesce_modifiers)时
+    鼠标步骤可能同时释放或按下修饰键，这样的步骤无法拆开而不改变两条轨道之间的顺序，
+    此时抛出 ValueError。定位回放开头的恢复步骤需先用 split_prelude 取出。
+    """
+    tracks = {'keyboard': [], 'mouse': []}
+    for step in steps:
+        keyboard = [op in KEYBOARD_OPS for op, _ in step[2]]
+        if any(keyboard) and not all(keyboard):
+            raise ValueError(f"步骤同时包含键盘与鼠标操作，合并修饰键时不能拆分轨道: {step[3]}")
+        tracks['keyboard' if keyboard and all(keyboard) else 'mouse'].append(step)
+    return {name: steps for name, steps in tracks.items() if steps}
+
+
+def split_prelude(steps):
+    """取出计划开头定位回放(seek_plan)的恢复步骤，返回 (恢复步骤列表, 其余步骤)
+
+    恢复步骤同时按下按键与鼠标按钮，必须在各轨道开始之前按原顺序完整执行。
+    """
+    steps = iter(steps)
+    prelude = []
+    for step in steps:
+        if step[1] != 'seek':
+            return prelude, itertools.chain((step,), steps)
+        prelude.append(step)
+    return prelude, iter(())
+
+
+class AsyncPlayer:
+    """基于 asyncio 的回放引擎，可以嵌入到其它异步服务中
+
+    每条轨道是一个任务，按 start + timestamp / speed 的绝对时刻发出操作，等待期间不占用事件循环，
+    因此多条轨道(键盘与鼠标，或多个录制文件)可以在各自的时间线上并发回放。
+    stop() 或取消外层任务会立即打断任意长的等待；pause() 期间不发出任何操作，
+    resume() 后所有轨道的时间线整体顺延暂停的时长。
+    """
+
+    def __init__(self, backend, speed=1.0, clock=time.monotonic, verbosity=1):
+        self.backend = backend
+        self.speed = speed
+        self.clock = clock
+        self.verbosity = verbosity
+        self.start_time = None
+        self.paused_total = 0.0    # 累计暂停时长
+        self.paused_at = None
+        self._resumed = None       # 未暂停时处于 set 状态
+        self._tasks = []
+        self._stopping = False
+
+    def log(self, message, level=1):
+        if self.verbosity >= level:
+            print(message)
+
+    @property
+    def paused(self):
+        return self.paused_at is not None
+
+    def pause(self):
+        """暂停所有轨道，正在等待的轨道到期后也不会发出操作"""
+        if self.paused_at is None:
+            self.paused_at = self.clock()
+            if self._resumed:
+                self._resumed.clear()
+            self.log("回放已暂停")
+
+    def resume(self):
+        """继续回放，时间线顺延暂停的时长"""
+        if self.paused_at is not None:
+            self.paused_total += self.clock() - self.paused_at
+            self.paused_at = None
+            if self._resumed:
+                self._resumed.set()
+            self.log("回放已继续")
+
+    def stop(self):
+        """取消所有正在回放的轨道，play 返回的报告中 stopped 为 True"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+
+    def deadline(self, timestamp):
+        return self.start_time + self.paused_total + timestamp / self.speed
+
+    async def wait_until(self, timestamp):
+        """等待到时间戳对应的时刻，返回触发时的延迟(秒)"""
+        while True:
+            if self.paused_at is not None:
+                await self._resumed.wait()
+                continue
+            remaining = self.deadline(timestamp) - self.clock()
+            if remaining <= 0:
+                return -remaining
+            await asyncio.sleep(remaining)
+
+    async def play_track(self, name, steps, metrics=None):
+        """回放一条轨道，返回该轨道的报告"""
+        handlers = backend_handlers(self.backend)
+        clock = self.clock
+        show_events = self.verbosity >= 2
+        lateness = []
+        event_count = 0
+        op_count = 0
+        step_errors = 0
+        completed = False
+        stopped = False
+        error = None
+
+        try:
+            for timestamp, event_type, ops, message in steps:
+                lateness.append(await self.wait_until(timestamp))
+
+                if metrics is not None:
+                    dispatched = clock()
+
+                try:
+                    for op, args in ops:
+                        handlers[op](*args)
+                except Exception as e:
+                    step_errors += 1
+                    self.log(f"[{name}] 无法回放事件 {message}: {e}")
+
+                if metrics is not None:
+                    metrics.record(event_type, self.deadline(timestamp), dispatched,
+                                   clock() - dispatched)
+
+                event_count += 1
+                op_count += len(ops)
+                if show_events:
+                    print(f"[{name}] {message}")
+            completed = True
+        except asyncio.CancelledError:
+            # 外层任务被取消时继续向上传递，由 stop() 取消时只结束本轨道
+            if not self._stopping:
+                raise
+            stopped = True
+        except Exception as e:
+            error = str(e)
+            self.log(f"[{name}] 回放过程中出错: {e}")
+
+        report = summarize_lateness(lateness)
+        report.update(events=event_count, ops=op_count, completed=completed, stopped=stopped,
+                      step_errors=step_errors, error=error)
+        return report
+
+    async def play_tracks(self, tracks, metrics=None, listen_for_stop=False, prelude=()):
+        """在同一起点并发回放多条轨道，tracks 为 {轨道名: 回放计划}，返回 {轨道名: 报告}
+
+        listen_for_stop 为 True 时通过后端监听停止键(ESC)。prelude 中的步骤在各轨道开始前
+        依次立即执行，轨道的时间线从它们执行完之后开始。
+        """
+        handlers = backend_handlers(self.backend)
+        for _, _, ops, message in prelude:
+            for op, args in ops:
+                handlers[op](*args)
+            self.log(message, 2)
+
+        loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._resumed = asyncio.Event()
+        if self.paused_at is None:
+            self._resumed.set()
+        listener = None
+        if listen_for_stop:
+            listener = self.backend.listen_for_stop(lambda: loop.call_soon_threadsafe(self.stop))
+
+        self.start_time = self.clock()
+        self.paused_total = 0.0
+        if self.paused_at is not None:
+            self.paused_at = self.start_time
+        names = list(tracks)
+        self._tasks = [asyncio.ensure_future(self.play_track(name, tracks[name], metrics))
+                       for name in names]
+        try:
+            reports = await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            raise
+        finally:
+            self._tasks = []
+            if listener:
+                listener.stop()
+
+        result = dict(zip(names, reports))
+        if any(report['stopped'] for report in reports):
+            self.log("\n回放已停止")
+        return result
+
+    async def play(self, steps, split=False, metrics=None, listen_for_stop=False):
+        """回放一个计划，split 为 True 时键盘与鼠标分为两条轨道并发回放"""
+        if split:
+            prelude, steps = split_prelude(steps)
+            return await self.play_tracks(split_tracks(steps), metrics, listen_for_stop, prelude)
+        return await self.play_tracks({'main': steps}, metrics, listen_for_stop)
+
+
+async def play_files(filenames, backend, speed=1.0, split=False, **options):
+    """并发回放多个录制文件，每个文件(及其键盘/鼠标轨道)各自独立的时间线"""
+    player = AsyncPlayer(backend, speed)
+    tracks = {}
+    for filename in filenames:
+        steps = load_plan(filename, backend, **options)
+        if split:
+            for name, track in split_tracks(steps).items():
+                tracks[f'{filename}:{name}'] = track
+        else:
+            tracks[filename] = steps
+    return await player.play_tracks(tracks, listen_for_stop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基于 asyncio 并发回放一个或多个录制文件')
+    parser.add_argument('recordings', nargs='+', help='录制文件')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度')
+    parser.add_argument('--split', action='store_true', help='键盘与鼠标分为独立轨道')
+    args = parser.parse_args()
+
+    from backends import PynputBackend
+
+    reports = asyncio.run(play_files(args.recordings, PynputBackend(), args.speed, args.split))
+    for name, report in reports.items():
+        status = '完成' if report['completed'] else '已停止' if report['stopped'] else '出错'
+        print(f"{name}: {status}, 事件 {report['events']}, "
+              f"时序偏差 P95 {report['p95_ms']:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
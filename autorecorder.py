@@ -1,9 +1,23 @@
-from pynput import mouse, keyboard
+try:
+    from pynput import mouse, keyboard
+except ImportError:  # 无显示环境(如无头 CI)下 pynput 无法加载，此时只能配合 FakeBackend 回放
+    mouse = keyboard = None
 from datetime import datetime
 import json
 import time
 import os
-import glob
+import math
+
+from backends import PynputBackend
+from binformat import EventStore, event_from_fields
+from catalog import RecordingCatalog, format_record
+from capture import (CaptureConsumer, RingBuffer, RAW_CLICK, RAW_MOVE, RAW_PRESS,
+                     RAW_RELEASE, RAW_SCROLL)
+from playplan import TimelineCompressor, backend_handlers, iter_plan, load_plan
+from recformat import RecordingWriter, load_events, stream_events
+from scheduler import DeadlineScheduler
+from screensync import DEFAULT_REGION_SIZE, CursorRegionWatcher, MssScreen
+from seekindex import seek_plan
 
 class InputRecorder:
     # 控制字符到可读键名的映射
@@ -19,14 +33,22 @@ class InputRecorder:
         '\x7f': 'Backspace'
     }
 
-    def __init__(self):
-        self.events = []
+    def __init__(self, backend=None, keep_events=False, verbosity=2, capture_capacity=65536,
+                 capture_hover=False, screen_source=None, sync_region=DEFAULT_REGION_SIZE):
+        self.events = EventStore()
+        self.keep_events = keep_events  # 是否同时在内存中保留事件(紧凑的列式存储)
+        self.verbosity = verbosity      # 控制台输出级别: 0 不输出, 1 只输出提示与汇总, 2 输出每个事件
+        self.capture_capacity = capture_capacity  # 监听线程与处理线程之间环形缓冲区的容量
+        self.capture_buffer = None
+        self.capture_consumer = None
+        self.writer = None
+        self.recording_file = None
         self.is_recording = False
         self.start_time = None
         self.mouse_listener = None
         self.keyboard_listener = None
-        self.controller = mouse.Controller()
-        self.key_controller = keyboard.Controller()
+        # 回放使用的输入后端，默认通过 pynput 控制真实的鼠标键盘
+        self.backend = backend if backend is not None else PynputBackend()
         self.modifier_keys = {
             'ctrl': False,
             'alt': False,
@@ -41,6 +63,22 @@ class InputRecorder:
         self.drag_button = None
         self.last_move_time = 0
         self.move_threshold = 5  # 移动阈值，避免微小移动被记录
+        self.min_safe_gap = 0.005  # 最大吞吐回放时每个事件之间的最小间隔(秒)
+
+        # 悬停轨迹录制(未按下按钮时的鼠标移动)，按速度、转向和时间自适应抽稀
+        self.capture_hover = capture_hover
+        self.hover_max_interval = 0.1     # 静止较久后再移动时立即记录
+        self.hover_reference_speed = 500  # 像素/秒，速度越快移动阈值按比例放大
+        self.hover_turn_threshold = 30    # 转向超过该角度(度)时记录拐点
+        self.hover_event_budget = 60      # 每秒最多记录的悬停事件数
+        self.reset_hover_state()
+
+        # 屏幕同步点: 指定屏幕源时，每次按下鼠标前记录点击位置周围区域的哈希，
+        # 回放时等到该区域与录制时一致就立即点击，而不是固定等待录制的间隔
+        self.screen_source = screen_source
+        self.sync_region = sync_region
+        self.region_watcher = None
+        self.sync_skipped = 0
 
     def get_key_name(self, key):
         """获取可读的键名，处理控制字符"""
@@ -80,12 +118,169 @@ class InputRecorder:
             return '+'.join(modifiers) + '+' + key_str
         return key_str
 
+    def record_event(self, fields):
+        """把事件交给后台写入线程，需要时同时保留在内存中
+
+        事件以 binformat.ColumnarEvents.iter_fields 形式的字段元组传递:
+        (时间戳, 类型, 动作, 按钮, 键值, 键名显示, 修饰键, x, y, a, b)，
+        只在写入线程序列化时才转换为事件字典，保留的事件直接追加到列式存储中。
+        """
+        if self.writer:
+            self.writer.write(fields)
+        if self.keep_events:
+            self.events.append_fields(fields)
+
+    def log(self, message, level=2):
+        """按输出级别打印信息: 0 不输出, 1 只输出提示与汇总, 2 输出每个事件"""
+        if self.verbosity >= level:
+            print(message)
+
+    # 以下 on_* 回调运行在 pynput 监听线程上，只把原始数据推入环形缓冲区，
+    # 格式化、拖拽检测与输出都由处理线程在 handle_raw_event 中完成
+
     def on_move(self, x, y):
         """处理鼠标移动事件"""
-        if not self.is_recording or not self.is_dragging:
+        if self.region_watcher is not None:
+            self.region_watcher.move(x, y)
+        if self.is_recording and (self.mouse_down or self.capture_hover):
+            self.capture_buffer.push((RAW_MOVE, time.time(), x, y))
+
+    def on_click(self, x, y, button, pressed):
+        if not self.is_recording:
+            return
+        self.mouse_down = pressed
+        self.capture_buffer.push((RAW_CLICK, time.time(), x, y, button, pressed))
+
+    def on_scroll(self, x, y, dx, dy):
+        if not self.is_recording:
+            return
+        self.capture_buffer.push((RAW_SCROLL, time.time(), x, y, dx, dy))
+
+    def on_press(self, key):
+        if not self.is_recording:
+            return
+
+        # 检查是否是停止录制的组合键 (Ctrl+ESC)，必须在监听线程上立即处理
+        if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
+            self.ctrl_down = True
+        elif key == keyboard.Key.esc and self.ctrl_down:
+            self.stop_recording()
+            return False
+
+        self.capture_buffer.push((RAW_PRESS, time.time(), key))
+
+    def on_release(self, key):
+        if not self.is_recording:
+            return
+
+        if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
+            self.ctrl_down = False
+
+        self.capture_buffer.push((RAW_RELEASE, time.time(), key))
+
+    # 同一次录制中最多逐条显示的处理错误数，其余只在结束时汇总
+    MAX_REPORTED_ERRORS = 10
+
+    def on_capture_error(self, error):
+        """处理线程中转换事件出错"""
+        errors = self.capture_consumer.errors
+        if errors <= self.MAX_REPORTED_ERRORS:
+            self.log(f"处理录制事件出错: {error}", 1)
+        if errors == self.MAX_REPORTED_ERRORS:
+            self.log("后续的处理错误不再逐条显示", 1)
+
+    def handle_raw_event(self, raw):
+        """处理线程: 把原始事件转换为录制事件"""
+        kind = raw[0]
+        if kind == RAW_MOVE:
+            self.process_move(*raw[1:])
+        elif kind == RAW_CLICK:
+            self.process_click(*raw[1:])
+        elif kind == RAW_SCROLL:
+            self.process_scroll(*raw[1:])
+        elif kind == RAW_PRESS:
+            self.process_key(raw[1], raw[2], True)
+        elif kind == RAW_RELEASE:
+            self.process_key(raw[1], raw[2], False)
+
+    def reset_hover_state(self):
+        """清空悬停轨迹的抽稀状态"""
+        self.hover_last_pos = None     # 最后记录的位置
+        self.hover_last_dir = None     # 最后记录的移动方向(单位向量)
+        self.hover_prev_sample = None  # 上一个原始采样 (时间, x, y)
+        self.hover_pending = None      # 因预算不足尚未记录的最新位置 (时间, x, y)
+        self.hover_window_start = 0
+        self.hover_window_count = 0
+
+    def process_hover(self, current_time, x, y):
+        """自适应抽稀未按下按钮时的鼠标移动
+
+        满足任一条件时记录: 距上次记录超过随速度放大的 move_threshold，
+        转向角超过 hover_turn_threshold，或距 last_move_time 超过 hover_max_interval。
+        每秒记录数不超过 hover_event_budget，超出时只保留最新位置等待补记。
+        """
+        prev = self.hover_prev_sample
+        self.hover_prev_sample = (current_time, x, y)
+
+        if self.hover_last_pos is None:
+            self.emit_hover(current_time, x, y, None)
+            return
+
+        dx = x - self.hover_last_pos[0]
+        dy = y - self.hover_last_pos[1]
+        distance = math.hypot(dx, dy)
+        if distance < 1:
             return
 
-        current_time = time.time()
+        # 速度越快，点之间的间距允许越大
+        speed = 0.0
+        if prev and current_time > prev[0]:
+            speed = math.hypot(x - prev[1], y - prev[2]) / (current_time - prev[0])
+        threshold = self.move_threshold * max(1.0, speed / self.hover_reference_speed)
+
+        direction = (dx / distance, dy / distance)
+        turned = False
+        if self.hover_last_dir and distance > self.move_threshold:
+            cos_angle = direction[0] * self.hover_last_dir[0] + direction[1] * self.hover_last_dir[1]
+            turned = cos_angle < math.cos(math.radians(self.hover_turn_threshold))
+
+        if (distance > threshold or turned or
+                current_time - self.last_move_time > self.hover_max_interval):
+            self.emit_hover(current_time, x, y, direction)
+
+    def emit_hover(self, current_time, x, y, direction, force=False):
+        """在每秒预算内记录一个悬停移动事件，force 为 True 时超出预算也记录(仍计入预算)"""
+        if current_time - self.hover_window_start >= 1.0:
+            self.hover_window_start = current_time
+            self.hover_window_count = 0
+        if self.hover_window_count >= self.hover_event_budget and not force:
+            self.hover_pending = (current_time, x, y)
+            return
+
+        self.hover_window_count += 1
+        self.hover_pending = None
+        self.hover_last_pos = (x, y)
+        if direction:
+            self.hover_last_dir = direction
+        self.last_move_time = current_time
+
+        modifiers = self.get_current_modifiers()
+        self.record_event((current_time - self.start_time, 'mouse_move', None, None, None, None,
+                           modifiers, x, y, 0, 0))
+        self.log(f"Mouse moved to ({x}, {y})")
+
+    def flush_hover(self):
+        """补记因预算不足而未记录的最后位置，保证点击等事件前光标位置正确"""
+        if self.hover_pending:
+            pending_time, x, y = self.hover_pending
+            self.emit_hover(pending_time, x, y, None, force=True)
+
+    def process_move(self, current_time, x, y):
+        """处理鼠标移动事件"""
+        if not self.is_dragging:
+            if self.capture_hover:
+                self.process_hover(current_time, x, y)
+            return
 
         # 检查是否达到移动阈值或时间间隔
         if self.drag_start_pos:
@@ -94,111 +289,94 @@ class InputRecorder:
             time_since_last = current_time - self.last_move_time
 
             if dx > self.move_threshold or dy > self.move_threshold or time_since_last > 0.1:
-                event = {
-                    'type': 'mouse_drag',
-                    'x': x,
-                    'y': y,
-                    'button': str(self.drag_button),
-                    'modifiers': self.get_current_modifiers(),
-                    'timestamp': current_time - self.start_time
-                }
-                self.events.append(event)
+                modifiers = self.get_current_modifiers()
+                self.record_event((current_time - self.start_time, 'mouse_drag', None,
+                                   str(self.drag_button), None, None, modifiers, x, y, 0, 0))
 
                 # 更新最后位置和时间
                 self.drag_start_pos = (x, y)
                 self.last_move_time = current_time
 
                 # 显示拖拽信息
-                mod_text = '+'.join(self.get_current_modifiers()) + '+' if self.get_current_modifiers() else ''
-                print(f"Mouse {mod_text}{self.drag_button} dragged to ({x}, {y})")
+                mod_text = '+'.join(modifiers) + '+' if modifiers else ''
+                self.log(f"Mouse {mod_text}{self.drag_button} dragged to ({x}, {y})")
 
-    def on_click(self, x, y, button, pressed):
-        if not self.is_recording:
-            return
+    def process_click(self, current_time, x, y, button, pressed):
+        """处理鼠标按下与释放事件"""
+        self.flush_hover()
+        modifiers = self.get_current_modifiers()
+        mod_text = '+'.join(modifiers) + '+' if modifiers else ''
+
+        if pressed and self.region_watcher is not None:
+            self.record_sync(current_time, x, y)
 
         # 更新拖拽状态
         if pressed:
             self.is_dragging = True
             self.drag_start_pos = (x, y)
             self.drag_button = button
-            self.last_move_time = time.time()
+            self.last_move_time = current_time
         else:
             # 如果之前是拖拽状态，记录拖拽结束
             if self.is_dragging and self.drag_start_pos:
                 end_pos = (x, y)
                 if end_pos != self.drag_start_pos:  # 如果位置有变化，记录拖拽结束
-                    event = {
-                        'type': 'mouse_drag_end',
-                        'start_x': self.drag_start_pos[0],
-                        'start_y': self.drag_start_pos[1],
-                        'end_x': end_pos[0],
-                        'end_y': end_pos[1],
-                        'button': str(button),
-                        'modifiers': self.get_current_modifiers(),
-                        'timestamp': time.time() - self.start_time
-                    }
-                    self.events.append(event)
+                    start_x, start_y = self.drag_start_pos
+                    self.record_event((current_time - self.start_time, 'mouse_drag_end', None,
+                                       str(button), None, None, modifiers,
+                                       start_x, start_y, end_pos[0], end_pos[1]))
 
                     # 显示拖拽结束信息
-                    mod_text = '+'.join(self.get_current_modifiers()) + '+' if self.get_current_modifiers() else ''
-                    print(f"Mouse {mod_text}{button} drag ended from {self.drag_start_pos} to {end_pos}")
+                    self.log(f"Mouse {mod_text}{button} drag ended from {self.drag_start_pos} to {end_pos}")
 
             self.is_dragging = False
             self.drag_start_pos = None
 
         # 记录点击事件
-        modifiers = self.get_current_modifiers()
-        event = {
-            'type': 'mouse',
-            'event': 'pressed' if pressed else 'released',
-            'button': str(button),
-            'x': x,
-            'y': y,
-            'modifiers': modifiers,
-            'timestamp': time.time() - self.start_time
-        }
-        self.events.append(event)
-
-        # 显示可读的鼠标事件
         action = 'pressed' if pressed else 'released'
-        mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-        print(f"Mouse {mod_text}{button} {action} at ({x}, {y})")
+        self.record_event((current_time - self.start_time, 'mouse', action, str(button), None, None,
+                           modifiers, x, y, 0, 0))
 
-    def on_scroll(self, x, y, dx, dy):
-        if not self.is_recording:
+        # 显示可读的鼠标事件
+        self.log(f"Mouse {mod_text}{button} {action} at ({x}, {y})")
+
+    def record_sync(self, current_time, x, y):
+        """记录点击位置周围屏幕区域在按下之前的哈希
+
+        处理线程处理到按下事件时画面往往已经变化，因此使用后台截图线程在按下之前
+        截取的区域；光标刚移动到该位置、还没有截图时不记录同步点。
+        """
+        region = self.region_watcher.region_before(x, y, current_time)
+        if region is None:
+            self.sync_skipped += 1
+            self.log(f"({x}, {y}) 按下之前没有可用的截图，跳过同步点")
             return
+        left, top, width, height, digest = region
 
+        # 保存点击位置而不是区域左上角，回放时先把光标移到这里再比较画面；区域哈希保存在键值字段
+        self.record_event((current_time - self.start_time, 'sync', None, None, digest, None, [],
+                           x, y, width, height))
+        self.log(f"Sync region ({left}, {top}) {width}x{height} at ({x}, {y})")
+
+    def process_scroll(self, current_time, x, y, dx, dy):
+        """处理鼠标滚轮事件"""
+        self.flush_hover()
         modifiers = self.get_current_modifiers()
 
-        event = {
-            'type': 'mouse_scroll',
-            'x': x,
-            'y': y,
-            'dx': dx,
-            'dy': dy,
-            'modifiers': modifiers,
-            'timestamp': time.time() - self.start_time
-        }
-        self.events.append(event)
+        self.record_event((current_time - self.start_time, 'mouse_scroll', None, None, None, None,
+                           modifiers, x, y, dx, dy))
 
         # 显示可读的滚轮事件
         mod_text = '+'.join(modifiers) + '+' if modifiers else ''
         direction = 'down' if dy < 0 else 'up'
-        print(f"Mouse {mod_text}scrolled {direction} at ({x}, {y})")
-
-    def on_press(self, key):
-        if not self.is_recording:
-            return
+        self.log(f"Mouse {mod_text}scrolled {direction} at ({x}, {y})")
 
+    def process_key(self, current_time, key, pressed):
+        """处理键盘按下与释放事件"""
         # 更新修饰键状态
-        self.update_modifier(key, True)
+        self.update_modifier(key, pressed)
 
-        # 检查是否是停止录制的组合键 (Ctrl+ESC)
-        if key == keyboard.Key.esc and self.modifier_keys['ctrl']:
-            self.stop_recording()
-            return False
-
-        # 忽略单独的修饰键按下事件（在on_release中处理）
+        # 忽略单独的修饰键按下与释放事件
         if key in [keyboard.Key.ctrl_l, keyboard.Key.ctrl_r,
                   keyboard.Key.alt_l, keyboard.Key.alt_r, keyboard.Key.alt_gr,
                   keyboard.Key.shift_l, keyboard.Key.shift_r,
@@ -210,66 +388,18 @@ class InputRecorder:
         except AttributeError:
             key_char = str(key)
 
-        modifiers = self.get_current_modifiers()
+        action = 'pressed' if pressed else 'released'
 
         # 记录原始键值和处理后的键名
-        event = {
-            'type': 'keyboard',
-            'event': 'pressed',
-            'key': key_char,
-            'key_display': self.format_key_event(key_char, 'pressed'),
-            'modifiers': modifiers,
-            'timestamp': time.time() - self.start_time
-        }
-        self.events.append(event)
+        key_display = self.format_key_event(key_char, action)
+        self.record_event((current_time - self.start_time, 'keyboard', action, None, key_char,
+                           key_display, self.get_current_modifiers(), 0, 0, 0, 0))
 
         # 显示可读的按键事件
-        print(f"Key {event['key_display']} pressed")
-
-    def on_release(self, key):
-        if not self.is_recording:
-            return
-
-        # 更新修饰键状态
-        self.update_modifier(key, False)
-
-        # 忽略单独的修饰键释放事件
-        if key in [keyboard.Key.ctrl_l, keyboard.Key.ctrl_r,
-                  keyboard.Key.alt_l, keyboard.Key.alt_r, keyboard.Key.alt_gr,
-                  keyboard.Key.shift_l, keyboard.Key.shift_r,
-                  keyboard.Key.cmd, keyboard.Key.cmd_r]:
-            return
-
-        try:
-            key_char = key.char
-        except AttributeError:
-            key_char = str(key)
-
-        modifiers = self.get_current_modifiers()
-
-        event = {
-            'type': 'keyboard',
-            'event': 'released',
-            'key': key_char,
-            'key_display': self.format_key_event(key_char, 'released'),
-            'modifiers': modifiers,
-            'timestamp': time.time() - self.start_time
-        }
-        self.events.append(event)
-
-        # 显示可读的释放事件
-        print(f"Key {event['key_display']} released")
+        self.log(f"Key {key_display} {action}")
 
     def start_recording(self):
-        self.events = []
-        self.is_recording = True
-        self.modifier_keys = {k: False for k in self.modifier_keys}
-        self.current_modifiers = set()
-        self.start_time = time.time()
-        self.is_dragging = False
-        self.drag_start_pos = None
-        self.drag_button = None
-        self.last_move_time = 0
+        self.begin_capture()
 
         self.mouse_listener = mouse.Listener(
             on_move=self.on_move,
@@ -284,11 +414,50 @@ class InputRecorder:
         )
         self.keyboard_listener.start()
 
-        print("\n=== 开始录制 ===")
-        print("操作完成后按 Ctrl+ESC 键停止录制")
+        self.log("\n=== 开始录制 ===", 1)
+        self.log("操作完成后按 Ctrl+ESC 键停止录制", 1)
 
         self.keyboard_listener.join()
 
+    def begin_capture(self, filename=None):
+        """重置录制状态并启动写入线程与处理线程，之后 on_* 回调即可接收事件
+
+        不启动 pynput 监听器，基准测试等场景可以直接调用 on_* 回调。
+        """
+        self.events = EventStore()
+        self.is_recording = True
+        self.modifier_keys = {k: False for k in self.modifier_keys}
+        self.current_modifiers = set()
+        self.start_time = time.time()
+        self.is_dragging = False
+        self.drag_start_pos = None
+        self.drag_button = None
+        self.last_move_time = 0
+        self.mouse_down = False
+        self.ctrl_down = False
+        self.reset_hover_state()
+
+        # 录制期间事件由后台线程持续写入文件，崩溃时也不会丢失整段录制
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"recording_{timestamp}.jsonl"
+        self.recording_file = filename
+        self.writer = RecordingWriter(self.recording_file, self.start_time,
+                                      convert=event_from_fields)
+        self.writer.start()
+
+        # 监听回调只写入环形缓冲区，由处理线程完成事件转换
+        self.capture_buffer = RingBuffer(self.capture_capacity)
+        self.capture_consumer = CaptureConsumer(self.capture_buffer, self.handle_raw_event,
+                                                on_error=self.on_capture_error)
+        self.capture_consumer.start()
+
+        # 屏幕同步点需要按下之前的画面，由后台线程持续截取光标周围的区域
+        self.sync_skipped = 0
+        if self.screen_source is not None:
+            self.region_watcher = CursorRegionWatcher(self.screen_source, self.sync_region)
+            self.region_watcher.start()
+
     def stop_recording(self):
         if not self.is_recording:
             return
@@ -299,198 +468,217 @@ class InputRecorder:
         if self.keyboard_listener:
             self.keyboard_listener.stop()
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.recording_file = f"recording_{timestamp}.json"
+        event_count = self.end_capture()
 
-        with open(self.recording_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'start_time': self.start_time,
-                'events': self.events
-            }, f, indent=2, ensure_ascii=False)
-
-        print(f"\n录制已保存到: {self.recording_file}")
-        print(f"总录制事件数: {len(self.events)}")
+        self.log(f"\n录制已保存到: {self.recording_file}", 1)
+        self.log(f"总录制事件数: {event_count}", 1)
+        if self.capture_buffer.dropped:
+            self.log(f"缓冲区已满，丢弃事件数: {self.capture_buffer.dropped}", 1)
+        if self.capture_consumer.errors:
+            self.log(f"处理出错的事件数: {self.capture_consumer.errors}", 1)
+        if self.sync_skipped:
+            self.log(f"点击前没有可用截图，跳过的同步点: {self.sync_skipped}", 1)
         return self.recording_file
 
-    def load_recording(self, filename):
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data['events']
+    def end_capture(self):
+        """处理完缓冲区中剩余的原始事件并结束写入，返回事件总数"""
+        self.is_recording = False
+        self.capture_consumer.stop()
+        # 录制结束前的最后一个光标位置
+        self.flush_hover()
+        if self.region_watcher is not None:
+            self.region_watcher.stop()
+            self.region_watcher = None
+        try:
+            event_count = self.writer.close()
+        except Exception as e:
+            event_count = self.writer.event_count
+            self.log(f"写入录制文件出错: {e}，只保存了前 {event_count} 个事件", 1)
+        self.writer = None
+        return event_count
 
-    def play_events(self, events, speed=1.0):
-        print("\n=== 开始回放 ===")
-        print("按 ESC 键可随时停止回放")
+    def load_recording(self, filename):
+        return load_events(filename)
+
+    def stream_recording(self, filename, readahead=4096):
+        """流式读取录制文件，交给 play_events 后无需等待整个文件解析完即可开始回放"""
+        return stream_events(filename, readahead)
+
+    def load_plan(self, filename, **options):
+        """读取录制文件并编译为回放计划，重复回放同一文件时直接使用缓存
+
+        options 可为 coalesce_modifiers / batch_typing，见 playplan.iter_plan。
+        """
+        return load_plan(filename, self.backend, **options)
+
+    def seek_plan(self, filename, start_time=None, start_event=None, **options):
+        """从指定时间(秒)或事件序号开始的回放计划，跳过部分按住的键与按钮会先恢复
+
+        定位索引保存在录制文件旁边(.idx)，大文件也不需要从头扫描。
+        """
+        return seek_plan(filename, self.backend, start_time, start_event, **options)
+
+    def play_events(self, events, speed=1.0, idle_threshold=None, max_idle=0.5,
+                    max_throughput=False, metrics=None, sync=None, governor=None, **options):
+        """编译录制事件并回放，events 可以是列表或任意可迭代对象(如 stream_recording 的结果)"""
+        return self.play_plan(iter_plan(events, self.backend, **options), speed,
+                              idle_threshold, max_idle, max_throughput, metrics, sync, governor)
+
+    def play_plan(self, steps, speed=1.0, idle_threshold=None, max_idle=0.5,
+                  max_throughput=False, metrics=None, sync=None, governor=None):
+        """按计划回放，每一步的按钮、键对象与触发时间都已预先算好
+
+        idle_threshold 不为 None 时，超过该值的空闲间隔被缩短为 max_idle(录制时间，秒)；
+        max_throughput 为 True 时忽略录制节奏和 speed，每步之间只保留 min_safe_gap。
+        metrics 为 PlaybackMetrics 时记录每个事件的计划时间、实际时间与控制器调用耗时。
+        sync 为 ScreenSync 时，遇到屏幕同步点先把光标移到点击位置，等待区域内容与录制时
+        一致后立即继续，之后的事件以此为新的时间起点；sync 为 None 时忽略同步点。
+        governor 为 RateGovernor 时按设备限制每秒发出的输入事件数，反馈模式下根据
+        控制器调用耗时自动降速，避免高倍速回放时系统输入队列溢出而丢失事件。
+        """
+        self.log("\n=== 开始回放 ===", 1)
+        self.log("按 ESC 键可随时停止回放", 1)
+
+        compressor = None
+        if max_throughput:
+            compressor = TimelineCompressor(min_gap=self.min_safe_gap)
+            speed = 1.0
+        elif idle_threshold is not None:
+            compressor = TimelineCompressor(idle_threshold, max_idle)
+        if compressor:
+            steps = compressor.apply(steps)
 
         self.stop_playback = False
+        backend = self.backend
+        handlers = backend_handlers(backend)
+        show_events = self.verbosity >= 2
 
-        def on_press(key):
-            if key == keyboard.Key.esc:
-                self.stop_playback = True
-                return False
+        def on_stop():
+            self.stop_playback = True
 
         # Start a listener for the ESC key
-        listener = keyboard.Listener(on_press=on_press)
-        listener.start()
+        listener = backend.listen_for_stop(on_stop)
+
+        # 每个事件都对齐到 start + timestamp / speed 的绝对时刻，避免误差累积
+        scheduler = DeadlineScheduler(speed)
+        should_stop = lambda: self.stop_playback
+        clock = scheduler.clock
+        event_count = 0
+        op_count = 0
+        step_errors = 0
+        completed = False
+        error = None
+        sync_warnings = []
 
         try:
-            start_time = time.time()
-            last_timestamp = 0
+            scheduler.start()
+
+            for timestamp, event_type, ops, message in steps:
+                if event_type == 'sync':
+                    if sync is not None:
+                        # 先执行移动光标等操作，最后一个操作为同步点
+                        for op, args in ops[:-1]:
+                            handlers[op](*args)
+                        matched = sync.wait_at(*ops[-1][1], should_stop)
+                        if matched is None:
+                            self.log("\n回放已停止", 1)
+                            break
+                        if not matched:
+                            warning = (f"警告: 录制时间 {timestamp:.3f}s 的屏幕同步点在 "
+                                       f"{sync.timeout:.1f} 秒内没有匹配，已继续回放")
+                            sync_warnings.append(warning)
+                            self.log(warning, 1)
+                        scheduler.rebase(timestamp)
+                    continue
+
+                if self.stop_playback or scheduler.wait(timestamp, should_stop) is None:
+                    self.log("\n回放已停止", 1)
+                    break
 
-            for i, event in enumerate(events):
-                if self.stop_playback:
-                    print("\n回放已停止")
+                if governor is not None and governor.throttle(ops, should_stop) is None:
+                    self.log("\n回放已停止", 1)
                     break
 
-                # Calculate delay based on timestamps
-                current_timestamp = event['timestamp']
-                delay = (current_timestamp - last_timestamp) / speed
-                if delay > 0:
-                    time.sleep(delay)
-                last_timestamp = current_timestamp
-
-                # 处理修饰键
-                modifiers = event.get('modifiers', [])
-
-                if event['type'] == 'mouse':
-                    x, y = event['x'], event['y']
-                    button = event['button']
-
-                    # Move mouse to position
-                    self.controller.position = (x, y)
-
-                    # Convert string back to Button
-                    button_map = {
-                        "Button.left": mouse.Button.left,
-                        "Button.right": mouse.Button.right,
-                        "Button.middle": mouse.Button.middle
-                    }
-
-                    if event['event'] == 'pressed':
-                        self.controller.press(button_map.get(button, mouse.Button.left))
-                        mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-                        print(f"Mouse {mod_text}{button} pressed at ({x}, {y})")
-                    else:
-                        self.controller.release(button_map.get(button, mouse.Button.left))
-                        mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-                        print(f"Mouse {mod_text}{button} released at ({x}, {y})")
-
-                elif event['type'] == 'mouse_drag':
-                    x, y = event['x'], event['y']
-                    button = event['button']
-
-                    # 移动鼠标到新位置
-                    self.controller.position = (x, y)
-
-                    # 显示拖拽信息
-                    mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-                    print(f"Mouse {mod_text}{button} dragged to ({x}, {y})")
-
-                elif event['type'] == 'mouse_drag_end':
-                    start_x, start_y = event['start_x'], event['start_y']
-                    end_x, end_y = event['end_x'], event['end_y']
-                    button = event['button']
-
-                    # 移动鼠标到结束位置
-                    self.controller.position = (end_x, end_y)
+                timed = metrics is not None or governor is not None
+                if timed:
+                    dispatched = clock()
 
-                    # 显示拖拽结束信息
-                    mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-                    print(f"Mouse {mod_text}{button} drag ended from ({start_x}, {start_y}) to ({end_x}, {end_y})")
-
-                elif event['type'] == 'mouse_scroll':
-                    x, y = event['x'], event['y']
-                    dx, dy = event['dx'], event['dy']
-
-                    # Move mouse to position and scroll
-                    self.controller.position = (x, y)
-                    self.controller.scroll(dx, dy)
-                    mod_text = '+'.join(modifiers) + '+' if modifiers else ''
-                    direction = 'down' if dy < 0 else 'up'
-                    print(f"Mouse {mod_text}scrolled {direction} at ({x}, {y})")
-
-                elif event['type'] == 'keyboard':
-                    key = event['key']
-                    key_display = event.get('key_display', str(key))
-
-                    # 处理特殊键
-                    key_obj = None
-                    if key.startswith('Key.'):
-                        key_name = key.split('.')[1]
-                        key_obj = getattr(keyboard.Key, key_name, None)
-
-                    # 处理组合键
-                    if event['event'] == 'pressed':
-                        try:
-                            # 先按下修饰键
-                            for mod in modifiers:
-                                if mod == 'ctrl':
-                                    self.key_controller.press(keyboard.Key.ctrl)
-                                elif mod == 'alt':
-                                    self.key_controller.press(keyboard.Key.alt)
-                                elif mod == 'shift':
-                                    self.key_controller.press(keyboard.Key.shift)
-                                elif mod == 'cmd':
-                                    self.key_controller.press(keyboard.Key.cmd)
-
-                            # 按下主键
-                            if key_obj:
-                                self.key_controller.press(key_obj)
-                            else:
-                                # 处理控制字符
-                                if key in self.CONTROL_CHAR_MAP:
-                                    # 对于控制字符，直接发送原始键值
-                                    self.key_controller.press(key)
-                                else:
-                                    self.key_controller.press(key)
-
-                            print(f"Key pressed: {key_display}")
-
-                        except Exception as e:
-                            print(f"无法模拟按键 {key_display}: {e}")
-                    else:  # released
-                        try:
-                            # 释放主键
-                            if key_obj:
-                                self.key_controller.release(key_obj)
-                            else:
-                                # 处理控制字符
-                                if key in self.CONTROL_CHAR_MAP:
-                                    self.key_controller.release(key)
-                                else:
-                                    self.key_controller.release(key)
-
-                            # 释放修饰键
-                            for mod in modifiers:
-                                if mod == 'ctrl':
-                                    self.key_controller.release(keyboard.Key.ctrl)
-                                elif mod == 'alt':
-                                    self.key_controller.release(keyboard.Key.alt)
-                                elif mod == 'shift':
-                                    self.key_controller.release(keyboard.Key.shift)
-                                elif mod == 'cmd':
-                                    self.key_controller.release(keyboard.Key.cmd)
-
-                            print(f"Key released: {key_display}")
-
-                        except Exception as e:
-                            print(f"无法释放按键 {key_display}: {e}")
-
-            print(f"\n回放完成! 总事件数: {len(events)}")
+                try:
+                    for op, args in ops:
+                        handlers[op](*args)
+                except Exception as e:
+                    step_errors += 1
+                    self.log(f"无法回放事件 {message}: {e}", 1)
+
+                if timed:
+                    call_duration = clock() - dispatched
+                    if metrics is not None:
+                        metrics.record(event_type, scheduler.deadline(timestamp), dispatched,
+                                       call_duration)
+                    if governor is not None:
+                        governor.observe(len(ops), call_duration)
+
+                event_count += 1
+                op_count += len(ops)
+                if show_events:
+                    print(message)
+            else:
+                completed = True
+                self.log(f"\n回放完成! 总事件数: {event_count}", 1)
 
         except Exception as e:
-            print(f"回放过程中出错: {e}")
+            error = str(e)
+            self.log(f"回放过程中出错: {e}", 1)
         finally:
-            listener.stop()
+            if listener:
+                listener.stop()
+
+        # 输出回放时序精度
+        report = scheduler.summary()
+        report.update(events=event_count, ops=op_count, completed=completed,
+                      step_errors=step_errors, error=error)
+        if sync is not None:
+            report.update(sync_matched=sync.matched, sync_timeouts=sync.timeouts,
+                          sync_wait=sync.waited, warnings=sync_warnings)
+            if sync.timeouts:
+                self.log(f"屏幕同步点超时 {sync.timeouts} 次", 1)
+        if governor is not None:
+            rate = report['rate'] = governor.summary()
+            throughput = ', '.join(f"{device} {value:.0f}/s"
+                                   for device, value in rate['throughput'].items())
+            self.log(f"限速: 吞吐量 {throughput}, 被延迟 {rate['delayed']} 步 "
+                     f"(共 {rate['delay_total']:.2f}s), 丢弃 {rate['dropped']}", 1)
+            if rate['backoffs']:
+                self.log(f"输入队列饱和，降速 {rate['backoffs']} 次，"
+                         f"最终速率为设定值的 {rate['scale']:.0%}", 1)
+        if report['count']:
+            self.log(f"时序偏差: 平均 {report['mean_ms']:.2f}ms, "
+                     f"P95 {report['p95_ms']:.2f}ms, 最大 {report['max_ms']:.2f}ms", 1)
+
+        # 相对原时间线节省的实际时间
+        report['time_saved'] = compressor.saved / speed if compressor else 0.0
+        if compressor:
+            self.log(f"压缩空闲间隔共节省 {report['time_saved']:.2f} 秒", 1)
+        return report
 
 def list_recordings():
-    files = glob.glob("recording_*.json")
+    # 通过目录数据库显示时长和事件数，只有新增或修改过的文件才需要重新读取
+    with RecordingCatalog() as catalog:
+        catalog.refresh('.')
+        records = catalog.query(sort='path')
+    # 损坏的文件只提示，不能选择回放
+    for record in records:
+        if record['error']:
+            print(f"跳过 {format_record(record)}")
+    records = [record for record in records if not record['error']]
+    files = [record['path'] for record in records]
     if not files:
         print("没有找到任何录制文件")
         return None
 
     print("\n可用的录制文件:")
-    for i, file in enumerate(files, 1):
-        print(f"{i}. {file}")
+    for i, record in enumerate(records, 1):
+        print(f"{i}. {format_record(record)}")
 
     while True:
         try:
@@ -516,6 +704,17 @@ def main():
         choice = input("\n请选择操作 (1-3): ")
 
         if choice == '1':
+            hover = input("\n是否同时录制鼠标悬停轨迹? (y/N): ")
+            recorder.capture_hover = hover.strip().lower() == 'y'
+
+            sync = input("是否在点击前记录屏幕同步点? (y/N): ")
+            recorder.screen_source = None
+            if sync.strip().lower() == 'y':
+                try:
+                    recorder.screen_source = MssScreen()
+                except ImportError:
+                    print("需要安装 mss 才能记录屏幕同步点，本次录制不记录")
+
             print("\n3秒后开始录制...")
             print("请切换到目标窗口")
             print("提示: 按 Ctrl+ESC 停止录制")
@@ -539,8 +738,8 @@ def main():
                 print("请切换到目标窗口")
                 print("提示: 按 ESC 键可随时停止回放")
                 time.sleep(3)
-                events = recorder.load_recording(filename)
-                recorder.play_events(events, speed)
+                plan = recorder.load_plan(filename)
+                recorder.play_plan(plan, speed)
 
         elif choice == '3':
             print("\n感谢使用，再见!")
@@ -0,0 +1,169 @@
+import time
+
+
+class InputBackend:
+    """输入后端接口
+
+    回放时的所有鼠标、键盘操作都通过后端发出，录制文件中的按钮名、键名
+    由 resolve_* 方法转换成后端自己的对象。
+    """
+
+    name = 'base'
+
+    def set_position(self, x, y):
+        """移动鼠标到指定位置"""
+        raise NotImplementedError
+
+    def press(self, button):
+        """按下鼠标按钮"""
+        raise NotImplementedError
+
+    def release(self, button):
+        """释放鼠标按钮"""
+        raise NotImplementedError
+
+    def scroll(self, dx, dy):
+        """滚动鼠标滚轮"""
+        raise NotImplementedError
+
+    def press_key(self, key):
+        """按下键盘按键"""
+        raise NotImplementedError
+
+    def release_key(self, key):
+        """释放键盘按键"""
+        raise NotImplementedError
+
+    def type_text(self, text):
+        """连续输入一段普通字符"""
+        for char in text:
+            self.press_key(char)
+            self.release_key(char)
+
+    def resolve_button(self, name):
+        """把录制的按钮名 (如 'Button.left') 转换为后端按钮对象"""
+        return name
+
+    def resolve_key(self, key):
+        """把录制的键值 (字符或 'Key.xxx') 转换为后端按键对象"""
+        return key
+
+    def resolve_modifier(self, name):
+        """把修饰键名 (ctrl/alt/shift/cmd) 转换为后端按键对象"""
+        return name
+
+    def listen_for_stop(self, callback):
+        """监听停止回放的按键，返回带 stop() 方法的监听器，不支持时返回 None"""
+        return None
+
+
+class PynputBackend(InputBackend):
+    """基于 pynput 控制器的真实输入后端"""
+
+    name = 'pynput'
+
+    def __init__(self):
+        from pynput import mouse, keyboard
+
+        self._keyboard = keyboard
+        self.controller = mouse.Controller()
+        self.key_controller = keyboard.Controller()
+        self.button_map = {
+            "Button.left": mouse.Button.left,
+            "Button.right": mouse.Button.right,
+            "Button.middle": mouse.Button.middle
+        }
+        self.default_button = mouse.Button.left
+        self.modifier_map = {
+            'ctrl': keyboard.Key.ctrl,
+            'alt': keyboard.Key.alt,
+            'shift': keyboard.Key.shift,
+            'cmd': keyboard.Key.cmd
+        }
+
+    def set_position(self, x, y):
+        self.controller.position = (x, y)
+
+    def press(self, button):
+        self.controller.press(button)
+
+    def release(self, button):
+        self.controller.release(button)
+
+    def scroll(self, dx, dy):
+        self.controller.scroll(dx, dy)
+
+    def press_key(self, key):
+        self.key_controller.press(key)
+
+    def release_key(self, key):
+        self.key_controller.release(key)
+
+    def type_text(self, text):
+        self.key_controller.type(text)
+
+    def resolve_button(self, name):
+        return self.button_map.get(name, self.default_button)
+
+    def resolve_key(self, key):
+        # 特殊键以 'Key.xxx' 形式保存，普通字符和控制字符直接发送原始键值
+        if key.startswith('Key.'):
+            key_obj = getattr(self._keyboard.Key, key.split('.')[1], None)
+            if key_obj:
+                return key_obj
+        return key
+
+    def resolve_modifier(self, name):
+        return self.modifier_map.get(name)
+
+    def listen_for_stop(self, callback):
+        esc = self._keyboard.Key.esc
+
+        def on_press(key):
+            if key == esc:
+                callback()
+                return False
+
+        listener = self._keyboard.Listener(on_press=on_press)
+        listener.start()
+        return listener
+
+
+class FakeBackend(InputBackend):
+    """内存中的假后端，只记录发出的调用，用于无显示环境下的测试与基准
+
+    每次调用以 (时间, 操作名, 参数...) 元组追加到 calls 中，不做任何其它工作。
+    """
+
+    name = 'fake'
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.calls = []
+        self.position = (0, 0)
+
+    def set_position(self, x, y):
+        self.position = (x, y)
+        self.calls.append((self.clock(), 'position', x, y))
+
+    def press(self, button):
+        self.calls.append((self.clock(), 'press', button))
+
+    def release(self, button):
+        self.calls.append((self.clock(), 'release', button))
+
+    def scroll(self, dx, dy):
+        self.calls.append((self.clock(), 'scroll', dx, dy))
+
+    def press_key(self, key):
+        self.calls.append((self.clock(), 'press_key', key))
+
+    def release_key(self, key):
+        self.calls.append((self.clock(), 'release_key', key))
+
+    def type_text(self, text):
+        self.calls.append((self.clock(), 'type_text', text))
+
+    def clear(self):
+        """清空已记录的调用"""
+        self.calls = []
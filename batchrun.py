@@ -0,0 +1,299 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import select
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# 工作进程绑定的 X 显示，由 init_worker 设置
+_worker_display = None
+
+
+def init_worker(displays, pids):
+    """工作进程初始化: 领取一个独占的 X 显示，并登记进程号以便卡死时终止
+
+    必须在导入 pynput 之前设置 DISPLAY，因此 autorecorder 只在 run_job 中导入。
+    """
+    global _worker_display
+    pids.put(os.getpid())
+    _worker_display = displays.get()
+    if _worker_display:
+        os.environ['DISPLAY'] = _worker_display
+
+
+def run_job(filename, run, speed, timeout, play_options, plan_options):
+    """在工作进程中回放一个录制文件，返回结果字典"""
+    result = {
+        'file': filename,
+        'run': run,
+        'display': _worker_display,
+        'pid': os.getpid(),
+        'status': 'error',
+        'error': None,
+        'duration': 0.0,
+    }
+    started = time.perf_counter()
+
+    try:
+        from autorecorder import InputRecorder
+
+        recorder = InputRecorder(verbosity=0)
+        plan = recorder.load_plan(filename, **plan_options)
+
+        # 超时后通过 stop_playback 让回放在下一次等待时退出
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            recorder.stop_playback = True
+
+        timer = threading.Timer(timeout, on_timeout) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        try:
+            report = recorder.play_plan(plan, speed, **play_options)
+        finally:
+            if timer:
+                timer.cancel()
+
+        result.update(report=report)
+        if timed_out.is_set():
+            result['status'] = 'timeout'
+        elif report['error'] or report['step_errors']:
+            result['status'] = 'failed'
+            result['error'] = report['error'] or f"{report['step_errors']} 个事件回放失败"
+        elif report['completed']:
+            result['status'] = 'ok'
+        else:
+            result['status'] = 'stopped'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    result['duration'] = time.perf_counter() - started
+    return result
+
+
+def start_xvfb(display_numbers, screen):
+    """为每个工作进程启动一个 Xvfb，返回 (显示名列表, 进程列表)"""
+    if not shutil.which('Xvfb'):
+        raise RuntimeError("没有找到 Xvfb，请先安装或通过 --displays 指定已有的显示")
+
+    processes = []
+    displays = []
+    ready_fds = []
+    for number in display_numbers:
+        # Xvfb 开始接受连接后才把显示号写入 -displayfd 指定的管道
+        read_fd, write_fd = os.pipe()
+        process = subprocess.Popen(
+            ['Xvfb', f':{number}', '-screen', '0', screen, '-nolisten', 'tcp',
+             '-displayfd', str(write_fd)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, pass_fds=(write_fd,))
+        os.close(write_fd)
+        processes.append(process)
+        displays.append(f':{number}')
+        ready_fds.append(read_fd)
+
+    # 不能只看 socket 文件: 残留的 socket 或其它进程占用同一显示号时文件也存在
+    deadline = time.monotonic() + 10
+    try:
+        for number, process, read_fd in zip(display_numbers, processes, ready_fds):
+            ready = wait_displayfd(read_fd, deadline)
+            if ready is None:
+                stop_xvfb(processes)
+                raise RuntimeError(f"等待 Xvfb :{number} 超时")
+            if not ready or process.poll() is not None:
+                stop_xvfb(processes)
+                raise RuntimeError(f"Xvfb :{number} 启动失败")
+    finally:
+        for read_fd in ready_fds:
+            os.close(read_fd)
+
+    return displays, processes
+
+
+def wait_displayfd(read_fd, deadline):
+    """读取 Xvfb 写入的显示号，返回 True；进程先退出时返回 False，超时返回 None"""
+    data = b''
+    while not data.endswith(b'\n'):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        ready, _, _ = select.select([read_fd], [], [], remaining)
+        if ready:
+            chunk = os.read(read_fd, 64)
+            if not chunk:
+                return False
+            data += chunk
+    return True
+
+
+def stop_xvfb(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def expand_recordings(patterns):
+    """展开文件名与通配符，保持顺序并去重"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if match not in files:
+                files.append(match)
+    return files
+
+
+def terminate_workers(pids):
+    """终止所有登记过的工作进程"""
+    while True:
+        try:
+            pid = pids.get(timeout=0.1)
+        except queue.Empty:
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def run_batch(files, displays, repeat=1, speed=1.0, timeout=None, play_options=None,
+              plan_options=None, hang_grace=30):
+    """在进程池中并行回放所有录制，每个工作进程独占 displays 中的一个显示
+
+    返回汇总报告字典。
+    """
+    play_options = play_options or {}
+    plan_options = plan_options or {}
+    context = multiprocessing.get_context('spawn')
+    display_queue = context.Queue()
+    for display in displays:
+        display_queue.put(display)
+    pid_queue = context.Queue()
+
+    jobs = [(filename, run) for filename in files for run in range(1, repeat + 1)]
+    results = []
+    started = time.time()
+    hung = False
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=len(displays), mp_context=context,
+        initializer=init_worker, initargs=(display_queue, pid_queue))
+    try:
+        futures = {
+            executor.submit(run_job, filename, run, speed, timeout, play_options, plan_options):
+                (filename, run)
+            for filename, run in jobs
+        }
+        # 单个任务的硬超时只能用于判断工作进程是否卡死，无法中断它
+        wait_limit = None if timeout is None else timeout * len(jobs) + hang_grace
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=wait_limit):
+                filename, run = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'file': filename, 'run': run, 'status': 'error',
+                              'error': f"{type(e).__name__}: {e}", 'duration': 0.0}
+                results.append(result)
+                print(f"[{result['status']}] {filename} #{run} ({result['duration']:.1f}s)"
+                      + (f": {result['error']}" if result.get('error') else ''))
+        except concurrent.futures.TimeoutError:
+            hung = True
+            for future, (filename, run) in futures.items():
+                if not future.done():
+                    results.append({'file': filename, 'run': run, 'status': 'hung',
+                                    'error': '工作进程无响应', 'duration': 0.0})
+    finally:
+        if hung:
+            # 卡死的工作进程仍在向显示注入输入，shutdown 不会中断它们，必须直接终止
+            terminate_workers(pid_queue)
+        executor.shutdown(wait=not hung, cancel_futures=True)
+
+    results.sort(key=lambda r: (files.index(r['file']), r['run']))
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+
+    return {
+        'started': started,
+        'wall_time': time.time() - started,
+        'workers': len(displays),
+        'displays': list(displays),
+        'total_runs': len(jobs),
+        'statuses': statuses,
+        'passed': statuses.get('ok', 0),
+        'failed': len(jobs) - statuses.get('ok', 0),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在多个独立显示上并行批量回放录制文件')
+    parser.add_argument('recordings', nargs='+', help='录制文件或通配符，如 "recordings/*.json"')
+    parser.add_argument('--repeat', type=int, default=1, help='每个录制的回放次数')
+    parser.add_argument('--timeout', type=float, help='单次回放的超时时间(秒)')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度')
+    parser.add_argument('--workers', type=int,
+                        help='并行的工作进程数，默认使用 --xvfb 时为 CPU 数，否则为 1')
+    parser.add_argument('--xvfb', action='store_true', help='为每个工作进程启动独立的 Xvfb')
+    parser.add_argument('--display-base', type=int, default=100, help='Xvfb 显示编号起点')
+    parser.add_argument('--screen', default='1920x1080x24', help='Xvfb 屏幕参数')
+    parser.add_argument('--displays', help='使用已有的显示，逗号分隔，如 ":1,:2"')
+    parser.add_argument('--idle-threshold', type=float, help='压缩超过该秒数的空闲间隔')
+    parser.add_argument('--max-throughput', action='store_true', help='以最小安全间隔尽快回放')
+    parser.add_argument('--report', default='batch_report.json', help='汇总报告文件')
+    args = parser.parse_args()
+
+    files = expand_recordings(args.recordings)
+    if not files:
+        print("没有找到任何录制文件")
+        return 1
+
+    processes = []
+    if args.displays:
+        displays = args.displays.split(',')
+    elif args.xvfb:
+        workers = args.workers or os.cpu_count()
+        numbers = range(args.display_base, args.display_base + workers)
+        displays, processes = start_xvfb(numbers, args.screen)
+    else:
+        # 没有独立显示时只能在当前显示上串行回放，多个进程同时注入输入会互相干扰
+        if args.workers and args.workers > 1:
+            print("多个工作进程需要独立的显示，请使用 --xvfb 或 --displays")
+            return 2
+        displays = [os.environ.get('DISPLAY')]
+
+    play_options = {'max_throughput': args.max_throughput}
+    if args.idle_threshold is not None:
+        play_options['idle_threshold'] = args.idle_threshold
+
+    try:
+        report = run_batch(files, displays, args.repeat, args.speed, args.timeout, play_options)
+    finally:
+        stop_xvfb(processes)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n共 {report['total_runs']} 次回放, 成功 {report['passed']}, 失败 {report['failed']}, "
+          f"耗时 {report['wall_time']:.1f}s")
+    print(f"报告已保存到: {args.report}")
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
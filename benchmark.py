@@ -0,0 +1,240 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from autorecorder import InputRecorder, keyboard
+from backends import FakeBackend
+from playplan import compile_plan
+from recformat import load_events, save_recording, stream_events
+from synthgen import generate_events
+
+RESULTS_FILE = 'benchmark_results.json'
+
+FORMATS = ('json', 'jsonl', 'arb')
+
+
+def measure(func, repeat):
+    """运行 repeat 次，返回最短耗时(秒)和最后一次的返回值"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def to_callbacks(events):
+    """把录制事件还原为监听回调调用 (方法名, 参数)
+
+    mouse_drag_end 由处理线程生成，没有对应的回调；没有 pynput 时跳过键盘事件。
+    """
+    calls = []
+    for event in events:
+        event_type = event['type']
+        if event_type == 'mouse':
+            calls.append(('on_click', (event['x'], event['y'], event['button'],
+                                       event['event'] == 'pressed')))
+        elif event_type in ('mouse_drag', 'mouse_move'):
+            calls.append(('on_move', (event['x'], event['y'])))
+        elif event_type == 'mouse_scroll':
+            calls.append(('on_scroll', (event['x'], event['y'], event['dx'], event['dy'])))
+        elif event_type == 'keyboard' and keyboard is not None:
+            key = event['key']
+            if key.startswith('Key.'):
+                key = getattr(keyboard.Key, key[4:])
+            else:
+                key = keyboard.KeyCode.from_char(key)
+            method = 'on_press' if event['event'] == 'pressed' else 'on_release'
+            calls.append((method, (key,)))
+    return calls
+
+
+def bench_capture(events, directory, repeat):
+    """录制回调吞吐: 回调只写入环形缓冲区的耗时，以及处理线程写完文件的总耗时"""
+    calls = to_callbacks(events)
+    filename = os.path.join(directory, 'capture.jsonl')
+    callback_times = []
+    total_times = []
+    recorded = 0
+
+    for _ in range(repeat):
+        recorder = InputRecorder(backend=FakeBackend(), verbosity=0,
+                                 capture_capacity=len(calls) + 1)
+        bound = [(getattr(recorder, name), args) for name, args in calls]
+        gc.collect()
+        started = time.perf_counter()
+        recorder.begin_capture(filename)
+        pushed = time.perf_counter()
+        for method, args in bound:
+            method(*args)
+        callback_times.append(time.perf_counter() - pushed)
+        recorded = recorder.end_capture()
+        total_times.append(time.perf_counter() - started)
+
+    return {
+        'callbacks': len(calls),
+        'recorded': recorded,
+        'callback_seconds': min(callback_times),
+        'callback_rate': len(calls) / min(callback_times),
+        'seconds': min(total_times),
+        'rate': len(calls) / min(total_times),
+    }
+
+
+def bench_replay(events, repeat):
+    """无头回放吞吐: FakeBackend + 最大吞吐模式，最小间隔为 0"""
+    backend = FakeBackend()
+    plan = compile_plan(events, backend)
+    recorder = InputRecorder(backend=backend, verbosity=0)
+    recorder.min_safe_gap = 0.0
+
+    def replay():
+        backend.clear()
+        return recorder.play_plan(plan, max_throughput=True)
+
+    seconds, report = measure(replay, repeat)
+    return {'seconds': seconds, 'rate': report['events'] / seconds, 'ops': report['ops']}
+
+
+def run_suite(count, repeat=3, seed=0, directory=None):
+    """对一个规模运行全部基准，返回 {基准名: 结果}"""
+    results = {}
+
+    seconds, events = measure(lambda: generate_events(count, seed), 1)
+    count = len(events)
+    results['generate'] = {'seconds': seconds, 'rate': count / seconds}
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for fmt in FORMATS:
+            filename = os.path.join(tmp, f'recording_bench.{fmt}')
+            seconds, _ = measure(lambda: save_recording(filename, events, 0.0), repeat)
+            size = os.path.getsize(filename)
+            results[f'save_{fmt}'] = {'seconds': seconds, 'rate': count / seconds, 'bytes': size}
+
+            # 读取并遍历全部事件，二进制格式的 mmap 打开本身几乎不耗时
+            def load():
+                loaded = load_events(filename)
+                n = sum(1 for _ in loaded)
+                if hasattr(loaded, 'close'):
+                    loaded.close()
+                return n
+
+            seconds, _ = measure(load, repeat)
+            results[f'load_{fmt}'] = {'seconds': seconds, 'rate': count / seconds}
+
+            def first_event():
+                stream = stream_events(filename)
+                next(iter(stream))
+                stream.close()
+
+            seconds, _ = measure(first_event, repeat)
+            results[f'stream_first_{fmt}'] = {'seconds': seconds}
+
+        seconds, _ = measure(lambda: compile_plan(events, FakeBackend()), repeat)
+        results['compile_plan'] = {'seconds': seconds, 'rate': count / seconds}
+
+        results['capture'] = bench_capture(events, tmp, repeat)
+
+    results['replay'] = bench_replay(events, repeat)
+    return count, results
+
+
+def version_label():
+    """默认以 git 提交作为版本标签"""
+    try:
+        output = subprocess.run(['git', 'describe', '--always', '--dirty'],
+                                capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if output.returncode == 0 and output.stdout.strip():
+            return output.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return 'local'
+
+
+def load_results(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(previous, current, threshold):
+    """与上一次运行比较，返回 [(规模, 基准名, 上次耗时, 本次耗时)] 中变慢超过 threshold 的项"""
+    regressions = []
+    for size, benches in current['sizes'].items():
+        old_benches = previous['sizes'].get(size, {})
+        for name, result in benches.items():
+            old = old_benches.get(name)
+            if old and old['seconds'] > 0 and result['seconds'] > old['seconds'] * (1 + threshold):
+                regressions.append((size, name, old['seconds'], result['seconds']))
+    return regressions
+
+
+def format_result(name, result):
+    text = f"  {name:<20} {result['seconds'] * 1000:10.2f} ms"
+    if 'rate' in result:
+        text += f"  {result['rate']:12,.0f} 事件/秒"
+    if 'callback_rate' in result:
+        text += f"  (回调 {result['callback_rate']:,.0f}/秒)"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='录制、加载、保存与无头回放的基准测试')
+    parser.add_argument('--sizes', default='10000,100000', help='事件数，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help='本次运行的版本标签，默认为 git 提交')
+    parser.add_argument('--results', default=RESULTS_FILE, help='结果文件，每次运行追加一条')
+    parser.add_argument('--threshold', type=float, default=0.10, help='判定为变慢的比例')
+    parser.add_argument('--no-save', action='store_true', help='不写入结果文件')
+    args = parser.parse_args()
+
+    run = {
+        'label': args.label or version_label(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pynput': keyboard is not None,
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        count, results = run_suite(size, args.repeat, args.seed)
+        run['sizes'][str(size)] = results
+        print(f"\n=== {count} 个事件 ===")
+        for name, result in results.items():
+            print(format_result(name, result))
+
+    history = load_results(args.results)
+    if history:
+        previous = history[-1]
+        regressions = compare(previous, run, args.threshold)
+        print(f"\n与上次运行 ({previous['label']}) 相比:")
+        if regressions:
+            for size, name, old, new in regressions:
+                print(f"  变慢: {size} 个事件 {name} {old * 1000:.2f}ms -> {new * 1000:.2f}ms "
+                      f"(+{(new / old - 1) * 100:.0f}%)")
+        else:
+            print(f"  没有超过 {args.threshold * 100:.0f}% 的变慢")
+
+    if not args.no_save:
+        history.append(run)
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存到: {args.results}")
+
+
+if __name__ == '__main__':
+    main()
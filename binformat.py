@@ -0,0 +1,381 @@
+import array
+import json
+import mmap
+import struct
+import sys
+
+from recformat import read_recording
+
+# 二进制录制文件格式(小端序)
+#
+#   头部:   魔数、版本、事件数、字符串数、开始时间、字符串表偏移与长度
+#   列数据: 每个字段一列定长数组，依次为
+#           timestamp(d) x(d) y(d) a(d) b(d) button(i) key(i) display(i) type(H) action(B) modifiers(B)
+#   字符串表: 事件类型、按钮名、键值、键名显示文本只保存一次，列中保存其序号
+#
+# 列按元素宽度从大到小排列，保证每列都自然对齐，可以直接从 mmap 上 cast 成数组。
+# 坐标列保存为浮点数，部分平台上的小数坐标与滚动量不会被取整；版本 1 的坐标列为 32 位整数。
+MAGIC = b'ARBN'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIdQQ')
+
+COLUMNS = (
+    ('timestamp', 'd'),
+    ('x', 'd'), ('y', 'd'), ('a', 'd'), ('b', 'd'),
+    ('button', 'i'), ('key', 'i'), ('display', 'i'),
+    ('type', 'H'),
+    ('action', 'B'),
+    ('modifiers', 'B'),
+)
+
+# 各版本文件的列布局
+VERSION_COLUMNS = {
+    1: tuple((name, 'i' if name in ('x', 'y', 'a', 'b') else code) for name, code in COLUMNS),
+    VERSION: COLUMNS,
+}
+
+# 字段缺失时字符串列中保存的序号
+NO_STRING = -1
+
+ACTIONS = (None, 'pressed', 'released')
+
+# 修饰键位掩码，解码时按此顺序还原修饰键列表
+MODIFIER_BITS = (('ctrl', 1), ('alt', 2), ('shift', 4), ('cmd', 8))
+
+# 每种事件类型在 x/y/a/b 四个坐标列中保存的字段
+COORD_FIELDS = {
+    'mouse': ('x', 'y', None, None),
+    'mouse_drag': ('x', 'y', None, None),
+    'mouse_move': ('x', 'y', None, None),
+    'mouse_drag_end': ('start_x', 'start_y', 'end_x', 'end_y'),
+    'mouse_scroll': ('x', 'y', 'dx', 'dy'),
+    'keyboard': (None, None, None, None),
+    'sync': ('x', 'y', 'width', 'height'),
+}
+
+# 解码时各类型事件字典的键顺序，与 InputRecorder 录制时保持一致
+FIELD_ORDER = {
+    'mouse': ('type', 'event', 'button', 'x', 'y', 'modifiers', 'timestamp'),
+    'mouse_drag': ('type', 'x', 'y', 'button', 'modifiers', 'timestamp'),
+    'mouse_move': ('type', 'x', 'y', 'modifiers', 'timestamp'),
+    'mouse_drag_end': ('type', 'start_x', 'start_y', 'end_x', 'end_y', 'button', 'modifiers', 'timestamp'),
+    'mouse_scroll': ('type', 'x', 'y', 'dx', 'dy', 'modifiers', 'timestamp'),
+    'keyboard': ('type', 'event', 'key', 'key_display', 'modifiers', 'timestamp'),
+    'sync': ('type', 'x', 'y', 'width', 'height', 'hash', 'timestamp'),
+}
+
+
+def is_binary(filename):
+    """判断文件是否为二进制录制格式"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def modifiers_to_mask(modifiers):
+    """修饰键列表转换为位掩码"""
+    mask = 0
+    for name, bit in MODIFIER_BITS:
+        if name in modifiers:
+            mask |= bit
+    return mask
+
+
+def mask_to_modifiers(mask):
+    """位掩码转换为修饰键列表"""
+    return [name for name, bit in MODIFIER_BITS if mask & bit]
+
+
+def event_from_fields(fields):
+    """把 iter_fields 形式的字段元组转换为录制时的事件字典"""
+    timestamp, event_type, action, button, key, key_display, modifiers, x, y, a, b = fields
+    values = {
+        'type': event_type,
+        'event': action,
+        'button': button,
+        'key': key,
+        'hash': key,   # sync 事件的区域哈希保存在 key 字段
+        'key_display': key_display,
+        'modifiers': list(modifiers),
+        'timestamp': timestamp,
+    }
+    values.update(zip(COORD_FIELDS[event_type], (x, y, a, b)))
+    return {field: values[field] for field in FIELD_ORDER[event_type]}
+
+
+def fields_from_event(event):
+    """把事件字典转换为 iter_fields 形式的字段元组"""
+    event_type = event['type']
+    coord_fields = COORD_FIELDS.get(event_type)
+    if coord_fields is None:
+        raise ValueError(f"不支持的事件类型: {event_type}")
+    x, y, a, b = (event[field] if field else 0 for field in coord_fields)
+    key = event['hash'] if event_type == 'sync' else event.get('key')
+    return (event['timestamp'], event_type, event.get('event'), event.get('button'), key,
+            event.get('key_display'), event.get('modifiers', []), x, y, a, b)
+
+
+def number(value):
+    """坐标列中的整数值还原为 int，与录制时的事件字典保持一致"""
+    return int(value) if value == int(value) else value
+
+
+def _column_layout(count, columns=COLUMNS):
+    """计算每一列相对列数据起点的偏移"""
+    layout = []
+    offset = 0
+    for name, code in columns:
+        layout.append((name, code, offset))
+        offset += struct.calcsize(code) * count
+    return layout, offset
+
+
+class ColumnarEvents:
+    """按列保存的事件序列，子类提供 columns(列名 -> 数组) 与 strings(字符串表)
+
+    按下标或迭代访问时才生成与录制时相同的事件字典；iter_fields 直接从列中读出字段，
+    回放计划的编译不需要生成字典。
+    """
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    @property
+    def timestamps(self):
+        """时间戳列"""
+        return self.columns['timestamp']
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError(index)
+
+        columns = self.columns
+        strings = self.strings
+
+        def string(column):
+            value = columns[column][index]
+            return strings[value] if value != NO_STRING else None
+
+        return event_from_fields((
+            columns['timestamp'][index], string('type'), ACTIONS[columns['action'][index]],
+            string('button'), string('key'), string('display'),
+            mask_to_modifiers(columns['modifiers'][index]),
+            number(columns['x'][index]), number(columns['y'][index]),
+            number(columns['a'][index]), number(columns['b'][index])))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_fields(self, start=0):
+        """逐个生成 (时间戳, 类型, 动作, 按钮, 键值, 键名显示, 修饰键, x, y, a, b)
+
+        坐标列的含义见 COORD_FIELDS；修饰键列表按掩码共享，调用方不应修改。
+        """
+        columns = self.columns
+        strings = self.strings + [None]   # NO_STRING(-1) 对应末尾的 None
+        modifier_lists = [mask_to_modifiers(mask) for mask in range(16)]
+        yield from zip(
+            columns['timestamp'][start:],
+            (strings[i] for i in columns['type'][start:]),
+            (ACTIONS[i] for i in columns['action'][start:]),
+            (strings[i] for i in columns['button'][start:]),
+            (strings[i] for i in columns['key'][start:]),
+            (strings[i] for i in columns['display'][start:]),
+            (modifier_lists[mask] for mask in columns['modifiers'][start:]),
+            map(number, columns['x'][start:]), map(number, columns['y'][start:]),
+            map(number, columns['a'][start:]), map(number, columns['b'][start:]))
+
+
+class EventStore(ColumnarEvents):
+    """内存中的紧凑事件序列，供长时间录制保留事件使用
+
+    与二进制录制文件相同的列布局: 数值保存在 array 中，按钮名、键值等字符串只保存一次，
+    修饰键保存为位掩码。每个事件约 56 字节，而事件字典需要数百字节。
+    """
+
+    def __init__(self, events=()):
+        self.strings = []
+        self.string_ids = {}
+        self.columns = {name: array.array(code) for name, code in COLUMNS}
+        self.extend(events)
+
+    def intern(self, value):
+        if value is None:
+            return NO_STRING
+        index = self.string_ids.get(value)
+        if index is None:
+            index = self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def append(self, event):
+        """追加一个事件字典"""
+        self.append_fields(fields_from_event(event))
+
+    def append_fields(self, fields):
+        """追加一个 iter_fields 形式的字段元组，录制时不需要先生成事件字典"""
+        timestamp, event_type, action, button, key, key_display, modifiers, x, y, a, b = fields
+        if event_type not in COORD_FIELDS:
+            raise ValueError(f"不支持的事件类型: {event_type}")
+
+        columns = self.columns
+        columns['timestamp'].append(timestamp)
+        columns['x'].append(x)
+        columns['y'].append(y)
+        columns['a'].append(a)
+        columns['b'].append(b)
+        columns['button'].append(self.intern(button))
+        columns['key'].append(self.intern(key))
+        columns['display'].append(self.intern(key_display))
+        columns['type'].append(self.intern(event_type))
+        columns['action'].append(ACTIONS.index(action))
+        columns['modifiers'].append(modifiers_to_mask(modifiers))
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def clear(self):
+        self.strings = []
+        self.string_ids = {}
+        self.columns = {name: array.array(code) for name, code in COLUMNS}
+
+    def nbytes(self):
+        """列数据占用的字节数(不含字符串表)"""
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+
+def write_binary(filename, events, start_time=None):
+    """把事件序列(事件字典或 EventStore)写成二进制录制文件"""
+    store = events if isinstance(events, EventStore) else EventStore(events)
+    strings = store.strings
+    columns = store.columns
+
+    count = len(store)
+    if sys.byteorder != 'little':
+        columns = {name: array.array(column.typecode, column) for name, column in columns.items()}
+        for column in columns.values():
+            column.byteswap()
+
+    string_data = bytearray()
+    for value in strings:
+        encoded = value.encode('utf-8')
+        string_data += struct.pack('<I', len(encoded)) + encoded
+
+    _, columns_size = _column_layout(count)
+    strings_offset = HEADER.size + columns_size
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count, len(strings),
+                            start_time or 0.0, strings_offset, len(string_data)))
+        for name, _ in COLUMNS:
+            columns[name].tofile(f)
+        f.write(string_data)
+
+    return count
+
+
+class BinaryRecording(ColumnarEvents):
+    """通过 mmap 映射的二进制录制文件
+
+    列数据不做任何解析，直接作为数组视图使用；按下标或迭代访问时才生成事件字典。
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, self.count, string_count, self.start_time,
+         strings_offset, strings_size) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是二进制录制文件: {filename}")
+        if version not in VERSION_COLUMNS:
+            raise ValueError(f"不支持的二进制录制版本: {version}")
+        self.version = version
+
+        self.strings = self._read_strings(strings_offset, string_count)
+
+        self.columns = {}
+        layout, _ = _column_layout(self.count, VERSION_COLUMNS[version])
+        view = memoryview(self._mmap)
+        for name, code, offset in layout:
+            start = HEADER.size + offset
+            raw = view[start:start + struct.calcsize(code) * self.count]
+            if sys.byteorder == 'little':
+                self.columns[name] = raw.cast(code)
+            else:
+                # 大端机器上无法零拷贝，复制一份并转换字节序
+                column = array.array(code, raw.tobytes())
+                column.byteswap()
+                self.columns[name] = column
+                raw.release()
+        view.release()
+
+    def _read_strings(self, offset, count):
+        strings = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('<I', self._mmap, offset)
+            offset += 4
+            strings.append(self._mmap[offset:offset + length].decode('utf-8'))
+            offset += length
+        return strings
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """释放列视图并关闭映射"""
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {}
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def json_to_binary(src, dst):
+    """JSON 录制文件(流式或旧格式)转换为二进制格式，返回事件数"""
+    start_time, events = read_recording(src)
+    return write_binary(dst, events, start_time)
+
+
+def binary_to_json(src, dst):
+    """二进制录制文件转换回旧的 JSON 格式，返回事件数"""
+    with BinaryRecording(src) as recording:
+        events = list(recording)
+        start_time = recording.start_time
+
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump({
+            'start_time': start_time,
+            'events': events
+        }, f, indent=2, ensure_ascii=False)
+    return len(events)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("用法: python binformat.py <输入文件> <输出文件>")
+        print("输入为 JSON 录制时转换为二进制格式，输入为二进制录制时转换回 JSON")
+        return
+
+    src, dst = sys.argv[1], sys.argv[2]
+    if is_binary(src):
+        count = binary_to_json(src, dst)
+    else:
+        count = json_to_binary(src, dst)
+    print(f"已转换 {count} 个事件: {src} -> {dst}")
+
+
+if __name__ == '__main__':
+    main()
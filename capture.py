@@ -0,0 +1,110 @@
+import threading
+import time
+
+# 监听线程推入环形缓冲区的原始事件类型，元组的第一个元素
+RAW_MOVE = 0      # (RAW_MOVE, 时间, x, y)
+RAW_CLICK = 1     # (RAW_CLICK, 时间, x, y, button, pressed)
+RAW_SCROLL = 2    # (RAW_SCROLL, 时间, x, y, dx, dy)
+RAW_PRESS = 3     # (RAW_PRESS, 时间, key)
+RAW_RELEASE = 4   # (RAW_RELEASE, 时间, key)
+
+
+class RingBuffer:
+    """预分配的环形缓冲区，连接 pynput 监听线程与事件处理线程
+
+    写入端只做一次下标检查和赋值，缓冲区满时丢弃新事件并计数，从不阻塞监听线程。
+    读取端只有一个处理线程。
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0      # 已写入的事件总数
+        self.tail = 0      # 已读取的事件总数
+        self.dropped = 0
+        self._lock = threading.Lock()  # 鼠标和键盘两个监听线程会同时写入
+
+    def push(self, item):
+        """写入一个原始事件，缓冲区满时返回 False"""
+        with self._lock:
+            head = self.head
+            if head - self.tail >= self.capacity:
+                self.dropped += 1
+                return False
+            self.slots[head % self.capacity] = item
+            self.head = head + 1
+        return True
+
+    def drain(self):
+        """取出所有已写入的事件"""
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return []
+
+        slots = self.slots
+        capacity = self.capacity
+        start = tail % capacity
+        end = head % capacity
+        if start < end:
+            items = slots[start:end]
+            slots[start:end] = [None] * (end - start)
+        else:
+            items = slots[start:] + slots[:end]
+            slots[start:] = [None] * (capacity - start)
+            slots[:end] = [None] * end
+
+        self.tail = head
+        return items
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+class CaptureConsumer:
+    """事件处理线程：从环形缓冲区取出原始事件并交给 handler 处理
+
+    handler 抛出的异常交给 on_error(异常) 处理，不中断处理线程；errors 为出错的总次数。
+    """
+
+    def __init__(self, buffer, handler, poll_interval=0.005, on_error=None):
+        self.buffer = buffer
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.on_error = on_error
+        self.errors = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='CaptureConsumer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止处理线程，并处理完缓冲区中剩余的事件"""
+        if self._thread is None:
+            return
+        self._running = False
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        buffer = self.buffer
+        handler = self.handler
+
+        while True:
+            running = self._running
+            items = buffer.drain()
+            for item in items:
+                try:
+                    handler(item)
+                except Exception as e:
+                    self.errors += 1
+                    if self.on_error is not None:
+                        self.on_error(e)
+            if not running and not items:
+                break
+            if not items:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,313 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from recformat import find_recordings, read_recording
+
+CATALOG_FILE = 'recordings_catalog.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    start_time REAL,
+    duration REAL NOT NULL,
+    event_count INTEGER NOT NULL,
+    min_x INTEGER, min_y INTEGER, max_x INTEGER, max_y INTEGER,
+    indexed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS event_counts (
+    path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path, type)
+);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (path, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_sha256 ON recordings (sha256);
+CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags (tag);
+'''
+
+SORT_COLUMNS = {
+    'path': 'r.path',
+    'mtime': 'r.mtime_ns',
+    'duration': 'r.duration',
+    'events': 'r.event_count',
+    'size': 'r.size',
+}
+
+# 各类事件中表示屏幕坐标的字段
+COORD_KEYS = (('x', 'y'), ('start_x', 'start_y'), ('end_x', 'end_y'))
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recording_stats(events):
+    """统计录制的时长、各类型事件数与屏幕坐标范围"""
+    counts = {}
+    duration = 0.0
+    min_x = min_y = max_x = max_y = None
+
+    for event in events:
+        event_type = event['type']
+        counts[event_type] = counts.get(event_type, 0) + 1
+        duration = max(duration, event['timestamp'])
+        for kx, ky in COORD_KEYS:
+            if kx in event:
+                x, y = event[kx], event[ky]
+                if min_x is None:
+                    min_x = max_x = x
+                    min_y = max_y = y
+                else:
+                    min_x, max_x = min(min_x, x), max(max_x, x)
+                    min_y, max_y = min(min_y, y), max(max_y, y)
+
+    return {
+        'duration': duration,
+        'event_count': sum(counts.values()),
+        'counts': counts,
+        'bounds': (min_x, min_y, max_x, max_y),
+    }
+
+
+class RecordingCatalog:
+    """录制文件元数据目录(SQLite)
+
+    以文件路径为键保存修改时间、大小、内容哈希以及时长、事件统计、坐标范围和标签。
+    refresh 只重新读取新增或发生变化的文件，列表、筛选与排序都不需要打开录制文件。
+    """
+
+    def __init__(self, db_path=CATALOG_FILE):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        # 旧版本创建的数据库没有 error 列
+        columns = [row['name'] for row in self.conn.execute('PRAGMA table_info(recordings)')]
+        if 'error' not in columns:
+            self.conn.execute('ALTER TABLE recordings ADD COLUMN error TEXT')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, directory='.'):
+        """同步目录中的录制文件，返回 (新增或更新数, 未变化数, 删除数)"""
+        directory = os.path.normpath(directory)
+        files = find_recordings(directory)
+        updated = unchanged = 0
+
+        for path in files:
+            try:
+                changed = self.update_file(path)
+            except OSError:
+                # 扫描过程中被删除或无法访问的文件
+                continue
+            if changed:
+                updated += 1
+            else:
+                unchanged += 1
+
+        # 删除目录中已不存在的文件的记录
+        existing = set(files)
+        parent = '' if directory == '.' else directory
+        removed = 0
+        for row in self.conn.execute('SELECT path FROM recordings').fetchall():
+            path = row['path']
+            if os.path.dirname(path) == parent and path not in existing:
+                self.remove(path)
+                removed += 1
+
+        self.conn.commit()
+        return updated, unchanged, removed
+
+    def update_file(self, path):
+        """更新单个文件的记录，文件未变化时返回 False
+
+        无法解析的文件(截断、损坏)同样记录下来，error 为错误信息，时长与事件数为 0，
+        文件未变化时不会重复解析。
+        """
+        path = os.path.normpath(path)
+        stat = os.stat(path)
+        row = self.conn.execute(
+            'SELECT mtime_ns, size, sha256 FROM recordings WHERE path = ?', (path,)).fetchone()
+
+        if row and row['mtime_ns'] == stat.st_mtime_ns and row['size'] == stat.st_size:
+            return False
+
+        sha256 = file_digest(path)
+        if row and row['sha256'] == sha256:
+            # 只是修改时间变了，内容相同
+            self.conn.execute('UPDATE recordings SET mtime_ns = ? WHERE path = ?',
+                              (stat.st_mtime_ns, path))
+            return False
+
+        error = None
+        try:
+            start_time, events = read_recording(path)
+            stats = recording_stats(events)
+        except Exception as e:
+            start_time = None
+            stats = recording_stats(())
+            error = f"{type(e).__name__}: {e}"
+        min_x, min_y, max_x, max_y = stats['bounds']
+
+        self.conn.execute('DELETE FROM event_counts WHERE path = ?', (path,))
+        self.conn.execute(
+            'INSERT OR REPLACE INTO recordings (path, mtime_ns, size, sha256, start_time, duration, '
+            'event_count, min_x, min_y, max_x, max_y, indexed_at, error) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, stat.st_mtime_ns, stat.st_size, sha256, start_time, stats['duration'],
+             stats['event_count'], min_x, min_y, max_x, max_y, time.time(), error))
+        self.conn.executemany(
+            'INSERT INTO event_counts VALUES (?, ?, ?)',
+            [(path, event_type, count) for event_type, count in stats['counts'].items()])
+        return True
+
+    def remove(self, path):
+        """删除文件的记录(标签一并删除)"""
+        for table in ('recordings', 'event_counts', 'tags'):
+            self.conn.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+
+    def add_tags(self, path, *tags):
+        path = os.path.normpath(path)
+        self.conn.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)', [(path, tag) for tag in tags])
+        self.conn.commit()
+
+    def remove_tags(self, path, *tags):
+        path = os.path.normpath(path)
+        self.conn.executemany('DELETE FROM tags WHERE path = ? AND tag = ?', [(path, tag) for tag in tags])
+        self.conn.commit()
+
+    def get(self, path):
+        """返回单个文件的记录，没有时返回 None"""
+        rows = self.query(path=os.path.normpath(path))
+        return rows[0] if rows else None
+
+    def query(self, path=None, tag=None, event_type=None, min_duration=None, max_duration=None,
+              min_events=None, name=None, sort='path', descending=False, limit=None):
+        """按条件筛选并排序录制文件，返回字典列表"""
+        where = []
+        params = []
+        if path is not None:
+            where.append('r.path = ?')
+            params.append(path)
+        if tag is not None:
+            where.append('EXISTS (SELECT 1 FROM tags t WHERE t.path = r.path AND t.tag = ?)')
+            params.append(tag)
+        if event_type is not None:
+            where.append('EXISTS (SELECT 1 FROM event_counts c WHERE c.path = r.path AND c.type = ?)')
+            params.append(event_type)
+        if min_duration is not None:
+            where.append('r.duration >= ?')
+            params.append(min_duration)
+        if max_duration is not None:
+            where.append('r.duration <= ?')
+            params.append(max_duration)
+        if min_events is not None:
+            where.append('r.event_count >= ?')
+            params.append(min_events)
+        if name is not None:
+            where.append('r.path LIKE ?')
+            params.append(f'%{name}%')
+
+        sql = 'SELECT r.* FROM recordings r'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f" ORDER BY {SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        results = []
+        for row in self.conn.execute(sql, params).fetchall():
+            record = dict(row)
+            record['counts'] = {r['type']: r['count'] for r in self.conn.execute(
+                'SELECT type, count FROM event_counts WHERE path = ?', (row['path'],))}
+            record['tags'] = [r['tag'] for r in self.conn.execute(
+                'SELECT tag FROM tags WHERE path = ? ORDER BY tag', (row['path'],))]
+            results.append(record)
+        return results
+
+
+def format_record(record):
+    """单行显示一条录制记录"""
+    tags = f" [{', '.join(record['tags'])}]" if record['tags'] else ''
+    if record.get('error'):
+        return f"{record['path']}  无法读取: {record['error']}{tags}"
+    return f"{record['path']}  时长 {record['duration']:.1f}s  事件 {record['event_count']}{tags}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='录制文件目录')
+    parser.add_argument('--db', default=CATALOG_FILE, help=f'目录数据库文件，默认 {CATALOG_FILE}')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    scan = sub.add_parser('scan', help='扫描目录并更新记录')
+    scan.add_argument('directory', nargs='?', default='.')
+
+    show = sub.add_parser('list', help='筛选并列出录制文件')
+    show.add_argument('--tag')
+    show.add_argument('--type', dest='event_type', help='包含该类型事件的录制')
+    show.add_argument('--min-duration', type=float)
+    show.add_argument('--max-duration', type=float)
+    show.add_argument('--min-events', type=int)
+    show.add_argument('--name', help='路径包含的文字')
+    show.add_argument('--sort', choices=sorted(SORT_COLUMNS), default='path')
+    show.add_argument('--desc', action='store_true', help='降序排列')
+    show.add_argument('--limit', type=int)
+    show.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    tag = sub.add_parser('tag', help='给录制文件添加标签')
+    tag.add_argument('path')
+    tag.add_argument('tags', nargs='+')
+
+    untag = sub.add_parser('untag', help='删除录制文件的标签')
+    untag.add_argument('path')
+    untag.add_argument('tags', nargs='+')
+
+    args = parser.parse_args()
+
+    with RecordingCatalog(args.db) as catalog:
+        if args.command == 'scan':
+            updated, unchanged, removed = catalog.refresh(args.directory)
+            print(f"更新 {updated} 个, 未变化 {unchanged} 个, 删除 {removed} 个")
+        elif args.command == 'list':
+            records = catalog.query(tag=args.tag, event_type=args.event_type,
+                                    min_duration=args.min_duration, max_duration=args.max_duration,
+                                    min_events=args.min_events, name=args.name, sort=args.sort,
+                                    descending=args.desc, limit=args.limit)
+            if args.json:
+                print(json.dumps(records, ensure_ascii=False, indent=2))
+            else:
+                for record in records:
+                    print(format_record(record))
+        elif args.command == 'tag':
+            catalog.add_tags(args.path, *args.tags)
+        elif args.command == 'untag':
+            catalog.remove_tags(args.path, *args.tags)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+
+import numpy as np
+
+from recformat import read_recording, save_recording
+
+
+def simplify_polyline(points, tolerance):
+    """Ramer–Douglas–Peucker 折线简化，返回需要保留的点的下标(布尔数组)
+
+    每一段只用一次向量化计算求出所有中间点到首尾连线的距离，
+    首尾两点始终保留。
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3:
+        return keep
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start = points[first]
+        chord = points[last] - start
+        offsets = points[first + 1:last] - start
+        length = np.hypot(chord[0], chord[1])
+
+        if length == 0:
+            # 首尾重合时取到该点的距离
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return keep
+
+
+def find_drag_runs(events):
+    """找出连续的 mouse_drag 事件段，返回 (起始下标, 结束下标) 列表(左闭右开)"""
+    runs = []
+    start = None
+    button = None
+
+    for i, event in enumerate(events):
+        if event['type'] == 'mouse_drag' and (start is None or event['button'] == button):
+            if start is None:
+                start = i
+                button = event['button']
+            continue
+
+        if start is not None:
+            runs.append((start, i))
+            start = None
+        if event['type'] == 'mouse_drag':
+            start = i
+            button = event['button']
+
+    if start is not None:
+        runs.append((start, len(events)))
+    return runs
+
+
+def simplify_drags(events, tolerance=2.0):
+    """简化录制中的拖拽轨迹，返回 (新事件列表, 删除的事件数)
+
+    只删除拖拽段中间的 mouse_drag 事件，每段的首尾两点(即起止位置与起止时间)
+    以及所有其它类型的事件保持不变；保留下来的点维持原来的时间戳。
+    """
+    events = list(events)
+    drop = np.zeros(len(events), dtype=bool)
+
+    for start, end in find_drag_runs(events):
+        if end - start < 3:
+            continue
+        run = events[start:end]
+        points = [(event['x'], event['y']) for event in run]
+        keep = simplify_polyline(points, tolerance)
+        drop[start:end] = ~keep
+
+    removed = int(drop.sum())
+    if not removed:
+        return events, 0
+    return [event for event, dropped in zip(events, drop) if not dropped], removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='简化录制文件中的鼠标拖拽轨迹')
+    parser.add_argument('input', help='输入录制文件')
+    parser.add_argument('output', help='输出录制文件，格式由扩展名决定')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='允许的最大偏差(像素)，默认 2.0')
+    args = parser.parse_args()
+
+    start_time, events = read_recording(args.input)
+    simplified, removed = simplify_drags(events, args.tolerance)
+    save_recording(args.output, simplified, start_time)
+
+    print(f"原事件数: {len(events)}, 简化后: {len(simplified)}, 删除拖拽点: {removed}")
+
+
+if __name__ == '__main__':
+    main()
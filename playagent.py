@@ -0,0 +1,475 @@
+import argparse
+import hmac
+import ipaddress
+import itertools
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+
+from playplan import iter_plan, resolve_plan
+
+DEFAULT_PORT = 7421
+
+# 帧格式: 4 字节长度(大端，不含帧头) + 1 字节消息类型 + 负载
+# 负载为 UTF-8 JSON；BATCH 的负载先经过 zlib 压缩
+FRAME_HEADER = struct.Struct('>IB')
+MAX_FRAME = 16 * 1024 * 1024
+
+MSG_START = 1   # 控制端 -> 代理: {session, token, speed, idle_threshold, max_idle, max_throughput}
+MSG_BATCH = 2   # 控制端 -> 代理: {session, seq, steps}，steps 为可移植回放计划的一段
+MSG_END = 3     # 控制端 -> 代理: {session}，该回放的计划已全部发送
+MSG_STOP = 4    # 控制端 -> 代理: {session, token}，session 为 None 时停止当前回放
+MSG_ACK = 5     # 代理 -> 控制端: {session, seq, played}，该批已开始回放，可以再发送一批
+MSG_DONE = 6    # 代理 -> 控制端: {session, report}
+MSG_ERROR = 7   # 代理 -> 控制端: {message}
+
+# 控制端最多同时发出但未确认的批数，代理回放跟不上时控制端停止发送
+DEFAULT_WINDOW = 4
+DEFAULT_BATCH_SIZE = 256
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def send_frame(sock, kind, payload, lock=None):
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if kind == MSG_BATCH:
+        data = zlib.compress(data, 1)
+    frame = FRAME_HEADER.pack(len(data), kind) + data
+    if lock is None:
+        sock.sendall(frame)
+    else:
+        with lock:
+            sock.sendall(frame)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """读取一帧，返回 (消息类型, 负载)，连接关闭时返回 (None, None)"""
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None, None
+    size, kind = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ProtocolError(f"帧过大: {size} 字节")
+    data = _recv_exact(sock, size) if size else b''
+    if data is None:
+        return None, None
+    if kind == MSG_BATCH:
+        # 限制解压后的大小，防止很小的压缩数据展开成巨大的内存占用
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(data, MAX_FRAME)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ProtocolError(f"解压后的帧超过 {MAX_FRAME} 字节或数据不完整")
+    return kind, json.loads(data)
+
+
+def encode_steps(steps):
+    """可移植回放计划转换为 JSON 数组: [时间, 事件类型, [[操作码, [参数...]], ...]]
+
+    显示文本不发送，代理端以事件类型代替。
+    """
+    return [[t, event_type, [[op, list(args)] for op, args in ops]]
+            for t, event_type, ops, _ in steps]
+
+
+def decode_steps(items):
+    return [(t, event_type, tuple((op, tuple(args)) for op, args in ops), event_type)
+            for t, event_type, ops in items]
+
+
+class Session:
+    """代理端的一次回放: 接收到的批次排队等待回放线程取用"""
+
+    def __init__(self, session_id, options, conn, send_lock):
+        self.id = session_id
+        self.options = options
+        self.conn = conn
+        self.send_lock = send_lock
+        self.batches = queue.Queue()
+        self.stopped = False
+        self.played = 0
+        self.thread = None
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+class PlaybackAgent:
+    """回放代理: 在本地端口上接收控制端发来的回放计划并通过 InputRecorder 回放
+
+    同一时间只有一个回放；新的 START 会先停止正在进行的回放。每批计划在开始回放时
+    才确认(ACK)，控制端据此限制未确认的批数，代理端的缓冲不会无限增长。
+    token 不为 None 时，START 与 STOP 必须携带相同的令牌，否则断开连接。
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, backend=None, verbosity=1,
+                 token=None):
+        from autorecorder import InputRecorder
+
+        self.recorder = InputRecorder(backend=backend, verbosity=verbosity)
+        self.backend = self.recorder.backend
+        self.verbosity = verbosity
+        self.token = token
+        self.session = None
+        self._lock = threading.Lock()
+        agent = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                agent.handle_connection(self.request)
+
+        self.server = _Server((host, port), Handler)
+        self.address = self.server.server_address
+        if token is None and not is_loopback(host):
+            self.log(f"警告: 代理监听在非本机地址 {host} 且没有设置令牌，"
+                     f"任何能访问该端口的人都可以控制本机的鼠标键盘", 0)
+        self._thread = None
+
+    def log(self, message, level=1):
+        if self.verbosity >= level:
+            print(message)
+
+    def start(self):
+        """在后台线程中开始监听"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='PlaybackAgent',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.log(f"回放代理正在监听 {self.address[0]}:{self.address[1]}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.stop_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def check_token(self, payload):
+        if self.token is None:
+            return
+        token = payload.get('token')
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode('utf-8'),
+                                                                 self.token.encode('utf-8')):
+            raise ProtocolError("令牌错误")
+
+    def handle_connection(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_lock = threading.Lock()
+        try:
+            while True:
+                kind, payload = recv_frame(conn)
+                if kind is None:
+                    break
+                if kind == MSG_START:
+                    self.check_token(payload)
+                    self.start_session(payload, conn, send_lock)
+                elif kind == MSG_BATCH:
+                    # 只接受本连接发起的回放的批次
+                    session = self.session
+                    if session and session.conn is conn and session.id == payload['session']:
+                        session.batches.put((payload['seq'], decode_steps(payload['steps'])))
+                elif kind == MSG_END:
+                    session = self.session
+                    if session and session.conn is conn and session.id == payload['session']:
+                        session.batches.put(None)
+                elif kind == MSG_STOP:
+                    self.check_token(payload)
+                    session = self.session
+                    if session and payload.get('session') in (None, session.id):
+                        self.stop_session()
+                else:
+                    raise ProtocolError(f"未知的消息类型: {kind}")
+        except (OSError, ValueError, zlib.error, ProtocolError) as e:
+            try:
+                send_frame(conn, MSG_ERROR, {'message': str(e)}, send_lock)
+            except OSError:
+                pass
+        finally:
+            # 控制端断开时停止它发起的回放
+            session = self.session
+            if session and session.conn is conn:
+                self.stop_session()
+
+    def start_session(self, payload, conn, send_lock):
+        self.stop_session()
+        session = Session(payload['session'], payload, conn, send_lock)
+        with self._lock:
+            self.session = session
+        session.thread = threading.Thread(target=self.run_session, args=(session,),
+                                          name='AgentPlayback', daemon=True)
+        session.thread.start()
+
+    def stop_session(self):
+        with self._lock:
+            session = self.session
+        if session is None:
+            return
+        session.stopped = True
+        self.recorder.stop_playback = True
+        session.batches.put(None)
+        if session.thread is not threading.current_thread():
+            session.thread.join()
+
+    def iter_session_steps(self, session):
+        """回放线程从队列中取出批次，开始回放一批时向控制端确认"""
+        while not session.stopped:
+            item = session.batches.get()
+            if item is None:
+                return
+            seq, steps = item
+            try:
+                send_frame(session.conn, MSG_ACK,
+                           {'session': session.id, 'seq': seq, 'played': session.played},
+                           session.send_lock)
+            except OSError:
+                return
+            for step in resolve_plan(steps, self.backend):
+                if session.stopped:
+                    return
+                yield step
+                session.played += 1
+
+    def run_session(self, session):
+        options = session.options
+        self.log(f"开始回放 (会话 {session.id})")
+        report = self.recorder.play_plan(
+            self.iter_session_steps(session), options.get('speed', 1.0),
+            options.get('idle_threshold'), options.get('max_idle', 0.5),
+            options.get('max_throughput', False))
+        report['stopped'] = session.stopped
+        report['completed'] = report['completed'] and not session.stopped
+        try:
+            send_frame(session.conn, MSG_DONE, {'session': session.id, 'report': report},
+                       session.send_lock)
+        except OSError:
+            pass
+        with self._lock:
+            if self.session is session:
+                self.session = None
+
+
+class AgentClient:
+    """控制端与一个代理的连接
+
+    play 以批为单位发送回放计划，未确认的批数不超过 window；stop 随时中断；
+    seek 停止当前回放后从录制文件的指定位置重新开始。
+    """
+
+    _sessions = itertools.count(1)
+
+    def __init__(self, address, window=DEFAULT_WINDOW, batch_size=DEFAULT_BATCH_SIZE, timeout=10.0,
+                 token=None):
+        self.address = address
+        self.token = token
+        self.window = window
+        self.batch_size = batch_size
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.session = None
+        self.acked = 0          # 已确认的批数
+        self.sent = 0           # 已发送的批数
+        self.played = 0         # 代理已回放的步骤数
+        self.report = None
+        self.error = None
+        self.closed = False
+        self._reader = threading.Thread(target=self._read, name='AgentClient', daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            while True:
+                kind, payload = recv_frame(self.sock)
+                if kind is None:
+                    break
+                with self.condition:
+                    if kind == MSG_ACK and payload['session'] == self.session:
+                        self.acked = max(self.acked, payload['seq'] + 1)
+                        self.played = payload['played']
+                    elif kind == MSG_DONE and payload['session'] == self.session:
+                        self.report = payload['report']
+                        self.played = self.report['events']
+                    elif kind == MSG_ERROR:
+                        self.error = payload['message']
+                    self.condition.notify_all()
+        except (OSError, ValueError, zlib.error, ProtocolError) as e:
+            self.error = str(e)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def play(self, steps, speed=1.0, idle_threshold=None, max_idle=0.5, max_throughput=False,
+             wait=True):
+        """发送并回放一个可移植计划，wait 为 True 时等待回放结束并返回代理的报告"""
+        with self.condition:
+            session = self.session = next(self._sessions)
+            self.acked = 0
+            self.sent = 0
+            self.played = 0
+            self.report = None
+
+        try:
+            send_frame(self.sock, MSG_START, {
+                'session': session, 'token': self.token, 'speed': speed,
+                'idle_threshold': idle_threshold, 'max_idle': max_idle,
+                'max_throughput': max_throughput}, self.send_lock)
+
+            steps = iter(steps)
+            while True:
+                batch = list(itertools.islice(steps, self.batch_size))
+                if not batch:
+                    break
+                with self.condition:
+                    # 背压: 代理尚未开始回放的批数达到窗口上限时等待
+                    while (self.sent - self.acked >= self.window and self.session == session
+                           and self.report is None and not self.closed):
+                        self.condition.wait()
+                    if self.session != session or self.report is not None or self.closed:
+                        break
+                send_frame(self.sock, MSG_BATCH,
+                           {'session': session, 'seq': self.sent, 'steps': encode_steps(batch)},
+                           self.send_lock)
+                self.sent += 1
+            if self.session == session:
+                send_frame(self.sock, MSG_END, {'session': session}, self.send_lock)
+        except OSError as e:
+            # 代理断开连接(例如令牌错误)，错误信息由读取线程记录
+            self.error = self.error or str(e)
+        return self.wait(session) if wait else None
+
+    def wait(self, session=None, timeout=None):
+        """等待回放结束，返回报告；连接断开或超时返回 None"""
+        session = session or self.session
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (self.session == session and self.report is not None)
+                or self.session != session, timeout)
+            return self.report if self.session == session else None
+
+    def stop(self):
+        """停止代理上正在进行的回放"""
+        with self.condition:
+            session = self.session
+        send_frame(self.sock, MSG_STOP, {'session': session, 'token': self.token}, self.send_lock)
+
+    def seek(self, filename, start_time=None, start_event=None, wait=True, **play_options):
+        """停止当前回放，从录制文件的指定时间(秒)或事件序号开始重新回放"""
+        from seekindex import seek_plan
+
+        if self.session is not None and self.report is None:
+            self.stop()
+            self.wait()
+        return self.play(seek_plan(filename, None, start_time, start_event), wait=wait,
+                         **play_options)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._reader.join()
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return (host or '127.0.0.1', int(port) if port else DEFAULT_PORT)
+
+
+def play_on_agents(addresses, steps, token=None, **play_options):
+    """在多个代理上并发回放同一个计划，返回 {地址: 报告}"""
+    steps = list(steps)
+    results = {}
+
+    def run(address):
+        client = AgentClient(address, token=token)
+        try:
+            results[address] = client.play(steps, **play_options)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=run, args=(address,)) for address in addresses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='局域网回放代理与控制端')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='启动回放代理')
+    serve.add_argument('--host', default='127.0.0.1', help='监听地址，默认只接受本机连接')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--token', help='共享令牌，监听非本机地址时应当设置')
+
+    play = sub.add_parser('play', help='在一个或多个代理上回放录制文件')
+    play.add_argument('recording')
+    play.add_argument('agents', nargs='+', help='代理地址 host:port')
+    play.add_argument('--speed', type=float, default=1.0)
+    play.add_argument('--start-at', type=float, help='从录制的第几秒开始')
+    play.add_argument('--coalesce-modifiers', action='store_true')
+    play.add_argument('--batch-typing', action='store_true')
+    play.add_argument('--token', help='代理的共享令牌')
+
+    stop = sub.add_parser('stop', help='停止代理上正在进行的回放')
+    stop.add_argument('agents', nargs='+')
+    stop.add_argument('--token', help='代理的共享令牌')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        PlaybackAgent(args.host, args.port, token=args.token).serve_forever()
+    elif args.command == 'play':
+        options = {'coalesce_modifiers': args.coalesce_modifiers, 'batch_typing': args.batch_typing}
+        if args.start_at is not None:
+            from seekindex import seek_plan
+            steps = seek_plan(args.recording, None, args.start_at, **options)
+        else:
+            from recformat import stream_events
+            steps = iter_plan(stream_events(args.recording), None, **options)
+        results = play_on_agents([parse_address(a) for a in args.agents], steps, args.token,
+                                 speed=args.speed)
+        for address, report in results.items():
+            status = '无响应' if report is None else '完成' if report['completed'] else '已停止'
+            events = report['events'] if report else 0
+            print(f"{address[0]}:{address[1]}: {status}, 事件 {events}")
+    elif args.command == 'stop':
+        for text in args.agents:
+            client = AgentClient(parse_address(text), token=args.token)
+            client.stop()
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import array
+import bisect
+import json
+import math
+
+# 直方图桶上限(秒)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def percentile(ordered, q):
+    """已排序序列的分位数(最近秩)"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram(values, buckets):
+    """累计直方图: 每个桶上限对应不超过该值的样本数"""
+    counts = [0] * len(buckets)
+    for value in values:
+        index = bisect.bisect_left(buckets, value)
+        if index < len(buckets):
+            counts[index] += 1
+    total = 0
+    cumulative = []
+    for count in counts:
+        total += count
+        cumulative.append(total)
+    return cumulative
+
+
+class SeriesStats:
+    """一组样本的统计: 数量、总和、均值、标准差、分位数与直方图"""
+
+    def __init__(self, values, buckets):
+        ordered = sorted(values)
+        n = len(ordered)
+        self.count = n
+        self.sum = math.fsum(ordered)
+        self.mean = self.sum / n if n else 0.0
+        self.stddev = math.sqrt(math.fsum((v - self.mean) ** 2 for v in ordered) / n) if n else 0.0
+        self.max = ordered[-1] if n else 0.0
+        self.quantiles = {q: percentile(ordered, q) for q in QUANTILES}
+        self.buckets = buckets
+        self.histogram = histogram(ordered, buckets)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.mean,
+            'stddev': self.stddev,
+            'max': self.max,
+            'quantiles': {f'p{int(q * 100)}': v for q, v in self.quantiles.items()},
+            'histogram': {f'{b:g}': c for b, c in zip(self.buckets, self.histogram)},
+        }
+
+
+class PlaybackMetrics:
+    """回放插桩: 记录每个事件的计划时间、实际发出时间与控制器调用耗时
+
+    所有时间均为 perf_counter 秒。按事件类型分组统计延迟(实际 - 计划)、
+    抖动(相邻事件延迟之差)与调用耗时，可导出为 JSON 或 Prometheus 文本格式。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.samples = {}   # 事件类型 -> (计划时间, 实际时间, 调用耗时) 三列数组
+        self._last_lateness = None
+        self.jitter = array.array('d')
+
+    def record(self, event_type, scheduled, actual, call_duration):
+        columns = self.samples.get(event_type)
+        if columns is None:
+            columns = self.samples[event_type] = (array.array('d'), array.array('d'), array.array('d'))
+        columns[0].append(scheduled)
+        columns[1].append(actual)
+        columns[2].append(call_duration)
+
+        lateness = actual - scheduled
+        if self._last_lateness is not None:
+            self.jitter.append(abs(lateness - self._last_lateness))
+        self._last_lateness = lateness
+
+    def _series(self, event_type=None):
+        """返回 (延迟列表, 调用耗时列表)，event_type 为 None 时合并所有类型"""
+        groups = self.samples.values() if event_type is None else [self.samples[event_type]]
+        lateness = []
+        durations = []
+        for scheduled, actual, call_duration in groups:
+            lateness.extend(a - s for s, a in zip(scheduled, actual))
+            durations.extend(call_duration)
+        return lateness, durations
+
+    def summary(self):
+        """按事件类型汇总，'all' 为全部事件"""
+        result = {}
+        for event_type in ['all'] + sorted(self.samples):
+            lateness, durations = self._series(None if event_type == 'all' else event_type)
+            result[event_type] = {
+                'lateness': SeriesStats(lateness, self.buckets).to_dict(),
+                'call_duration': SeriesStats(durations, self.buckets).to_dict(),
+            }
+        result['all']['jitter'] = SeriesStats(self.jitter, self.buckets).to_dict()
+        return result
+
+    def export_json(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+
+    def prometheus_text(self, prefix='autorecorder_playback'):
+        """生成 Prometheus 文本格式的指标"""
+        lines = []
+
+        def emit_histogram(name, help_text, series_by_type):
+            metric = f'{prefix}_{name}_seconds'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for event_type, stats in series_by_type:
+                label = f'event_type="{event_type}"'
+                for bucket, count in zip(stats.buckets, stats.histogram):
+                    lines.append(f'{metric}_bucket{{{label},le="{bucket:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f'{metric}_sum{{{label}}} {stats.sum:.9f}')
+                lines.append(f'{metric}_count{{{label}}} {stats.count}')
+
+            quantile_metric = f'{prefix}_{name}_quantile_seconds'
+            lines.append(f'# HELP {quantile_metric} {help_text} (quantiles)')
+            lines.append(f'# TYPE {quantile_metric} gauge')
+            for event_type, stats in series_by_type:
+                for q, value in stats.quantiles.items():
+                    lines.append(f'{quantile_metric}{{event_type="{event_type}",quantile="{q:g}"}} {value:.9f}')
+
+        lateness = []
+        durations = []
+        for event_type in sorted(self.samples):
+            late, dur = self._series(event_type)
+            lateness.append((event_type, SeriesStats(late, self.buckets)))
+            durations.append((event_type, SeriesStats(dur, self.buckets)))
+
+        emit_histogram('lateness', 'Delay between scheduled and actual event dispatch.', lateness)
+        emit_histogram('call_duration', 'Time spent in input backend calls per event.', durations)
+
+        jitter = SeriesStats(self.jitter, self.buckets)
+        lines.append(f'# HELP {prefix}_jitter_seconds Mean absolute change of lateness between consecutive events.')
+        lines.append(f'# TYPE {prefix}_jitter_seconds gauge')
+        lines.append(f'{prefix}_jitter_seconds {jitter.mean:.9f}')
+        return '\n'.join(lines) + '\n'
+
+    def export_prometheus(self, filename, prefix='autorecorder_playback'):
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(prefix))
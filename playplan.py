@@ -0,0 +1,390 @@
+import json
+import os
+
+from recformat import load_events
+
+# 回放计划中的操作码，按顺序对应 backend_handlers 返回的方法
+OP_MOVE = 0         # (x, y)
+OP_PRESS = 1        # (button,)
+OP_RELEASE = 2      # (button,)
+OP_SCROLL = 3       # (dx, dy)
+OP_KEY_PRESS = 4    # (key,)
+OP_KEY_RELEASE = 5  # (key,)
+OP_TYPE = 6         # (text,)
+OP_SYNC = 7         # (x, y, width, height, hash)，以点击位置为中心的屏幕同步点，由回放循环处理
+
+PLAN_VERSION = 3
+PLAN_SUFFIX = '.plan'
+
+
+class NameResolver:
+    """不绑定后端时使用，按钮名与键值保持录制时的字符串形式"""
+
+    name = 'portable'
+
+    def resolve_button(self, name):
+        return name
+
+    def resolve_key(self, key):
+        return key
+
+    def resolve_modifier(self, name):
+        # 修饰键保存为对应的特殊键名，绑定后端时与普通按键一样转换
+        return f'Key.{name}'
+
+
+def ignore_sync(*args):
+    """不支持屏幕同步的回放方式直接跳过同步点"""
+
+
+def backend_handlers(backend):
+    """按操作码顺序返回后端方法，回放时直接用操作码下标调用"""
+    return (backend.set_position, backend.press, backend.release,
+            backend.scroll, backend.press_key, backend.release_key,
+            backend.type_text, ignore_sync)
+
+
+def compile_event(event, resolver):
+    """把单个录制事件编译为 (时间, 事件类型, 操作序列, 显示文本)"""
+    event_type = event['type']
+    if event_type == 'keyboard':
+        coords = (0, 0, 0, 0)
+    elif event_type == 'mouse_drag_end':
+        coords = (event['start_x'], event['start_y'], event['end_x'], event['end_y'])
+    elif event_type == 'mouse_scroll':
+        coords = (event['x'], event['y'], event['dx'], event['dy'])
+    elif event_type == 'sync':
+        return compile_fields(event['timestamp'], event_type, None, None, event['hash'], None, [],
+                              event['x'], event['y'], event['width'], event['height'], resolver)
+    elif event_type in ('mouse', 'mouse_drag', 'mouse_move'):
+        coords = (event['x'], event['y'], 0, 0)
+    else:
+        return None
+
+    return compile_fields(event['timestamp'], event_type, event.get('event'), event.get('button'),
+                          event.get('key'), event.get('key_display'), event.get('modifiers', []),
+                          *coords, resolver)
+
+
+def compile_fields(timestamp, event_type, action, button, key, key_display, modifiers,
+                   x, y, a, b, resolver):
+    """按字段编译单个事件，坐标含义同 binformat.COORD_FIELDS:
+    mouse_drag_end 的 (x, y, a, b) 为起点与终点，mouse_scroll 的 (a, b) 为 (dx, dy)，
+    sync 的 (x, y) 为点击位置、(a, b) 为区域宽高、key 为区域哈希
+
+    列式事件序列(EventStore / BinaryRecording)不生成事件字典，直接按字段编译。
+    """
+    mod_text = '+'.join(modifiers) + '+' if modifiers else ''
+
+    if event_type == 'mouse':
+        button_obj = resolver.resolve_button(button)
+        if action == 'pressed':
+            ops = ((OP_MOVE, (x, y)), (OP_PRESS, (button_obj,)))
+            message = f"Mouse {mod_text}{button} pressed at ({x}, {y})"
+        else:
+            ops = ((OP_MOVE, (x, y)), (OP_RELEASE, (button_obj,)))
+            message = f"Mouse {mod_text}{button} released at ({x}, {y})"
+
+    elif event_type == 'mouse_drag':
+        ops = ((OP_MOVE, (x, y)),)
+        message = f"Mouse {mod_text}{button} dragged to ({x}, {y})"
+
+    elif event_type == 'mouse_move':
+        ops = ((OP_MOVE, (x, y)),)
+        message = f"Mouse moved to ({x}, {y})"
+
+    elif event_type == 'mouse_drag_end':
+        ops = ((OP_MOVE, (a, b)),)
+        message = (f"Mouse {mod_text}{button} drag ended from "
+                   f"({x}, {y}) to ({a}, {b})")
+
+    elif event_type == 'mouse_scroll':
+        ops = ((OP_MOVE, (x, y)), (OP_SCROLL, (a, b)))
+        direction = 'down' if b < 0 else 'up'
+        message = f"Mouse {mod_text}scrolled {direction} at ({x}, {y})"
+
+    elif event_type == 'sync':
+        # 先把光标移到点击位置，悬停时才会变化的画面(按钮高亮等)才能与录制时一致
+        ops = ((OP_MOVE, (x, y)), (OP_SYNC, (x, y, a, b, key)))
+        message = f"Sync {a}x{b} at ({x}, {y})"
+
+    elif event_type == 'keyboard':
+        if key_display is None:
+            key_display = str(key)
+        key_obj = resolver.resolve_key(key)
+        mod_objs = [resolver.resolve_modifier(mod) for mod in modifiers]
+        mod_objs = [mod for mod in mod_objs if mod is not None]
+
+        if action == 'pressed':
+            # 先按下修饰键，再按下主键
+            ops = tuple((OP_KEY_PRESS, (mod,)) for mod in mod_objs) + ((OP_KEY_PRESS, (key_obj,)),)
+            message = f"Key pressed: {key_display}"
+        else:
+            # 先释放主键，再释放修饰键
+            ops = ((OP_KEY_RELEASE, (key_obj,)),) + tuple((OP_KEY_RELEASE, (mod,)) for mod in mod_objs)
+            message = f"Key released: {key_display}"
+
+    else:
+        return None
+
+    return (timestamp, event_type, ops, message)
+
+
+class ModifierTracker:
+    """跟踪回放时已按下的修饰键，只生成真正发生变化的按下与释放操作"""
+
+    def __init__(self, resolver, held=()):
+        self.resolver = resolver
+        self.held = list(held)
+
+    def sync(self, target):
+        """生成把已按下的修饰键变为 target 所需的操作"""
+        ops = []
+        for mod in reversed(self.held):
+            if mod not in target:
+                mod_obj = self.resolver.resolve_modifier(mod)
+                if mod_obj is not None:
+                    ops.append((OP_KEY_RELEASE, (mod_obj,)))
+        for mod in target:
+            if mod not in self.held:
+                mod_obj = self.resolver.resolve_modifier(mod)
+                if mod_obj is not None:
+                    ops.append((OP_KEY_PRESS, (mod_obj,)))
+
+        self.held = [mod for mod in self.held if mod in target] + \
+                    [mod for mod in target if mod not in self.held]
+        return tuple(ops)
+
+
+def is_plain_char(event):
+    """是否为可以合并成连续输入的普通字符按键(最多带 shift)"""
+    if event['type'] != 'keyboard':
+        return False
+    key = event.get('key')
+    return (isinstance(key, str) and len(key) == 1 and key.isprintable()
+            and set(event.get('modifiers', [])) <= {'shift'})
+
+
+def coalesce_event(event, resolver, tracker):
+    """编译单个事件，修饰键只在状态变化时按下或释放"""
+    step = compile_event(event, resolver)
+    if step is None:
+        return None
+    t, event_type, ops, message = step
+
+    if event_type == 'sync':
+        return step
+    if event_type == 'keyboard':
+        key_obj = resolver.resolve_key(event['key'])
+        modifiers = event.get('modifiers', [])
+        if event['event'] == 'pressed':
+            ops = tracker.sync(modifiers) + ((OP_KEY_PRESS, (key_obj,)),)
+        else:
+            ops = ((OP_KEY_RELEASE, (key_obj,)),) + tracker.sync(modifiers)
+    else:
+        # 鼠标事件回放时不带修饰键，与未合并时的行为一致
+        ops = tracker.sync([]) + ops
+
+    return (t, event_type, ops, message)
+
+
+def compile_typing_run(run, resolver, tracker):
+    """把一段连续的字符按键合并为一次输入，无法合并的部分逐个编译"""
+    pressed = {}
+    text = []
+    balanced = 0
+    balanced_text = ''
+
+    for i, event in enumerate(run):
+        key = event['key']
+        if event['event'] == 'pressed':
+            pressed[key] = pressed.get(key, 0) + 1
+            text.append(key)
+        else:
+            if not pressed.get(key):
+                break  # 释放了在这段之前按下的键
+            pressed[key] -= 1
+            if not pressed[key]:
+                del pressed[key]
+        if not pressed:
+            balanced = i + 1
+            balanced_text = ''.join(text)
+
+    steps = []
+    if len(balanced_text) >= 2:
+        ops = tracker.sync([]) + ((OP_TYPE, (balanced_text,)),)
+        steps.append((run[0]['timestamp'], 'keyboard', ops, f"Typed: {balanced_text}"))
+        run = run[balanced:]
+
+    for event in run:
+        step = coalesce_event(event, resolver, tracker)
+        if step is not None:
+            steps.append(step)
+    return steps
+
+
+def iter_coalesced(events, resolver, batch_typing=False, typing_max_gap=0.5, held_modifiers=()):
+    """生成合并修饰键(以及可选的连续输入)后的回放步骤
+
+    held_modifiers 为开始时已按下的修饰键(例如定位回放时先恢复的状态)。
+    """
+    tracker = ModifierTracker(resolver, held_modifiers)
+    run = []
+    last_time = 0
+
+    for event in events:
+        last_time = event['timestamp']
+
+        if batch_typing and is_plain_char(event):
+            if run and event['timestamp'] - run[-1]['timestamp'] > typing_max_gap:
+                yield from compile_typing_run(run, resolver, tracker)
+                run = []
+            run.append(event)
+            continue
+
+        if run:
+            yield from compile_typing_run(run, resolver, tracker)
+            run = []
+
+        step = coalesce_event(event, resolver, tracker)
+        if step is not None:
+            yield step
+
+    if run:
+        yield from compile_typing_run(run, resolver, tracker)
+
+    # 回放结束时释放仍按着的修饰键
+    if tracker.held:
+        yield (last_time, 'keyboard', tracker.sync([]), "Modifiers released")
+
+
+def iter_plan(events, backend=None, coalesce_modifiers=False, batch_typing=False,
+              held_modifiers=()):
+    """逐个编译事件，生成回放步骤
+
+    backend 为 None 时生成不依赖后端的可移植计划，可稍后用 resolve_plan 绑定到后端。
+    coalesce_modifiers 为 True 时跨事件跟踪修饰键，只在状态变化时按下或释放；
+    batch_typing 为 True 时把连续的普通字符按键合并为一次输入(同时启用修饰键合并)。
+    held_modifiers 为回放开始时已按下的修饰键名，合并修饰键时会在需要时释放它们。
+    """
+    resolver = backend if backend is not None else NameResolver()
+
+    if coalesce_modifiers or batch_typing:
+        yield from iter_coalesced(events, resolver, batch_typing, held_modifiers=held_modifiers)
+        return
+
+    if hasattr(events, 'iter_fields'):
+        # 列式事件序列直接按字段编译，不生成事件字典
+        for fields in events.iter_fields():
+            step = compile_fields(*fields, resolver)
+            if step is not None:
+                yield step
+        return
+
+    for event in events:
+        step = compile_event(event, resolver)
+        if step is not None:
+            yield step
+
+
+def compile_plan(events, backend=None, **options):
+    """一次性把录制事件编译成回放步骤列表"""
+    return list(iter_plan(events, backend, **options))
+
+
+class TimelineCompressor:
+    """压缩回放时间线中的空闲间隔
+
+    超过 idle_threshold 的间隔(通常是人的思考时间)被缩短为 max_idle，
+    较短的间隔(拖拽、连击等手势内部的节奏)保持不变。
+    指定 min_gap 时为最大吞吐模式：所有间隔都替换为 min_gap。
+    saved 为目前为止相对原时间线节省的时间(录制时间，秒)。
+    """
+
+    def __init__(self, idle_threshold=2.0, max_idle=0.5, min_gap=None):
+        self.idle_threshold = idle_threshold
+        self.max_idle = max_idle
+        self.min_gap = min_gap
+        self.saved = 0.0
+
+    def compress_gap(self, gap):
+        if gap <= 0:
+            return gap
+        if self.min_gap is not None:
+            return self.min_gap
+        if gap > self.idle_threshold:
+            return self.max_idle
+        return gap
+
+    def apply(self, steps):
+        """生成时间戳已压缩的步骤"""
+        last_original = 0.0
+        current = 0.0
+        for t, event_type, ops, message in steps:
+            current += self.compress_gap(t - last_original)
+            last_original = t
+            self.saved = t - current
+            yield (current, event_type, ops, message)
+
+
+def count_ops(steps):
+    """统计计划中要发出的输入操作数"""
+    return sum(len(ops) for _, _, ops, _ in steps)
+
+
+def resolve_plan(steps, backend):
+    """把可移植计划中的按钮名、键值转换为后端对象"""
+    for t, event_type, ops, message in steps:
+        resolved = []
+        for op, args in ops:
+            if op in (OP_PRESS, OP_RELEASE):
+                args = (backend.resolve_button(args[0]),)
+            elif op in (OP_KEY_PRESS, OP_KEY_RELEASE):
+                args = (backend.resolve_key(args[0]),)
+            resolved.append((op, args))
+        yield (t, event_type, tuple(resolved), message)
+
+
+def plan_cache_path(filename):
+    """回放计划缓存文件与录制文件放在一起"""
+    return filename + PLAN_SUFFIX
+
+
+def load_plan(filename, backend, **options):
+    """读取录制文件的回放计划，缓存有效时直接使用缓存，跳过解析与编译
+
+    options 为 iter_plan 的编译选项。缓存以 JSON 保存可移植计划(操作码与按钮名、键名)，
+    读取后再绑定到后端，缓存文件中只有数据，不会被当作代码执行。
+    """
+    stat = os.stat(filename)
+    signature = [PLAN_VERSION, stat.st_mtime_ns, stat.st_size,
+                 [[name, value] for name, value in sorted(options.items())]]
+    cache_file = plan_cache_path(filename)
+
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('signature') == signature:
+            steps = [(t, event_type, tuple((op, tuple(args)) for op, args in ops), message)
+                     for t, event_type, ops, message in cached['steps']]
+            return list(resolve_plan(steps, backend))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+    steps = compile_plan(load_events(filename), None, **options)
+
+    # 先写临时文件再替换，多个进程同时回放同一文件时不会读到写了一半的缓存
+    temp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature, 'steps': steps}, f, ensure_ascii=False,
+                      separators=(',', ':'))
+        os.replace(temp_file, cache_file)
+    except (OSError, TypeError, ValueError):
+        # 缓存写入失败不影响回放
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+    return list(resolve_plan(steps, backend))
@@ -0,0 +1,163 @@
+import time
+
+from playplan import (OP_KEY_PRESS, OP_KEY_RELEASE, OP_MOVE, OP_PRESS, OP_RELEASE, OP_SCROLL,
+                      OP_TYPE)
+
+# 操作码对应的输入设备
+OP_DEVICES = {
+    OP_MOVE: 'mouse',
+    OP_PRESS: 'mouse',
+    OP_RELEASE: 'mouse',
+    OP_SCROLL: 'mouse',
+    OP_KEY_PRESS: 'keyboard',
+    OP_KEY_RELEASE: 'keyboard',
+    OP_TYPE: 'keyboard',
+}
+
+# 默认每秒最多发出的输入事件数
+DEFAULT_RATES = {'mouse': 1000.0, 'keyboard': 500.0}
+
+
+class TokenBucket:
+    """令牌桶: 以 rate 每秒的速度补充令牌，最多积累 burst 个
+
+    空闲之后允许最多 burst 个事件连续发出，持续的高频事件被限制在 rate 以内。
+    """
+
+    def __init__(self, rate, burst, clock=time.perf_counter):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, count, now):
+        """还需要等待多少秒才有 count 个令牌"""
+        self.refill(now)
+        missing = min(count, self.burst) - self.tokens
+        # 忽略浮点误差造成的极小缺口，否则可能反复等待一个无法推进时钟的时长
+        return missing / self.rate if missing > 1e-9 else 0.0
+
+    def take(self, count):
+        self.tokens -= count
+
+
+class RateGovernor:
+    """回放时按设备限制输入事件的发送速率
+
+    rates 为 {设备: 每秒事件数}，burst 为允许连续发出的事件数。adaptive 为 True 时
+    记录每次控制器调用的耗时，平滑后的耗时超过 latency_target 说明系统输入队列已经
+    饱和，速率按 backoff 倍数下降(最低 min_scale)；恢复正常后逐步回升。
+    """
+
+    def __init__(self, rates=None, burst=20, adaptive=False, latency_target=0.002,
+                 backoff=0.7, recovery=0.02, min_scale=0.1, max_wait=0.05,
+                 clock=time.perf_counter, sleep=time.sleep):
+        rates = dict(DEFAULT_RATES if rates is None else rates)
+        for device, rate in rates.items():
+            if not rate > 0:
+                raise ValueError(f"{device} 的速率必须大于 0 (每秒事件数)，当前为 {rate}")
+        if not burst >= 1:
+            raise ValueError(f"burst 至少为 1，当前为 {burst}")
+        if not 0 < min_scale <= 1:
+            raise ValueError(f"min_scale 必须在 (0, 1] 之间，当前为 {min_scale}")
+        self.buckets = {device: TokenBucket(rate, burst, clock) for device, rate in rates.items()}
+        self.rates = rates
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.recovery = recovery
+        self.min_scale = min_scale
+        self.max_wait = max_wait    # 单次 sleep 上限，保证能及时响应停止
+        self.clock = clock
+        self.sleep = sleep
+        self.scale = 1.0
+        self.latency = None         # 控制器调用耗时的指数平均(秒/次)
+        self.events = {device: 0 for device in rates}
+        self.delayed = 0
+        self.delay_total = 0.0
+        self.delay_max = 0.0
+        self.backoffs = 0
+        self.started = None
+
+    def demand(self, ops):
+        """一步中每个设备需要的令牌数，连续输入的文本按字符计算"""
+        demand = {}
+        for op, args in ops:
+            device = OP_DEVICES.get(op)
+            if device in self.buckets:
+                count = len(args[0]) if op == OP_TYPE else 1
+                demand[device] = demand.get(device, 0) + count
+        return demand
+
+    def throttle(self, ops, should_stop=None):
+        """等待直到每个设备都有足够的令牌，返回等待的秒数，被停止时返回 None"""
+        clock = self.clock
+        now = clock()
+        if self.started is None:
+            self.started = now
+        demand = self.demand(ops)
+        if not demand:
+            return 0.0
+
+        began = now
+        while True:
+            wait = max(self.buckets[device].delay(count, now) for device, count in demand.items())
+            if wait <= 0:
+                break
+            if should_stop and should_stop():
+                return None
+            self.sleep(min(wait, self.max_wait))
+            now = clock()
+
+        for device, count in demand.items():
+            self.buckets[device].take(count)
+            self.events[device] += count
+
+        waited = now - began
+        if waited > 0:
+            self.delayed += 1
+            self.delay_total += waited
+            self.delay_max = max(self.delay_max, waited)
+        return waited
+
+    def observe(self, call_count, duration):
+        """反馈模式: 记录一步中控制器调用的总耗时，据此调整速率"""
+        if not self.adaptive or not call_count:
+            return
+        per_call = duration / call_count
+        self.latency = per_call if self.latency is None else 0.8 * self.latency + 0.2 * per_call
+
+        if self.latency > self.latency_target:
+            scale = max(self.min_scale, self.scale * self.backoff)
+            if scale < self.scale:
+                self.backoffs += 1
+                # 平均值需要重新积累，避免同一次饱和连续触发多次降速
+                self.latency = self.latency_target
+        else:
+            scale = min(1.0, self.scale + self.recovery)
+        if scale != self.scale:
+            self.scale = scale
+            for device, bucket in self.buckets.items():
+                bucket.refill(self.clock())
+                bucket.rate = self.rates[device] * scale
+
+    def summary(self):
+        """各设备的实际吞吐量与被延迟的事件统计"""
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        return {
+            'elapsed': elapsed,
+            'events': dict(self.events),
+            'throughput': {device: count / elapsed if elapsed > 0 else 0.0
+                           for device, count in self.events.items()},
+            'delayed': self.delayed,
+            'delay_total': self.delay_total,
+            'delay_max_ms': self.delay_max * 1000,
+            'dropped': 0,           # 限速只延迟事件，不会丢弃
+            'scale': self.scale,
+            'backoffs': self.backoffs,
+        }
@@ -0,0 +1,426 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+# 流式录制文件(换行分隔 JSON)的格式标识
+NDJSON_FORMAT = 'autorecorder-ndjson'
+NDJSON_VERSION = 1
+
+# 各种格式录制文件的文件名模式
+RECORDING_PATTERNS = ('recording_*.json', 'recording_*.jsonl', 'recording_*.arb', 'recording_*.segs')
+
+
+class RecordingWriter:
+    """后台写入线程：录制过程中把事件逐行追加到文件
+
+    文件第一行为头部(格式、版本、开始时间)，随后每行一个事件，
+    结束时写入尾部(事件数、结束时间)。即使进程崩溃，已刷新的事件也不会丢失。
+    写入线程出错(磁盘已满等)后 failed 为 True，之后的 write 与 close 抛出该错误。
+    convert 不为 None 时，提交的事件在写入线程中经它转换为事件字典后再写入。
+    """
+
+    def __init__(self, filename, start_time, queue_size=10000, flush_interval=0.5, convert=None):
+        self.filename = filename
+        self.start_time = start_time
+        self.flush_interval = flush_interval
+        self.convert = convert
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.event_count = 0
+        self.failed = False
+        self.error = None
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        """写入头部并启动写入线程"""
+        self._file = open(self.filename, 'w', encoding='utf-8')
+        self._write_line({
+            'format': NDJSON_FORMAT,
+            'version': NDJSON_VERSION,
+            'start_time': self.start_time
+        })
+        self._file.flush()
+
+        self._thread = threading.Thread(target=self._run, name='RecordingWriter', daemon=True)
+        self._thread.start()
+
+    def write(self, event):
+        """提交一个事件，队列满时等待写入线程，写入线程已出错时抛出该错误"""
+        if not self._put(event):
+            raise self.error
+
+    def _put(self, item):
+        """放入队列，写入线程已出错时返回 False"""
+        # 分段等待，写入线程出错退出后不会在已满的队列上永远阻塞
+        while not self.failed:
+            try:
+                self.queue.put(item, timeout=self.flush_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def close(self):
+        """写完剩余事件并写入尾部，返回事件总数；写入线程出错时抛出该错误"""
+        if self._thread is None:
+            return self.event_count
+
+        self._put(None)
+        self._thread.join()
+        self._thread = None
+
+        try:
+            if self.failed:
+                raise self.error
+            self._write_line({
+                'footer': True,
+                'event_count': self.event_count,
+                'end_time': time.time()
+            })
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        return self.event_count
+
+    def _write_line(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _run(self):
+        try:
+            self._write_events()
+        except Exception as e:
+            self.error = e
+            self.failed = True
+
+    def _write_events(self):
+        last_flush = time.monotonic()
+        done = False
+
+        while not done:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+
+            # 一次取出队列中已有的所有事件，批量写入
+            while batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            convert = self.convert
+            for event in batch:
+                if event is None:
+                    done = True
+                    break
+                self._write_line(convert(event) if convert else event)
+                self.event_count += 1
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = now
+
+        self._file.flush()
+
+
+def find_recordings(directory='.'):
+    """列出目录中的所有录制文件"""
+    files = []
+    for pattern in RECORDING_PATTERNS:
+        files.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(os.path.normpath(f) for f in files)
+
+
+def is_ndjson(filename):
+    """判断文件是否为流式录制格式"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        return False
+    return isinstance(header, dict) and header.get('format') == NDJSON_FORMAT
+
+
+def load_ndjson(filename):
+    """读取流式录制文件，返回 (头部, 事件列表)
+
+    没有尾部或最后一行不完整(录制时进程崩溃)的文件也能读取。
+    """
+    header = None
+    events = []
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 只可能是崩溃时写了一半的最后一行
+                break
+            if header is None:
+                header = record
+            elif 'footer' in record:
+                break
+            else:
+                events.append(record)
+
+    return header, events
+
+
+def iter_ndjson(filename):
+    """逐行读取流式录制文件中的事件"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        header_seen = False
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的最后一行
+                return
+            if not header_seen:
+                header_seen = True
+                continue
+            if 'footer' in record:
+                return
+            yield record
+
+
+def iter_legacy_json(filename, chunk_size=65536):
+    """增量解析旧格式 {"start_time": ..., "events": [...]}，逐个生成事件
+
+    只在内存中保留尚未解析完的一小段文本，不需要先读入整个文件。
+    """
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\r\n'
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill():
+            # 读入下一块数据，丢弃已解析的部分，返回是否读到了新数据
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in whitespace:
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        def expect(char):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] != char:
+                raise ValueError(f"录制文件格式错误: 期望 {char!r}")
+            pos += 1
+
+        def decode():
+            # 解析一个完整的值，数据不完整时继续读入
+            nonlocal pos
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if fill():
+                        continue
+                    raise
+                # 数字可能恰好在块边界被截断(如 "12" 或 "1.")，需要读到数字之后的字符再确认
+                if (isinstance(value, (int, float)) and not eof
+                        and (end == len(buffer) or buffer[end] in '0123456789.eE+-')
+                        and fill()):
+                    continue
+                pos = end
+                return value
+
+        expect('{')
+        while True:
+            skip_whitespace()
+            if pos < len(buffer) and buffer[pos] == '}':
+                return
+            key = decode()
+            expect(':')
+            if key != 'events':
+                decode()
+            else:
+                expect('[')
+                skip_whitespace()
+                if buffer[pos:pos + 1] == ']':
+                    pos += 1
+                else:
+                    while True:
+                        yield decode()
+                        skip_whitespace()
+                        if buffer[pos:pos + 1] == ',':
+                            pos += 1
+                            continue
+                        expect(']')
+                        break
+            skip_whitespace()
+            if buffer[pos:pos + 1] == ',':
+                pos += 1
+
+
+def iter_events(filename):
+    """逐个生成录制文件中的事件，兼容所有录制格式"""
+    from binformat import BinaryRecording, is_binary
+    from segstore import SegmentedRecording, is_manifest
+
+    if is_binary(filename):
+        with BinaryRecording(filename) as recording:
+            yield from recording
+    elif is_manifest(filename):
+        yield from SegmentedRecording(filename)
+    elif is_ndjson(filename):
+        yield from iter_ndjson(filename)
+    else:
+        yield from iter_legacy_json(filename)
+
+
+def read_ahead(iterable, size=4096, batch_size=256):
+    """在后台线程中预先读取最多 size 个元素，边读边生成
+
+    读取与解析不再阻塞使用方，预读的数量有上限，内存占用不会随文件大小增长。
+    """
+    batches = queue.Queue(maxsize=max(1, size // batch_size))
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        batch = []
+        try:
+            for item in iterable:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, name='ReadAhead', daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        stopped.set()
+
+
+def stream_events(filename, readahead=4096):
+    """以有界预读的方式流式读取录制文件，可以直接交给 play_events"""
+    return read_ahead(iter_events(filename), readahead)
+
+
+def read_recording(filename):
+    """读取录制文件，返回 (开始时间, 事件列表)，兼容所有录制格式"""
+    from binformat import BinaryRecording, is_binary
+    from segstore import SegmentedRecording, is_manifest
+
+    if is_binary(filename):
+        with BinaryRecording(filename) as recording:
+            return recording.start_time, list(recording)
+
+    if is_manifest(filename):
+        recording = SegmentedRecording(filename)
+        return recording.start_time, list(recording)
+
+    if is_ndjson(filename):
+        header, events = load_ndjson(filename)
+        return header.get('start_time'), events
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+        return data.get('start_time'), data['events']
+
+
+def load_events(filename):
+    """读取录制文件中的事件列表
+
+    二进制格式通过 mmap 直接映射，返回可索引、可迭代的 BinaryRecording；
+    分段清单返回由共享分段拼接成的 SegmentedRecording；文本格式返回事件字典列表。
+    """
+    from binformat import BinaryRecording, is_binary
+    from segstore import SegmentedRecording, is_manifest
+
+    if is_binary(filename):
+        return BinaryRecording(filename)
+    if is_manifest(filename):
+        return SegmentedRecording(filename)
+    return read_recording(filename)[1]
+
+
+def save_recording(filename, events, start_time=None):
+    """按扩展名保存录制文件: .arb 为二进制格式，.jsonl 为流式格式，
+    .segs 为引用共享分段的清单，其它为旧的 JSON 格式"""
+    if filename.endswith('.segs'):
+        from segstore import save_segmented
+        return save_segmented(filename, events, start_time)[0]
+
+    if filename.endswith('.arb'):
+        from binformat import write_binary
+        return write_binary(filename, events, start_time)
+
+    if filename.endswith('.jsonl'):
+        count = 0
+        with open(filename, 'w', encoding='utf-8') as f:
+            def write_line(record):
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+            write_line({'format': NDJSON_FORMAT, 'version': NDJSON_VERSION, 'start_time': start_time})
+            for event in events:
+                write_line(event)
+                count += 1
+            write_line({'footer': True, 'event_count': count, 'end_time': time.time()})
+        return count
+
+    events = list(events)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            'start_time': start_time,
+            'events': events
+        }, f, indent=2, ensure_ascii=False)
+    return len(events)
@@ -0,0 +1,85 @@
+import time
+
+
+class DeadlineScheduler:
+    """基于单调时钟的绝对截止时间调度器
+
+    每个事件的触发时刻为 start + timestamp / speed，而不是在上一个事件
+    执行完之后再睡眠一个间隔，因此控制器调用和打印的耗时不会累积成漂移。
+    等待时先用粗粒度 sleep 接近截止时间，最后一小段用自旋等待补齐精度。
+    """
+
+    def __init__(self, speed=1.0, spin_window=0.002, max_sleep=0.05,
+                 clock=time.perf_counter, sleep=time.sleep):
+        self.speed = speed
+        self.spin_window = spin_window  # 截止前多久切换为自旋等待
+        self.max_sleep = max_sleep      # 单次 sleep 上限，保证能及时响应停止
+        self.clock = clock
+        self.sleep = sleep
+        self.start_time = None
+        self.lateness = []
+
+    def start(self):
+        """以当前时刻作为回放时间线的起点"""
+        self.start_time = self.clock()
+        self.lateness = []
+        return self.start_time
+
+    def deadline(self, timestamp):
+        """计算某个录制时间戳对应的绝对截止时间"""
+        return self.start_time + timestamp / self.speed
+
+    def rebase(self, timestamp):
+        """把时间线平移到以当前时刻为 timestamp 的位置，例如屏幕同步点匹配之后"""
+        self.start_time = self.clock() - timestamp / self.speed
+
+    def wait(self, timestamp, should_stop=None):
+        """等待到时间戳对应的截止时间，返回触发时的延迟(秒)
+
+        should_stop 为可选的回调，返回 True 时立即中断等待并返回 None。
+        """
+        target = self.deadline(timestamp)
+        clock = self.clock
+
+        # 粗粒度睡眠，留出自旋窗口
+        while True:
+            remaining = target - clock() - self.spin_window
+            if remaining <= 0:
+                break
+            if should_stop and should_stop():
+                return None
+            self.sleep(min(remaining, self.max_sleep))
+
+        # 自旋等待到精确的截止时间
+        while clock() < target:
+            pass
+
+        late = clock() - target
+        self.lateness.append(late)
+        return late
+
+    def summary(self):
+        """汇总每个事件的触发延迟"""
+        return summarize_lateness(self.lateness)
+
+
+def summarize_lateness(lateness):
+    """把延迟列表汇总为平均值、最大值与分位数(单位: 毫秒)"""
+    if not lateness:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0,
+                'p99_ms': 0.0, 'max_ms': 0.0}
+
+    ordered = sorted(lateness)
+    n = len(ordered)
+
+    def pick(q):
+        return ordered[min(n - 1, int(q * n))] * 1000
+
+    return {
+        'count': n,
+        'mean_ms': sum(ordered) / n * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
@@ -0,0 +1,226 @@
+import collections
+import hashlib
+import threading
+import time
+
+# 录制时在点击位置周围截取的正方形区域边长(像素)
+DEFAULT_REGION_SIZE = 32
+
+# 回放时等待同步点匹配的默认最长时间(秒)
+DEFAULT_SYNC_TIMEOUT = 2.0
+
+
+def region_hash(pixels):
+    """屏幕区域像素数据的短哈希"""
+    return hashlib.blake2b(pixels, digest_size=8).hexdigest()
+
+
+def region_around(x, y, size, screen_size):
+    """以 (x, y) 为中心、边长为 size 的区域，限制在屏幕范围内，返回 (left, top, width, height)"""
+    return region_at(x, y, size, size, screen_size)
+
+
+def region_at(x, y, width, height, screen_size):
+    """以 (x, y) 为中心、大小为 width x height 的区域，限制在屏幕范围内"""
+    screen_width, screen_height = screen_size
+    width = min(width, screen_width)
+    height = min(height, screen_height)
+    left = min(max(int(x) - width // 2, 0), screen_width - width)
+    top = min(max(int(y) - height // 2, 0), screen_height - height)
+    return left, top, width, height
+
+
+class FakeFramebuffer:
+    """内存中的假屏幕(RGB)，用于无显示环境下的测试
+
+    每次写入 version 加一，RegionSampler 据此判断缓存的区域哈希是否仍然有效。
+    """
+
+    def __init__(self, width=1920, height=1080, color=(0, 0, 0)):
+        self.size = (width, height)
+        self.pixels = bytearray(bytes(color) * (width * height))
+        self.version = 0
+        self.grabs = 0
+        self._lock = threading.Lock()
+
+    def fill(self, left, top, width, height, color):
+        """用纯色填充一个矩形区域"""
+        screen_width = self.size[0]
+        row = bytes(color) * width
+        with self._lock:
+            for y in range(top, top + height):
+                start = (y * screen_width + left) * 3
+                self.pixels[start:start + width * 3] = row
+            self.version += 1
+
+    def grab(self, left, top, width, height):
+        screen_width = self.size[0]
+        with self._lock:
+            self.grabs += 1
+            return b''.join(
+                bytes(self.pixels[(y * screen_width + left) * 3:(y * screen_width + left + width) * 3])
+                for y in range(top, top + height))
+
+
+class MssScreen:
+    """通过 mss 截取真实屏幕(也可以是 Xvfb 显示)的区域
+
+    mss 的截图句柄不能跨线程使用，每个线程各自创建一个。
+    """
+
+    def __init__(self):
+        import mss
+
+        self._mss_module = mss
+        self._local = threading.local()
+        monitor = self._handle().monitors[0]
+        self.origin = (monitor['left'], monitor['top'])
+        self.size = (monitor['width'], monitor['height'])
+
+    def _handle(self):
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = self._local.handle = self._mss_module.mss()
+        return handle
+
+    def grab(self, left, top, width, height):
+        shot = self._handle().grab({'left': self.origin[0] + left, 'top': self.origin[1] + top,
+                                    'width': width, 'height': height})
+        return shot.raw
+
+
+class RegionSampler:
+    """带缓存的区域哈希
+
+    屏幕源有 version 属性时(如 FakeFramebuffer)，内容未变化就直接返回缓存的哈希；
+    否则同一区域在 max_age 秒内只截取一次，高频轮询时不会重复截图。
+    """
+
+    def __init__(self, source, max_age=0.002, clock=time.perf_counter):
+        self.source = source
+        self.max_age = max_age
+        self.clock = clock
+        self.cache = {}
+
+    def hash(self, left, top, width, height):
+        region = (left, top, width, height)
+        version = getattr(self.source, 'version', None)
+        now = self.clock()
+        cached = self.cache.get(region)
+        if cached is not None:
+            stamp, cached_version, digest = cached
+            if version is not None:
+                if cached_version == version:
+                    return digest
+            elif now - stamp < self.max_age:
+                return digest
+
+        digest = region_hash(self.source.grab(left, top, width, height))
+        self.cache[region] = (now, version, digest)
+        return digest
+
+
+class CursorRegionWatcher:
+    """录制时在后台线程中持续截取光标周围的区域
+
+    按下鼠标时系统已经处理了点击(按钮高亮、菜单展开)，此时再截图与回放时点击前的
+    画面不一致。这里保留最近的若干次截图，按下时使用光标位于同一位置、且在按下之前
+    截取完成的最后一次；光标刚移动过来还没有截图时返回 None。
+    """
+
+    def __init__(self, source, size=DEFAULT_REGION_SIZE, interval=0.02, history=100,
+                 clock=time.time):
+        self.source = source
+        self.size = size
+        self.interval = interval
+        self.clock = clock
+        self.position = None
+        # (截图完成时间, 光标位置, (left, top, width, height, 哈希))，处理线程落后时
+        # 按下之后的截图也会进来，需要往前找
+        self.samples = collections.deque(maxlen=history)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def move(self, x, y):
+        """更新光标位置，可以在监听线程中直接调用"""
+        self.position = (x, y)
+
+    def sample(self):
+        """截取当前光标位置周围的区域"""
+        position = self.position
+        if position is None:
+            return
+        left, top, width, height = region_around(position[0], position[1], self.size,
+                                                 self.source.size)
+        digest = region_hash(self.source.grab(left, top, width, height))
+        self.samples.append((self.clock(), position, (left, top, width, height, digest)))
+
+    def region_before(self, x, y, timestamp):
+        """光标位于 (x, y) 且在 timestamp 之前完成的最近一次截图，没有时返回 None"""
+        for finished, position, region in reversed(list(self.samples)):
+            if finished <= timestamp:
+                return region if position == (x, y) else None
+        return None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='CursorRegionWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception:
+                # 截图偶尔失败时等待下一次
+                pass
+            self._stop.wait(self.interval)
+
+
+class ScreenSync:
+    """回放时的屏幕同步点: 等到区域内容与录制时一致后立即继续
+
+    超过 timeout 仍不一致时放弃等待并继续回放，并计入 timeouts。
+    """
+
+    def __init__(self, source, poll_interval=0.002, timeout=DEFAULT_SYNC_TIMEOUT,
+                 clock=time.perf_counter,
+                 sleep=time.sleep):
+        self.sampler = RegionSampler(source, poll_interval, clock)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.matched = 0
+        self.timeouts = 0
+        self.waited = 0.0
+
+    def wait_at(self, x, y, width, height, expected, should_stop=None):
+        """等待以点击位置 (x, y) 为中心的区域哈希等于 expected，返回值同 wait"""
+        left, top, width, height = region_at(x, y, width, height, self.sampler.source.size)
+        return self.wait(left, top, width, height, expected, should_stop)
+
+    def wait(self, left, top, width, height, expected, should_stop=None):
+        """等待区域哈希等于 expected，匹配返回 True，超时返回 False，被停止返回 None"""
+        clock = self.clock
+        started = clock()
+        deadline = started + self.timeout
+        try:
+            while True:
+                if self.sampler.hash(left, top, width, height) == expected:
+                    self.matched += 1
+                    return True
+                if should_stop and should_stop():
+                    return None
+                if clock() >= deadline:
+                    self.timeouts += 1
+                    return False
+                self.sleep(self.poll_interval)
+        finally:
+            self.waited += clock() - started
@@ -0,0 +1,323 @@
+import argparse
+import array
+import bisect
+import json
+import os
+
+from binformat import BinaryRecording, is_binary
+from playplan import (NameResolver, OP_KEY_PRESS, OP_KEY_RELEASE, OP_MOVE, OP_PRESS,
+                      iter_plan)
+from recformat import is_ndjson, iter_events as iter_recording
+
+INDEX_VERSION = 3
+INDEX_SUFFIX = '.idx'
+
+# 每隔多少个事件保存一次输入状态快照
+DEFAULT_INTERVAL = 1024
+
+
+class InputState:
+    """回放到某个位置时的输入状态: 鼠标位置、按住的按钮与按键
+
+    按键记录按下时的修饰键，回放时与 compile_event 一样先按修饰键再按主键。
+    """
+
+    def __init__(self, position=None, buttons=(), keys=()):
+        self.position = position
+        self.buttons = list(buttons)
+        self.keys = dict(keys)   # 键值 -> 按下时的修饰键
+
+    def apply(self, event):
+        event_type = event['type']
+        if event_type == 'sync':
+            return
+        if event_type == 'mouse_drag_end':
+            self.position = (event['end_x'], event['end_y'])
+        elif event_type != 'keyboard':
+            self.position = (event['x'], event['y'])
+
+        if event_type == 'mouse':
+            button = event['button']
+            if event['event'] == 'pressed':
+                if button not in self.buttons:
+                    self.buttons.append(button)
+            elif button in self.buttons:
+                self.buttons.remove(button)
+        elif event_type == 'keyboard':
+            key = event['key']
+            if event['event'] == 'pressed':
+                self.keys[key] = tuple(event.get('modifiers', ()))
+            else:
+                self.keys.pop(key, None)
+
+    def snapshot(self):
+        return (self.position, tuple(self.buttons), tuple(self.keys.items()))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        position, buttons, keys = snapshot
+        return cls(position, buttons, keys)
+
+    def held_modifiers(self):
+        """按住的按键按下时带的修饰键，按首次出现的顺序"""
+        held = []
+        for modifiers in self.keys.values():
+            for mod in modifiers:
+                if mod not in held:
+                    held.append(mod)
+        return held
+
+    def prelude(self, resolver):
+        """生成从空状态恢复到当前状态的操作: 移动鼠标、按下按住的键与按钮"""
+        ops = []
+        if self.position is not None:
+            ops.append((OP_MOVE, self.position))
+
+        pressed = []
+        for key, modifiers in self.keys.items():
+            for mod in modifiers:
+                if mod not in pressed:
+                    pressed.append(mod)
+                    mod_obj = resolver.resolve_modifier(mod)
+                    if mod_obj is not None:
+                        ops.append((OP_KEY_PRESS, (mod_obj,)))
+            ops.append((OP_KEY_PRESS, (resolver.resolve_key(key),)))
+
+        for button in self.buttons:
+            ops.append((OP_PRESS, (resolver.resolve_button(button),)))
+        return tuple(ops)
+
+
+def index_path(filename):
+    """索引文件与录制文件放在一起"""
+    return filename + INDEX_SUFFIX
+
+
+def _iter_ndjson_lines(filename, offset=None):
+    """逐行读取流式录制文件，生成 (行起始偏移, 事件)，offset 为 None 时从头部之后开始"""
+    with open(filename, 'rb') as f:
+        if offset is None:
+            f.readline()
+            offset = f.tell()
+        else:
+            f.seek(offset)
+        for line in f:
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的最后一行
+                return
+            if 'footer' in record:
+                return
+            yield start, record
+
+
+def _iter_binary(filename, start=0):
+    with BinaryRecording(filename) as recording:
+        for index in range(start, len(recording)):
+            yield recording[index]
+
+
+class SeekIndex:
+    """录制文件的时间与事件序号索引
+
+    timestamps 为全部事件的时间戳，按时间定位只需二分查找；每 interval 个事件保存一次
+    输入状态快照，流式格式还保存对应行的文件偏移。定位到任意事件时，从最近的快照开始
+    最多重放 interval 个事件即可恢复按住的修饰键、按键与鼠标按钮，不需要扫描前面的文件内容。
+    """
+
+    def __init__(self, kind, interval, timestamps, checkpoints, offsets=None):
+        self.kind = kind                # 'binary' / 'ndjson' / 'sequential'
+        self.interval = interval
+        self.timestamps = timestamps    # array('d')
+        self.checkpoints = checkpoints  # 第 k 个快照为前 k * interval 个事件之后的状态
+        self.offsets = offsets          # 流式格式中第 k * interval 个事件所在行的偏移
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def build(cls, filename, interval=DEFAULT_INTERVAL):
+        """扫描一遍录制文件建立索引"""
+        timestamps = array.array('d')
+        checkpoints = []
+        offsets = None
+        state = InputState()
+
+        if is_binary(filename):
+            kind = 'binary'
+            events = ((None, event) for event in _iter_binary(filename))
+        elif is_ndjson(filename):
+            kind = 'ndjson'
+            offsets = []
+            events = _iter_ndjson_lines(filename)
+        else:
+            kind = 'sequential'
+            events = ((None, event) for event in iter_recording(filename))
+
+        for index, (offset, event) in enumerate(events):
+            if index % interval == 0:
+                checkpoints.append(state.snapshot())
+                if offsets is not None:
+                    offsets.append(offset)
+            timestamps.append(event['timestamp'])
+            state.apply(event)
+
+        return cls(kind, interval, timestamps, checkpoints, offsets)
+
+    def find_time(self, timestamp):
+        """第一个时间戳不早于 timestamp 的事件序号"""
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def iter_events(self, filename, start):
+        """从第 start 个事件开始读取，流式格式直接跳到所在快照的文件偏移"""
+        checkpoint = start // self.interval
+        if self.kind == 'binary':
+            yield from _iter_binary(filename, start)
+            return
+
+        if self.kind == 'ndjson':
+            if checkpoint >= len(self.offsets):
+                return
+            events = (event for _, event in _iter_ndjson_lines(filename, self.offsets[checkpoint]))
+            skip = start - checkpoint * self.interval
+        else:
+            # 旧 JSON 格式与分段清单没有可以跳转的偏移，从头依次读取
+            events = iter_recording(filename)
+            skip = start
+
+        for event in events:
+            if skip:
+                skip -= 1
+                continue
+            yield event
+
+    def seek(self, filename, position):
+        """定位到第 position 个事件，返回 (该事件之前的输入状态, 从该事件开始的事件迭代器)"""
+        position = max(0, min(position, len(self)))
+        checkpoint = min(position // self.interval, len(self.checkpoints) - 1)
+        if checkpoint < 0:
+            return InputState(), iter(())
+
+        state = InputState.from_snapshot(self.checkpoints[checkpoint])
+        base = checkpoint * self.interval
+        events = self.iter_events(filename, base)
+        for _ in range(position - base):
+            state.apply(next(events))
+        return state, events
+
+    def save(self, filename, signature):
+        """原子地写入索引文件: 第一行为 JSON 头部(快照与偏移)，其后为时间戳数组"""
+        cache_file = index_path(filename)
+        temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        header = {
+            'signature': list(signature),
+            'kind': self.kind,
+            'interval': self.interval,
+            'count': len(self.timestamps),
+            'checkpoints': self.checkpoints,
+            'offsets': self.offsets,
+        }
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n')
+                self.timestamps.tofile(f)
+            os.replace(temp_file, cache_file)
+        except (OSError, TypeError, ValueError):
+            # 索引写入失败不影响回放
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+
+def _signature(filename, interval):
+    stat = os.stat(filename)
+    return (INDEX_VERSION, stat.st_mtime_ns, stat.st_size, interval)
+
+
+def load_index(filename, interval=DEFAULT_INTERVAL):
+    """读取录制文件的索引，索引不存在或录制文件已变化时重新建立并保存
+
+    索引文件只包含 JSON 头部与时间戳数组，读取时不会执行其中的任何内容。
+    """
+    signature = _signature(filename, interval)
+    try:
+        with open(index_path(filename), 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('signature') == list(signature):
+                timestamps = array.array('d')
+                timestamps.fromfile(f, header['count'])
+                # JSON 中的元组读回后为列表，恢复为快照原来的形式
+                checkpoints = [(tuple(position) if position is not None else None, tuple(buttons),
+                                tuple((key, tuple(modifiers)) for key, modifiers in keys))
+                               for position, buttons, keys in header['checkpoints']]
+                return SeekIndex(header['kind'], header['interval'], timestamps, checkpoints,
+                                 header['offsets'])
+    except (OSError, ValueError, KeyError, TypeError, EOFError, AttributeError):
+        pass
+
+    index = SeekIndex.build(filename, interval)
+    index.save(filename, signature)
+    return index
+
+
+def seek_plan(filename, backend=None, start_time=None, start_event=None, index=None, **options):
+    """从指定时间(秒)或事件序号开始的回放计划
+
+    第一步恢复被跳过部分遗留的输入状态(鼠标位置、按住的按键与按钮)，之后的时间戳
+    都减去起点事件的时间戳，回放立即从起点开始。options 为 iter_plan 的编译选项。
+    """
+    if index is None:
+        index = load_index(filename)
+    if start_event is not None:
+        position = start_event
+    elif start_time is not None:
+        position = index.find_time(start_time)
+    else:
+        position = 0
+    position = max(0, min(position, len(index)))
+
+    state, events = index.seek(filename, position)
+    origin = index.timestamps[position] if position < len(index) else 0.0
+
+    resolver = backend if backend is not None else NameResolver()
+    ops = state.prelude(resolver)
+    if position and ops:
+        yield (0.0, 'seek', ops, f"Seek to event {position} ({origin:.3f}s)")
+        if options.get('coalesce_modifiers') or options.get('batch_typing'):
+            # 合并修饰键时由跟踪器负责释放恢复阶段按下的修饰键
+            options['held_modifiers'] = state.held_modifiers()
+
+    last = 0.0
+    for timestamp, event_type, ops, message in iter_plan(events, backend, **options):
+        last = timestamp - origin
+        yield (last, event_type, ops, message)
+
+    if position and 'held_modifiers' not in options:
+        # 未合并修饰键时，恢复阶段按下的修饰键不一定有对应的释放操作，结束时统一释放
+        mod_objs = [resolver.resolve_modifier(mod) for mod in reversed(state.held_modifiers())]
+        release = tuple((OP_KEY_RELEASE, (mod,)) for mod in mod_objs if mod is not None)
+        if release:
+            yield (last, 'keyboard', release, "Modifiers released")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为录制文件建立定位索引')
+    parser.add_argument('recordings', nargs='+', help='录制文件')
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL,
+                        help=f'状态快照间隔(事件数)，默认 {DEFAULT_INTERVAL}')
+    args = parser.parse_args()
+
+    for filename in args.recordings:
+        index = load_index(filename, args.interval)
+        duration = index.timestamps[-1] if len(index) else 0.0
+        print(f"{filename}: 事件 {len(index)}, 时长 {duration:.1f}s, 快照 {len(index.checkpoints)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+import argparse
+import array
+import bisect
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+from binformat import COLUMNS, VERSION, BinaryRecording, ColumnarEvents, EventStore, write_binary
+
+# 分段录制清单: 录制文件只保存按内容哈希引用的分段列表，分段保存在共享的分段仓库中
+MANIFEST_FORMAT = 'autorecorder-segments'
+MANIFEST_VERSION = 1
+MANIFEST_PREFIX = ('{"format":"%s"' % MANIFEST_FORMAT).encode('utf-8')
+
+DEFAULT_STORE = 'segments'
+SEGMENT_SUFFIX = '.arb'
+
+# 分段仓库内登记的清单列表(每行一个绝对路径)，垃圾回收据此找到所有引用该仓库的清单
+REGISTRY_NAME = 'manifests.txt'
+
+# 仓库锁文件，保存录制与垃圾回收互斥，避免回收正在写入、尚未登记的分段
+LOCK_NAME = '.lock'
+
+# 垃圾回收跳过最近修改过的分段(秒)，兼容不使用仓库锁的旧版本写入
+DEFAULT_GRACE_PERIOD = 600.0
+
+# 超过该空闲间隔(秒)时切分为新的分段
+DEFAULT_SPLIT_GAP = 1.0
+
+
+def is_manifest(filename):
+    """判断文件是否为分段录制清单"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MANIFEST_PREFIX)) == MANIFEST_PREFIX
+
+
+def split_segments(events, split_gap=DEFAULT_SPLIT_GAP):
+    """在空闲间隔处切分事件，返回 [(分段起始时间, 分段事件)]，分段内时间戳相对于起始时间"""
+    segments = []
+    current = None
+    origin = last = None
+
+    for event in events:
+        timestamp = event['timestamp']
+        if current is None or timestamp - last > split_gap:
+            current = []
+            origin = timestamp
+            segments.append((origin, current))
+        relative = dict(event)
+        relative['timestamp'] = round(timestamp - origin, 6)
+        current.append(relative)
+        last = timestamp
+
+    return segments
+
+
+def segment_hash(events):
+    """分段内容的 SHA-256，相同的操作序列(含相对时间)得到相同的哈希"""
+    digest = hashlib.sha256()
+    for event in events:
+        digest.update(json.dumps(event, sort_keys=True, ensure_ascii=False,
+                                 separators=(',', ':')).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def segment_path(store, digest):
+    return os.path.join(store, digest[:2], digest + SEGMENT_SUFFIX)
+
+
+def write_segment(store, digest, events):
+    """写入分段，已存在时跳过，返回是否新写入"""
+    path = segment_path(store, digest)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    write_binary(temp_file, events, 0.0)
+    os.replace(temp_file, path)
+    return True
+
+
+def save_segmented(filename, events, start_time=None, store=None, split_gap=DEFAULT_SPLIT_GAP):
+    """以分段清单保存录制，返回 (事件数, 新写入的分段数, 复用的分段数)
+
+    store 默认为清单所在目录下的 segments 目录，清单中保存相对于清单的路径。
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    store = store or os.path.join(directory, DEFAULT_STORE)
+    segments = [(origin, segment_hash(segment), segment)
+                for origin, segment in split_segments(events, split_gap)]
+
+    references = []
+    written = reused = count = 0
+    # 分段写入、清单写入与登记在同一个仓库锁内完成，垃圾回收看不到未登记的分段
+    with store_lock(store):
+        for origin, digest, segment in segments:
+            if write_segment(store, digest, segment):
+                written += 1
+            else:
+                reused += 1
+            references.append({'hash': digest, 'offset': origin, 'count': len(segment)})
+            count += len(segment)
+
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'version': MANIFEST_VERSION,
+            'start_time': start_time,
+            'store': os.path.relpath(store, directory),
+            'event_count': count,
+            'segments': references,
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+        _register(store, filename)
+    return count, written, reused
+
+
+@contextlib.contextmanager
+def store_lock(store):
+    """独占仓库锁(跨进程)，保存录制、登记清单和垃圾回收都需要持有"""
+    os.makedirs(store, exist_ok=True)
+    with open(os.path.join(store, LOCK_NAME), 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍失败时抛出，继续等待
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def registry_path(store):
+    return os.path.join(store, REGISTRY_NAME)
+
+
+def registered_manifests(store):
+    """仓库中登记过的清单路径"""
+    try:
+        with open(registry_path(store), 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def register_manifest(store, filename):
+    """在仓库中登记引用它的清单，已登记时跳过"""
+    with store_lock(store):
+        _register(store, filename)
+
+
+def _register(store, filename):
+    """登记清单，调用者需持有仓库锁"""
+    path = os.path.abspath(filename)
+    if path in registered_manifests(store):
+        return
+    with open(registry_path(store), 'a', encoding='utf-8') as f:
+        f.write(path + '\n')
+
+
+def read_manifest(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"不支持的分段清单版本: {manifest.get('version')}")
+    directory = os.path.dirname(os.path.abspath(filename))
+    manifest['store'] = os.path.join(directory, manifest['store'])
+    return manifest
+
+
+class SegmentCache:
+    """热点分段缓存(LRU)
+
+    分段以列数组的形式常驻内存，许多录制共用的开头部分(登录、导航等)重复回放时
+    不需要再读取文件。多个线程可以同时使用。
+    """
+
+    def __init__(self, max_events=2000000):
+        self.max_events = max_events
+        self.segments = collections.OrderedDict()
+        self.total_events = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, store, digest):
+        with self._lock:
+            segment = self.segments.get(digest)
+            if segment is not None:
+                self.segments.move_to_end(digest)
+                self.hits += 1
+                return segment
+            self.misses += 1
+
+        segment = load_segment(store, digest)
+        with self._lock:
+            if digest not in self.segments:
+                self.segments[digest] = segment
+                self.total_events += len(segment)
+                while self.total_events > self.max_events and len(self.segments) > 1:
+                    _, evicted = self.segments.popitem(last=False)
+                    self.total_events -= len(evicted)
+        return segment
+
+    def clear(self):
+        with self._lock:
+            self.segments.clear()
+            self.total_events = 0
+
+
+# 进程内共享的热点分段缓存
+hot_segments = SegmentCache()
+
+
+def load_segment(store, digest):
+    """把分段文件读入内存中的 EventStore"""
+    segment = EventStore()
+    with BinaryRecording(segment_path(store, digest)) as recording:
+        segment.strings = list(recording.strings)
+        segment.string_ids = {value: i for i, value in enumerate(segment.strings)}
+        for name, code in COLUMNS:
+            source = recording.columns[name]
+            if recording.version == VERSION:
+                column = array.array(code)
+                column.frombytes(source.tobytes())
+            else:
+                # 旧版本分段的坐标列为整数，逐个转换
+                column = array.array(code, source)
+            segment.columns[name] = column
+    return segment
+
+
+class SegmentedRecording(ColumnarEvents):
+    """按清单拼接分段得到的录制，时间戳为分段起始时间加上分段内的相对时间
+
+    可以像 BinaryRecording 一样按下标访问、迭代或直接交给 play_events，
+    回放计划按字段编译，不生成事件字典。
+    """
+
+    def __init__(self, filename, cache=hot_segments):
+        manifest = read_manifest(filename)
+        self.filename = filename
+        self.start_time = manifest['start_time']
+        self.parts = [(reference['offset'], cache.get(manifest['store'], reference['hash']))
+                      for reference in manifest['segments']]
+        self.starts = []
+        total = 0
+        for _, segment in self.parts:
+            self.starts.append(total)
+            total += len(segment)
+        self.count = total
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def timestamps(self):
+        timestamps = array.array('d')
+        for offset, segment in self.parts:
+            timestamps.extend(offset + t for t in segment.timestamps)
+        return timestamps
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        part = bisect.bisect_right(self.starts, index) - 1
+        offset, segment = self.parts[part]
+        event = segment[index - self.starts[part]]
+        event['timestamp'] = offset + event['timestamp']
+        return event
+
+    def __iter__(self):
+        for offset, segment in self.parts:
+            for event in segment:
+                event['timestamp'] = offset + event['timestamp']
+                yield event
+
+    def iter_fields(self, start=0):
+        for (offset, segment), first in zip(self.parts, self.starts):
+            if first + len(segment) <= start:
+                continue
+            for fields in segment.iter_fields(max(0, start - first)):
+                yield (offset + fields[0],) + fields[1:]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def collect_garbage(store, manifests=(), dry_run=False, grace_period=DEFAULT_GRACE_PERIOD):
+    """删除没有被任何清单引用的分段，返回 (可删除的分段列表, 已不存在的登记清单列表)
+
+    引用关系来自仓库中登记的全部清单(不限于某个目录)以及 manifests 中额外指定的清单，
+    指向其它仓库的清单被忽略。登记的清单已不存在时视为已删除并从登记中移除；
+    移动过的清单需要重新 pack 登记，否则它引用的分段会被回收。
+    回收期间持有仓库锁；最近 grace_period 秒内修改过的分段不会被回收。
+    dry_run 为 True 时只返回结果，不删除任何文件。
+    """
+    store = os.path.abspath(store)
+    if not os.path.exists(registry_path(store)):
+        # 旧版本写入的仓库没有登记，无法确定所有引用它的清单
+        raise ValueError(f"分段仓库 {store} 没有清单登记，请先对引用它的清单重新执行 pack")
+    with store_lock(store):
+        return _collect_garbage(store, manifests, dry_run, grace_period)
+
+
+def _collect_garbage(store, manifests, dry_run, grace_period):
+    registered = registered_manifests(store)
+    candidates = list(dict.fromkeys(registered + [os.path.abspath(f) for f in manifests]))
+
+    referenced = set()
+    live = []
+    missing = []
+    for filename in candidates:
+        if not os.path.exists(filename):
+            missing.append(filename)
+            continue
+        # 清单读取失败时抛出异常，宁可不回收也不能误删
+        manifest = read_manifest(filename)
+        if os.path.abspath(manifest['store']) != store:
+            continue
+        live.append(filename)
+        referenced.update(reference['hash'] for reference in manifest['segments'])
+
+    garbage = []
+    cutoff = time.time() - grace_period
+    for root, _, names in os.walk(store):
+        for name in names:
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)] not in referenced:
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) <= cutoff:
+                    garbage.append(path)
+
+    if not dry_run:
+        for path in garbage:
+            os.remove(path)
+        temp_file = f'{registry_path(store)}.{os.getpid()}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in live)
+        os.replace(temp_file, registry_path(store))
+    return garbage, missing
+
+
+def main():
+    from recformat import find_recordings, read_recording, save_recording
+
+    parser = argparse.ArgumentParser(description='按内容哈希分段保存录制文件，共享相同的操作序列')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pack = sub.add_parser('pack', help='把录制文件转换为分段清单')
+    pack.add_argument('recordings', nargs='+')
+    pack.add_argument('--store', help=f'分段仓库目录，默认为清单旁的 {DEFAULT_STORE}')
+    pack.add_argument('--split-gap', type=float, default=DEFAULT_SPLIT_GAP, help='切分分段的空闲间隔(秒)')
+
+    unpack = sub.add_parser('unpack', help='把分段清单还原为普通录制文件')
+    unpack.add_argument('manifest')
+    unpack.add_argument('output', help='输出文件，格式由扩展名决定')
+
+    gc = sub.add_parser('gc', help='删除没有被引用的分段')
+    gc.add_argument('directory', nargs='?', default='.',
+                    help='额外检查该目录中的清单(仓库中登记的清单总会被检查)')
+    gc.add_argument('--store')
+    gc.add_argument('--dry-run', action='store_true', help='只列出将被删除的分段')
+    gc.add_argument('--grace-period', type=float, default=DEFAULT_GRACE_PERIOD,
+                    help='跳过最近修改过的分段(秒)')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        for filename in args.recordings:
+            start_time, events = read_recording(filename)
+            output = os.path.splitext(filename)[0] + '.segs'
+            count, written, reused = save_segmented(output, events, start_time, args.store,
+                                                    args.split_gap)
+            print(f"{filename} -> {output}: 事件 {count}, 新分段 {written}, 复用分段 {reused}")
+    elif args.command == 'unpack':
+        with SegmentedRecording(args.manifest) as recording:
+            count = save_recording(args.output, recording, recording.start_time)
+        print(f"已还原 {count} 个事件: {args.output}")
+    elif args.command == 'gc':
+        manifests = [f for f in find_recordings(args.directory) if is_manifest(f)]
+        store = args.store or os.path.join(args.directory, DEFAULT_STORE)
+        try:
+            garbage, missing = collect_garbage(store, manifests, args.dry_run, args.grace_period)
+        except ValueError as e:
+            print(e)
+            return
+        for filename in missing:
+            print(f"登记的清单已不存在: {filename}")
+        if args.dry_run:
+            for path in garbage:
+                print(f"将删除: {path}")
+            print(f"未引用的分段: {len(garbage)} (未删除)")
+        else:
+            print(f"删除未引用的分段: {len(garbage)}")
+
+
+if __name__ == '__main__':
+    main()
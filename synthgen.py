@@ -0,0 +1,202 @@
+import argparse
+import random
+import time
+
+from recformat import save_recording
+
+# 各类操作的默认比例
+DEFAULT_MIX = {
+    'click': 0.35,
+    'drag': 0.15,
+    'scroll': 0.15,
+    'typing': 0.25,
+    'chord': 0.10,
+}
+
+BUTTONS = ('Button.left', 'Button.left', 'Button.left', 'Button.right', 'Button.middle')
+
+WORDS = ('the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog', 'hello', 'world',
+         'input', 'record', 'replay', 'Python', 'Test', 'data', 'file', 'window', 'OK')
+
+# 常用组合键: (修饰键, 录制的键值)，Ctrl+字母在 Windows 上以控制字符形式出现
+CHORDS = (
+    (['ctrl'], '\x03'), (['ctrl'], '\x16'), (['ctrl'], '\x18'), (['ctrl'], '\x1a'),
+    (['ctrl'], '\x13'), (['ctrl'], '\x01'), (['ctrl', 'shift'], 'Key.tab'),
+    (['alt'], 'Key.tab'), (['alt'], 'Key.f4'), (['shift'], 'Key.end'),
+    (['cmd'], 'Key.left'), (['ctrl', 'alt'], 'Key.delete'),
+)
+
+# 与 InputRecorder.CONTROL_CHAR_MAP 一致的控制字符显示名
+CONTROL_NAMES = {chr(i): f'Ctrl+{chr(64 + i)}' for i in range(1, 27)}
+CONTROL_NAMES.update({'\x08': 'Backspace', '\t': 'Tab', '\n': 'Enter', '\r': 'Enter'})
+
+
+def key_display(key, modifiers):
+    """按 InputRecorder.format_key_event 的规则生成 key_display"""
+    if key in CONTROL_NAMES:
+        return CONTROL_NAMES[key]
+    if modifiers:
+        return '+'.join(modifiers) + '+' + key
+    return key
+
+
+class SyntheticRecorder:
+    """按录制器的输出格式生成合成事件
+
+    事件字段与 process_click / process_move / process_scroll / process_key 产生的完全一致，
+    时间间隔模仿真实操作: 拖拽点间隔约 10ms，按键间隔约 100ms，操作之间停顿数百毫秒，
+    偶尔出现数秒的空闲。
+    """
+
+    def __init__(self, seed=0, mix=None, screen=(1920, 1080), hover=False, move_threshold=5):
+        self.random = random.Random(seed)
+        mix = dict(mix or DEFAULT_MIX)
+        if hover:
+            mix.setdefault('hover', 0.15)
+        self.actions = list(mix)
+        self.weights = [mix[name] for name in self.actions]
+        self.width, self.height = screen
+        self.move_threshold = move_threshold
+        self.t = 0.0
+        self.x = self.width // 2
+        self.y = self.height // 2
+        self.events = []
+
+    def emit(self, event, gap):
+        self.t += gap
+        event['timestamp'] = round(self.t, 6)
+        self.events.append(event)
+
+    def random_point(self):
+        return self.random.randrange(self.width), self.random.randrange(self.height)
+
+    def clamp(self, x, y):
+        return min(max(int(x), 0), self.width - 1), min(max(int(y), 0), self.height - 1)
+
+    def mouse(self, action, button, modifiers, gap):
+        self.emit({'type': 'mouse', 'event': action, 'button': button, 'x': self.x, 'y': self.y,
+                   'modifiers': list(modifiers)}, gap)
+
+    def key(self, action, key, modifiers, gap):
+        self.emit({'type': 'keyboard', 'event': action, 'key': key,
+                   'key_display': key_display(key, modifiers), 'modifiers': list(modifiers)}, gap)
+
+    def pause(self):
+        """操作之间的停顿，约 2% 的概率出现较长的空闲"""
+        if self.random.random() < 0.02:
+            return self.random.uniform(3.0, 20.0)
+        return self.random.uniform(0.15, 1.2)
+
+    def glide(self, tx, ty, event_type, extra, interval, modifiers=()):
+        """从当前位置移动到目标位置，按移动阈值抽样产生轨迹事件"""
+        sx, sy = self.x, self.y
+        distance = max(abs(tx - sx), abs(ty - sy))
+        steps = max(2, distance // (self.move_threshold * 3))
+        bend = self.random.uniform(-0.2, 0.2)
+        for i in range(1, steps + 1):
+            f = i / steps
+            # 略带弧度的轨迹
+            offset = bend * distance * f * (1 - f)
+            x, y = self.clamp(sx + (tx - sx) * f + offset, sy + (ty - sy) * f - offset)
+            if abs(x - self.x) <= self.move_threshold and abs(y - self.y) <= self.move_threshold:
+                continue
+            self.x, self.y = x, y
+            event = {'type': event_type, 'x': x, 'y': y}
+            event.update(extra)
+            event['modifiers'] = list(modifiers)
+            self.emit(event, interval * self.random.uniform(0.7, 1.5))
+
+    def action_click(self):
+        self.x, self.y = self.random_point()
+        button = self.random.choice(BUTTONS)
+        presses = 2 if self.random.random() < 0.2 else 1
+        gap = self.pause()
+        for _ in range(presses):
+            self.mouse('pressed', button, [], gap)
+            self.mouse('released', button, [], self.random.uniform(0.05, 0.12))
+            gap = self.random.uniform(0.08, 0.15)
+
+    def action_drag(self):
+        self.x, self.y = self.random_point()
+        button = 'Button.left'
+        modifiers = ['shift'] if self.random.random() < 0.1 else []
+        start = (self.x, self.y)
+        self.mouse('pressed', button, modifiers, self.pause())
+        tx, ty = self.random_point()
+        self.glide(tx, ty, 'mouse_drag', {'button': button}, 0.012, modifiers)
+        end_gap = self.random.uniform(0.01, 0.05)
+        if (self.x, self.y) != start:
+            self.emit({'type': 'mouse_drag_end', 'start_x': start[0], 'start_y': start[1],
+                       'end_x': self.x, 'end_y': self.y, 'button': button,
+                       'modifiers': list(modifiers)}, end_gap)
+            end_gap = 0.0
+        self.mouse('released', button, modifiers, end_gap)
+
+    def action_scroll(self):
+        self.x, self.y = self.random_point()
+        modifiers = ['ctrl'] if self.random.random() < 0.1 else []
+        direction = self.random.choice((-1, 1))
+        gap = self.pause()
+        for _ in range(self.random.randint(1, 12)):
+            self.emit({'type': 'mouse_scroll', 'x': self.x, 'y': self.y, 'dx': 0, 'dy': direction,
+                       'modifiers': list(modifiers)}, gap)
+            gap = self.random.uniform(0.02, 0.08)
+
+    def action_typing(self):
+        gap = self.pause()
+        words = self.random.randint(1, 6)
+        for w in range(words):
+            for char in self.random.choice(WORDS):
+                modifiers = ['shift'] if char.isupper() else []
+                self.key('pressed', char, modifiers, gap)
+                self.key('released', char, modifiers, self.random.uniform(0.04, 0.1))
+                gap = self.random.uniform(0.05, 0.18)
+            key = 'Key.space' if w < words - 1 else self.random.choice(('Key.enter', 'Key.space'))
+            self.key('pressed', key, [], gap)
+            self.key('released', key, [], self.random.uniform(0.04, 0.1))
+            gap = self.random.uniform(0.08, 0.25)
+
+    def action_chord(self):
+        modifiers, key = self.random.choice(CHORDS)
+        self.key('pressed', key, modifiers, self.pause())
+        self.key('released', key, modifiers, self.random.uniform(0.05, 0.12))
+
+    def action_hover(self):
+        tx, ty = self.random_point()
+        self.glide(tx, ty, 'mouse_move', {}, 0.03)
+
+    def generate(self, count):
+        """生成至少 count 个事件，最后一个操作总是完整的(按下都有对应的释放)"""
+        handlers = {name: getattr(self, f'action_{name}') for name in self.actions}
+        while len(self.events) < count:
+            action = self.random.choices(self.actions, self.weights)[0]
+            handlers[action]()
+        return self.events
+
+
+def generate_events(count, seed=0, mix=None, screen=(1920, 1080), hover=False):
+    """生成约 count 个合成录制事件"""
+    return SyntheticRecorder(seed, mix, screen, hover).generate(count)
+
+
+def write_synthetic(filename, count, seed=0, mix=None, hover=False, start_time=None):
+    """生成合成录制并保存，格式由扩展名决定，返回事件数"""
+    events = generate_events(count, seed, mix, hover=hover)
+    save_recording(filename, events, start_time if start_time is not None else time.time())
+    return len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成录制文件，用于基准测试与压力测试')
+    parser.add_argument('output', help='输出文件，格式由扩展名决定 (.json / .jsonl / .arb)')
+    parser.add_argument('--events', type=int, default=10000, help='事件数(约)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子生成相同录制')
+    parser.add_argument('--hover', action='store_true', help='同时生成悬停轨迹 (mouse_move)')
+    args = parser.parse_args()
+
+    count = write_synthetic(args.output, args.events, args.seed, hover=args.hover)
+    print(f"已生成 {count} 个事件: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+from analyzer import FileAnalysis, is_stop_chord
+
+
+def esc(key, modifiers, action='pressed'):
+    return {'type': 'keyboard', 'event': action, 'key': key, 'key_display': 'Esc',
+            'modifiers': modifiers, 'timestamp': 0.0}
+
+
+def test_stop_chord_requires_ctrl():
+    assert is_stop_chord(esc('Key.esc', ['ctrl']))
+    assert is_stop_chord(esc('\x1b', ['ctrl']))
+    # 单独按 Esc 是正常操作
+    assert not is_stop_chord(esc('Key.esc', []))
+    assert not is_stop_chord(esc('\x1b', []))
+    assert not is_stop_chord(esc('\x1b', ['shift']))
+
+
+def test_plain_esc_is_not_reported():
+    events = [esc('\x1b', []), esc('\x1b', [], 'released')]
+    result = FileAnalysis().analyze(events)
+    assert 'stop_chord' not in result['issue_counts']
@@ -0,0 +1,43 @@
+import asyncio
+
+from asyncplay import AsyncPlayer, split_prelude, split_tracks
+from backends import FakeBackend
+from recformat import save_recording
+from seekindex import seek_plan
+
+EVENTS = [
+    {'type': 'mouse', 'event': 'pressed', 'button': 'Button.left', 'x': 10, 'y': 20,
+     'modifiers': [], 'timestamp': 0.0},
+    {'type': 'keyboard', 'event': 'pressed', 'key': 'a', 'key_display': 'ctrl+a',
+     'modifiers': ['ctrl'], 'timestamp': 0.01},
+    {'type': 'keyboard', 'event': 'released', 'key': 'a', 'key_display': 'ctrl+a',
+     'modifiers': ['ctrl'], 'timestamp': 0.02},
+    {'type': 'mouse', 'event': 'released', 'button': 'Button.left', 'x': 10, 'y': 20,
+     'modifiers': [], 'timestamp': 0.03},
+]
+
+
+def test_seek_prelude_runs_before_split_tracks(tmp_path):
+    filename = str(tmp_path / 'recording_seek.jsonl')
+    save_recording(filename, EVENTS, 1000.0)
+    backend = FakeBackend()
+    # 从第 3 个事件开始: 鼠标左键与 ctrl+a 都处于按下状态
+    steps = list(seek_plan(filename, backend, start_event=2))
+    assert steps[0][1] == 'seek'
+
+    prelude, rest = split_prelude(steps)
+    assert prelude == steps[:1]
+    assert set(split_tracks(rest)) == {'keyboard', 'mouse'}
+
+    reports = asyncio.run(AsyncPlayer(backend, verbosity=0).play(steps, split=True))
+    assert all(report['completed'] for report in reports.values())
+
+    calls = [call[1:] for call in backend.calls]
+    # 恢复步骤在两条轨道开始之前按原顺序完整执行
+    assert calls[:4] == [('position', 10, 20), ('press_key', 'ctrl'), ('press_key', 'a'),
+                         ('press', 'Button.left')]
+    rest = calls[4:]
+    assert ('release_key', 'a') in rest and ('release', 'Button.left') in rest
+    # 结束时恢复阶段按下的 ctrl 已被释放
+    ctrl = [name for name, *args in calls if args == ['ctrl']]
+    assert ctrl[-1] == 'release_key'
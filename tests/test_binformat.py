@@ -0,0 +1,48 @@
+from autorecorder import InputRecorder
+from backends import FakeBackend
+from binformat import BinaryRecording, EventStore, write_binary
+from playplan import compile_plan
+from recformat import load_events
+from synthgen import generate_events
+
+FLOAT_EVENTS = [
+    {'type': 'mouse_move', 'x': 100.5, 'y': 200.25, 'modifiers': [], 'timestamp': 0.1},
+    {'type': 'mouse_scroll', 'x': 10, 'y': 20, 'dx': 0, 'dy': -0.5, 'modifiers': [],
+     'timestamp': 0.2},
+    {'type': 'mouse_drag_end', 'start_x': 1.75, 'start_y': 2, 'end_x': 3, 'end_y': 4.125,
+     'button': 'Button.left', 'modifiers': ['ctrl'], 'timestamp': 0.3},
+]
+
+
+def test_float_coordinates_round_trip(tmp_path):
+    filename = str(tmp_path / 'recording_float.arb')
+    events = generate_events(100, seed=7) + FLOAT_EVENTS
+
+    assert list(EventStore(events)) == events
+    write_binary(filename, events, 1000.0)
+    with BinaryRecording(filename) as recording:
+        loaded = list(recording)
+        plan = compile_plan(recording)
+    assert loaded == events
+    # 整数坐标仍然还原为 int，小数坐标不取整
+    assert all(type(a['x']) is type(b['x']) for a, b in zip(loaded, events) if 'x' in b)
+    assert plan == compile_plan(events)
+
+
+def test_recorder_rows_match_written_events(tmp_path):
+    filename = str(tmp_path / 'recording_rows.jsonl')
+    recorder = InputRecorder(backend=FakeBackend(), keep_events=True, verbosity=0)
+    recorder.begin_capture(filename)
+    recorder.on_click(10, 20, 'Button.left', True)
+    recorder.on_move(40, 60)
+    recorder.on_click(40.5, 60, 'Button.left', False)
+    recorder.on_scroll(40, 60, 0, -1)
+    recorder.end_capture()
+
+    written = load_events(filename)
+    assert [event['type'] for event in written] == [
+        'mouse', 'mouse_drag', 'mouse_drag_end', 'mouse', 'mouse_scroll']
+    assert written[2]['start_x'] == 40 and written[2]['end_x'] == 40.5
+    # 保留在内存中的列式事件与写入文件的事件字典一致
+    assert isinstance(recorder.events, EventStore)
+    assert list(recorder.events) == written
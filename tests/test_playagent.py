@@ -0,0 +1,124 @@
+import socket
+import threading
+import time
+import zlib
+
+import pytest
+
+from backends import FakeBackend
+from playagent import (FRAME_HEADER, MAX_FRAME, MSG_BATCH, AgentClient, PlaybackAgent,
+                       ProtocolError, recv_frame)
+from playplan import iter_plan
+from synthgen import generate_events
+
+
+class SlowBackend(FakeBackend):
+    """每次移动鼠标都要耗时，回放速度低于控制端发送速度"""
+
+    def set_position(self, x, y):
+        time.sleep(0.001)
+        super().set_position(x, y)
+
+
+def start_agent(backend=None, token=None):
+    agent = PlaybackAgent(port=0, backend=backend or FakeBackend(), verbosity=0, token=token)
+    agent.recorder.min_safe_gap = 0
+    return agent.start()
+
+
+@pytest.fixture
+def steps():
+    return list(iter_plan(generate_events(400, seed=1), None))
+
+
+def test_play_over_loopback(steps):
+    agent = start_agent()
+    client = AgentClient(agent.address, batch_size=50)
+    try:
+        report = client.play(steps, max_throughput=True)
+    finally:
+        client.close()
+        agent.shutdown()
+    assert report['completed']
+    assert report['events'] == len(steps)
+    assert agent.backend.calls
+
+
+def test_backpressure_limits_unacknowledged_batches(steps):
+    agent = start_agent(SlowBackend())
+    client = AgentClient(agent.address, window=2, batch_size=10)
+    in_flight = []
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            in_flight.append(client.sent - client.acked)
+            session = agent.session
+            if session is not None:
+                in_flight.append(session.batches.qsize())
+            time.sleep(0.0005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        report = client.play(steps, max_throughput=True)
+    finally:
+        done.set()
+        sampler.join()
+        client.close()
+        agent.shutdown()
+    assert report['completed']
+    assert client.sent == (len(steps) + 9) // 10
+    assert max(in_flight) <= 2
+
+
+def test_stop_from_second_client(steps):
+    agent = start_agent()
+    player = AgentClient(agent.address, batch_size=50)
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(report=player.play(steps, speed=1.0)))
+    thread.start()
+    try:
+        # 等到回放真正开始
+        deadline = time.monotonic() + 5
+        while player.acked == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        controller = AgentClient(agent.address)
+        controller.stop()
+        thread.join(5)
+        controller.close()
+    finally:
+        player.close()
+        agent.shutdown()
+    assert not thread.is_alive()
+    assert result['report']['stopped']
+    assert not result['report']['completed']
+    assert result['report']['events'] < len(steps)
+
+
+def test_token_required(steps):
+    agent = start_agent(token='secret')
+    intruder = AgentClient(agent.address)
+    client = AgentClient(agent.address, token='secret')
+    try:
+        assert intruder.play(steps[:10], max_throughput=True) is None
+        assert intruder.error == '令牌错误'
+        report = client.play(steps[:10], max_throughput=True)
+    finally:
+        intruder.close()
+        client.close()
+        agent.shutdown()
+    assert report['completed']
+    assert len(agent.backend.calls) >= 10
+
+
+def test_decompressed_size_is_limited():
+    left, right = socket.socketpair()
+    try:
+        data = zlib.compress(b' ' * (MAX_FRAME + 1))
+        left.sendall(FRAME_HEADER.pack(len(data), MSG_BATCH) + data)
+        with pytest.raises(ProtocolError):
+            recv_frame(right)
+    finally:
+        left.close()
+        right.close()
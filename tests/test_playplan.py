@@ -0,0 +1,86 @@
+import json
+
+from backends import FakeBackend
+from playplan import (NameResolver, OP_KEY_PRESS, OP_KEY_RELEASE, ModifierTracker, compile_plan,
+                      load_plan, plan_cache_path, resolve_plan)
+from recformat import save_recording
+from synthgen import generate_events
+
+
+def test_plan_cache_is_plain_json(tmp_path):
+    filename = str(tmp_path / 'recording_plan.json')
+    events = generate_events(200, seed=5)
+    save_recording(filename, events, 1000.0)
+    backend = FakeBackend()
+    expected = list(resolve_plan(compile_plan(events, coalesce_modifiers=True), backend))
+
+    assert load_plan(filename, backend, coalesce_modifiers=True) == expected
+    with open(plan_cache_path(filename), 'r', encoding='utf-8') as f:
+        cached = json.load(f)
+    assert len(cached['steps']) == len(expected)
+
+    # 第二次直接读取缓存，结果与重新编译一致
+    assert load_plan(filename, backend, coalesce_modifiers=True) == expected
+    # 编译选项不同时不能使用同一份缓存
+    assert load_plan(filename, backend) == list(resolve_plan(compile_plan(events), backend))
+
+
+def key(action, key, modifiers, timestamp):
+    return {'type': 'keyboard', 'event': action, 'key': key, 'key_display': key,
+            'modifiers': list(modifiers), 'timestamp': timestamp}
+
+
+def click(action, timestamp):
+    return {'type': 'mouse', 'event': action, 'button': 'Button.left', 'x': 1, 'y': 2,
+            'modifiers': [], 'timestamp': timestamp}
+
+
+MODIFIER_KEYS = ('Key.ctrl', 'Key.alt', 'Key.shift', 'Key.cmd')
+
+
+def modifier_ops(steps):
+    """计划中所有修饰键操作 (步骤序号, 操作码, 键名)"""
+    return [(i, op, args[0]) for i, (_, _, ops, _) in enumerate(steps) for op, args in ops
+            if op in (OP_KEY_PRESS, OP_KEY_RELEASE) and args[0] in MODIFIER_KEYS]
+
+
+def test_tracker_only_emits_changes():
+    tracker = ModifierTracker(NameResolver(), held=['ctrl'])
+    assert tracker.sync(['ctrl', 'shift']) == ((OP_KEY_PRESS, ('Key.shift',)),)
+    assert tracker.sync(['ctrl', 'shift']) == ()
+    # 释放顺序与按下顺序相反
+    assert tracker.sync([]) == ((OP_KEY_RELEASE, ('Key.shift',)), (OP_KEY_RELEASE, ('Key.ctrl',)))
+    assert tracker.held == []
+
+
+def test_coalescing_merges_redundant_modifier_pairs():
+    events = [key('pressed', '\x03', ['ctrl'], 0.0), key('released', '\x03', ['ctrl'], 0.1),
+              key('pressed', '\x16', ['ctrl'], 0.2), key('released', '\x16', ['ctrl'], 0.3)]
+
+    # 不合并时每个组合键都单独按下、释放 ctrl
+    assert len(modifier_ops(compile_plan(events))) == 4
+
+    steps = compile_plan(events, coalesce_modifiers=True)
+    # 合并后两次 ctrl 组合键共用一次按下，回放结束时统一释放
+    assert modifier_ops(steps) == [(0, OP_KEY_PRESS, 'Key.ctrl'),
+                                   (len(steps) - 1, OP_KEY_RELEASE, 'Key.ctrl')]
+    assert steps[-1][3] == "Modifiers released"
+
+
+def test_coalescing_releases_modifiers_around_mouse_steps():
+    events = [key('pressed', 'Key.tab', ['alt'], 0.0), key('released', 'Key.tab', ['alt'], 0.1),
+              click('pressed', 0.2), click('released', 0.3),
+              key('pressed', 'Key.tab', ['alt'], 0.4)]
+    steps = compile_plan(events, coalesce_modifiers=True)
+
+    # alt 在鼠标步骤之前释放，鼠标步骤之后的组合键重新按下，结束时释放
+    assert modifier_ops(steps) == [(0, OP_KEY_PRESS, 'Key.alt'), (2, OP_KEY_RELEASE, 'Key.alt'),
+                                   (4, OP_KEY_PRESS, 'Key.alt'), (5, OP_KEY_RELEASE, 'Key.alt')]
+    assert steps[2][2][0] == (OP_KEY_RELEASE, ('Key.alt',))
+
+
+def test_coalescing_releases_modifiers_held_before_start():
+    steps = compile_plan([click('pressed', 0.0)], coalesce_modifiers=True,
+                         held_modifiers=['shift'])
+    assert steps[0][2][0] == (OP_KEY_RELEASE, ('Key.shift',))
+    assert len(steps) == 1
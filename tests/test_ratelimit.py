@@ -0,0 +1,89 @@
+import pytest
+
+from autorecorder import InputRecorder
+from backends import FakeBackend
+from playplan import OP_KEY_PRESS, OP_MOVE, OP_TYPE
+from ratelimit import RateGovernor, TokenBucket
+
+
+class FakeClock:
+    """手动推进的时钟，sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def moves(count):
+    return [(i * 0.0001, 'mouse_move', ((OP_MOVE, (i, 0)),), '') for i in range(count)]
+
+
+def test_token_bucket_allows_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(100, 5, clock)
+    for _ in range(5):
+        assert bucket.delay(1, clock()) == 0
+        bucket.take(1)
+    assert bucket.delay(1, clock()) == pytest.approx(0.01)
+    clock.now += 0.02
+    assert bucket.delay(2, clock()) == 0
+
+
+def test_governor_limits_each_device_separately():
+    clock = FakeClock()
+    governor = RateGovernor({'mouse': 100, 'keyboard': 10}, burst=10, clock=clock,
+                            sleep=clock.sleep)
+    for _ in range(110):
+        governor.throttle(((OP_MOVE, (0, 0)),))
+    # 前 10 个使用突发额度，之后每秒 100 个
+    assert clock.now == pytest.approx(1.0)
+
+    started = clock.now
+    governor.throttle(((OP_TYPE, ('hello world',)),))
+    governor.throttle(((OP_KEY_PRESS, ('a',)),))
+    # 键盘轨道的额度独立，文本按字符计算
+    assert clock.now - started == pytest.approx(0.2)
+
+    summary = governor.summary()
+    assert summary['events'] == {'mouse': 110, 'keyboard': 12}
+    assert summary['delayed'] == 101
+    assert summary['dropped'] == 0
+
+
+def test_feedback_backs_off_when_calls_slow_down_and_recovers():
+    clock = FakeClock()
+    governor = RateGovernor({'mouse': 1000, 'keyboard': 1000}, adaptive=True,
+                            latency_target=0.002, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        governor.observe(1, 0.01)
+    assert governor.scale < 0.5
+    assert governor.buckets['mouse'].rate == pytest.approx(1000 * governor.scale)
+    assert governor.backoffs >= 2
+
+    for _ in range(200):
+        governor.observe(1, 0.0001)
+    assert governor.scale == 1.0
+
+
+@pytest.mark.parametrize('rates', [{'mouse': 0}, {'mouse': 100, 'keyboard': -5}])
+def test_rates_must_be_positive(rates):
+    with pytest.raises(ValueError):
+        RateGovernor(rates)
+
+
+def test_play_plan_reports_rate_summary():
+    recorder = InputRecorder(backend=FakeBackend(), verbosity=0)
+    recorder.min_safe_gap = 0
+    governor = RateGovernor({'mouse': 2000, 'keyboard': 2000}, burst=10)
+    report = recorder.play_plan(moves(60), max_throughput=True, governor=governor)
+
+    assert report['completed']
+    assert report['rate']['events']['mouse'] == 60
+    assert report['rate']['delayed'] > 0
+    # 60 个事件减去 10 个突发额度，每秒 2000 个至少需要 25ms
+    assert report['rate']['elapsed'] >= 0.025
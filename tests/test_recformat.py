@@ -0,0 +1,121 @@
+import json
+import threading
+
+import pytest
+
+from recformat import (NDJSON_FORMAT, RecordingWriter, is_ndjson, iter_legacy_json, iter_ndjson,
+                       load_events, load_ndjson)
+from synthgen import generate_events
+
+
+def write_events(filename, events, start_time=1000.0):
+    writer = RecordingWriter(str(filename), start_time, queue_size=16, flush_interval=0.01)
+    writer.start()
+    for event in events:
+        writer.write(event)
+    return writer.close()
+
+
+def test_writer_round_trip(tmp_path):
+    filename = tmp_path / 'recording_test.jsonl'
+    events = generate_events(500, seed=2)
+
+    assert write_events(filename, events) == len(events)
+    assert is_ndjson(str(filename))
+
+    lines = filename.read_text(encoding='utf-8').splitlines()
+    header, footer = json.loads(lines[0]), json.loads(lines[-1])
+    assert header['format'] == NDJSON_FORMAT
+    assert header['start_time'] == 1000.0
+    assert footer['footer'] and footer['event_count'] == len(events)
+
+    assert load_ndjson(str(filename)) == (header, events)
+    assert list(iter_ndjson(str(filename))) == events
+    assert load_events(str(filename)) == events
+
+
+def test_truncated_recording_is_readable(tmp_path):
+    filename = tmp_path / 'recording_crash.jsonl'
+    events = generate_events(50, seed=3)
+    write_events(filename, events)
+
+    # 模拟录制时崩溃: 没有尾部，最后一行只写了一半
+    lines = filename.read_text(encoding='utf-8').splitlines()[:-1]
+    lines[-1] = lines[-1][:len(lines[-1]) // 2]
+    filename.write_text('\n'.join(lines), encoding='utf-8')
+
+    assert load_events(str(filename)) == events[:-1]
+    assert list(iter_ndjson(str(filename))) == events[:-1]
+
+
+class FailingFile:
+    """写入时报磁盘已满的文件"""
+
+    def write(self, text):
+        raise OSError(28, 'No space left on device')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_writer_failure_is_raised_instead_of_blocking(tmp_path):
+    writer = RecordingWriter(str(tmp_path / 'recording_full.jsonl'), 1000.0, queue_size=4,
+                             flush_interval=0.01)
+    writer.start()
+    writer._file.close()
+    writer._file = FailingFile()
+    errors = []
+
+    def produce():
+        try:
+            for event in generate_events(100, seed=4):
+                writer.write(event)
+        except OSError as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    producer.join(5)
+    # 写入线程出错后 write 不能在已满的队列上阻塞
+    assert not producer.is_alive()
+    assert writer.failed and errors and errors[0].errno == 28
+
+    with pytest.raises(OSError):
+        writer.close()
+
+
+TRICKY_EVENTS = [
+    {'type': 'keyboard', 'event': 'pressed', 'key': '"', 'key_display': 'shift+"',
+     'modifiers': ['shift'], 'timestamp': 0.5},
+    {'type': 'keyboard', 'event': 'pressed', 'key': '{', 'key_display': '{"}\\[,]',
+     'modifiers': [], 'timestamp': 12345.678901},
+    {'type': 'keyboard', 'event': 'released', 'key': '\\', 'key_display': '\\"\\\\',
+     'modifiers': [], 'timestamp': 1e-07},
+    {'type': 'keyboard', 'event': 'pressed', 'key': '中', 'key_display': '\u4e2d\n\t',
+     'modifiers': ['ctrl', 'alt'], 'timestamp': 100},
+    {'type': 'mouse_scroll', 'x': -12, 'y': 3400, 'dx': 0, 'dy': -1, 'modifiers': [],
+     'timestamp': 2.25},
+]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_legacy_json_chunk_boundaries(tmp_path, indent):
+    filename = tmp_path / 'recording_legacy.json'
+    data = {'start_time': 1712345678.125, 'note': {'a': '}{"]['},
+            'events': TRICKY_EVENTS + generate_events(30, seed=8), 'end': [1, 2.5, None, True]}
+    filename.write_text(json.dumps(data, ensure_ascii=False, indent=indent), encoding='utf-8')
+    expected = json.loads(filename.read_text(encoding='utf-8'))['events']
+
+    # 每种块大小都会把字符串、转义序列、数字与括号切在不同位置
+    for chunk_size in list(range(1, 24)) + [64, 65536]:
+        assert list(iter_legacy_json(str(filename), chunk_size)) == expected, chunk_size
+
+
+def test_legacy_json_empty_events(tmp_path):
+    filename = tmp_path / 'recording_empty.json'
+    filename.write_text('{ "events" : [ ] , "start_time" : 12 }', encoding='utf-8')
+    for chunk_size in (1, 2, 3, 5):
+        assert list(iter_legacy_json(str(filename), chunk_size)) == []
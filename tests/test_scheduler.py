@@ -0,0 +1,82 @@
+import pytest
+
+from autorecorder import InputRecorder
+from backends import FakeBackend
+from scheduler import DeadlineScheduler
+
+
+class TickingClock:
+    """每次读取推进 tick 秒的时钟，sleep 直接推进时间，自旋等待也能结束"""
+
+    def __init__(self, tick=0.0001):
+        self.now = 0.0
+        self.tick = tick
+        self.sleeps = []
+
+    def __call__(self):
+        self.now += self.tick
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+EVENTS = [
+    {'type': 'mouse', 'event': 'pressed', 'button': 'Button.left', 'x': 5, 'y': 6,
+     'modifiers': [], 'timestamp': 0.0},
+    {'type': 'mouse_drag', 'x': 50, 'y': 60, 'button': 'Button.left', 'modifiers': [],
+     'timestamp': 0.04},
+    {'type': 'mouse', 'event': 'released', 'button': 'Button.left', 'x': 50, 'y': 60,
+     'modifiers': [], 'timestamp': 0.08},
+    {'type': 'keyboard', 'event': 'pressed', 'key': 'a', 'key_display': 'a', 'modifiers': [],
+     'timestamp': 0.12},
+]
+
+
+def test_scheduler_uses_absolute_deadlines():
+    clock = TickingClock()
+    scheduler = DeadlineScheduler(speed=2.0, clock=clock, sleep=clock.sleep)
+    start = scheduler.start()
+
+    assert scheduler.wait(1.0) == pytest.approx(0.0, abs=0.001)
+    assert clock.now == pytest.approx(start + 0.5, abs=0.001)
+    # 单次 sleep 不超过 max_sleep，最后一段自旋补齐
+    assert max(clock.sleeps) <= scheduler.max_sleep
+
+    # 分发耗时不会推迟后面的截止时间
+    clock.now += 0.3
+    assert scheduler.wait(2.0) == pytest.approx(0.0, abs=0.001)
+    assert clock.now == pytest.approx(start + 1.0, abs=0.001)
+
+    # 已经错过的截止时间不等待，直接返回延迟
+    clock.now += 0.2
+    assert scheduler.wait(2.1) == pytest.approx(0.15, abs=0.001)
+    assert scheduler.summary()['count'] == 3
+
+
+def test_scheduler_stops_waiting_when_asked():
+    clock = TickingClock()
+    scheduler = DeadlineScheduler(clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    assert scheduler.wait(10.0, should_stop=lambda: clock.now > 1.0) is None
+    assert clock.now < 1.1
+
+
+@pytest.mark.parametrize('speed', [1.0, 2.0])
+def test_replay_dispatches_plan_on_schedule(speed):
+    backend = FakeBackend()
+    recorder = InputRecorder(backend=backend, verbosity=0)
+    report = recorder.play_events(EVENTS, speed=speed)
+
+    assert report['completed'] and report['events'] == len(EVENTS)
+    assert [call[1:] for call in backend.calls] == [
+        ('position', 5, 6), ('press', 'Button.left'),
+        ('position', 50, 60),
+        ('position', 50, 60), ('release', 'Button.left'),
+        ('press_key', 'a'),
+    ]
+    # 每一步的第一个调用在 timestamp / speed 时刻发出
+    first = [backend.calls[i][0] for i in (0, 2, 3, 5)]
+    for event, dispatched in zip(EVENTS, first):
+        assert dispatched - first[0] == pytest.approx(event['timestamp'] / speed, abs=0.01)
@@ -0,0 +1,157 @@
+import threading
+import time
+
+from autorecorder import InputRecorder
+from backends import FakeBackend
+from playplan import iter_plan
+from recformat import load_events
+from screensync import (CursorRegionWatcher, FakeFramebuffer, RegionSampler, ScreenSync,
+                        region_around, region_hash)
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def test_region_around_stays_on_screen():
+    assert region_around(5, 5, 32, (100, 80)) == (0, 0, 32, 32)
+    assert region_around(99, 79, 32, (100, 80)) == (68, 48, 32, 32)
+    assert region_around(50, 40, 32, (100, 80)) == (34, 24, 32, 32)
+
+
+def test_sampler_reuses_hash_until_framebuffer_changes():
+    screen = FakeFramebuffer(64, 64)
+    sampler = RegionSampler(screen)
+    first = sampler.hash(0, 0, 16, 16)
+    assert sampler.hash(0, 0, 16, 16) == first
+    assert screen.grabs == 1
+
+    screen.fill(0, 0, 16, 16, RED)
+    assert sampler.hash(0, 0, 16, 16) != first
+    assert screen.grabs == 2
+
+
+def test_watcher_uses_sample_taken_before_press():
+    screen = FakeFramebuffer(200, 200)
+    watcher = CursorRegionWatcher(screen, size=16)
+    watcher.move(100, 100)
+    watcher.sample()
+    pressed_at = time.time()
+    before = region_hash(screen.grab(*region_around(100, 100, 16, screen.size)))
+
+    # 按下之后画面变化，截图线程又截取了一次
+    time.sleep(0.01)
+    screen.fill(92, 92, 16, 16, RED)
+    watcher.sample()
+
+    assert watcher.region_before(100, 100, pressed_at)[4] == before
+    assert watcher.region_before(150, 150, pressed_at) is None
+
+
+def test_recorded_sync_is_pre_click_frame(tmp_path):
+    screen = FakeFramebuffer(200, 200)
+    recorder = InputRecorder(backend=FakeBackend(), verbosity=0, screen_source=screen,
+                             sync_region=16)
+    filename = str(tmp_path / 'recording_sync.jsonl')
+    recorder.begin_capture(filename)
+    recorder.on_move(100, 100)
+    time.sleep(0.1)
+    before = region_hash(screen.grab(*region_around(100, 100, 16, screen.size)))
+
+    recorder.on_click(100, 100, 'Button.left', True)
+    # 应用立即响应点击(按钮高亮)，处理线程稍后才处理按下事件
+    screen.fill(92, 92, 16, 16, RED)
+    time.sleep(0.05)
+    recorder.on_click(100, 100, 'Button.left', False)
+    recorder.end_capture()
+
+    syncs = [event for event in load_events(filename) if event['type'] == 'sync']
+    assert len(syncs) == 1
+    assert (syncs[0]['x'], syncs[0]['y']) == (100, 100)
+    assert syncs[0]['hash'] == before
+
+
+def sync_plan(screen, expected_color):
+    """在 (8, 8) 处点击之前等待以它为中心的 16x16 区域变为 expected_color"""
+    target = FakeFramebuffer(*screen.size)
+    target.fill(0, 0, 16, 16, expected_color)
+    events = [
+        {'type': 'sync', 'x': 8, 'y': 8, 'width': 16, 'height': 16,
+         'hash': region_hash(target.grab(0, 0, 16, 16)), 'timestamp': 5.0},
+        {'type': 'mouse', 'event': 'pressed', 'button': 'Button.left', 'x': 8, 'y': 8,
+         'modifiers': [], 'timestamp': 5.0},
+        {'type': 'mouse', 'event': 'released', 'button': 'Button.left', 'x': 8, 'y': 8,
+         'modifiers': [], 'timestamp': 5.05},
+    ]
+    return list(iter_plan(events, FakeBackend()))
+
+
+def test_replay_continues_as_soon_as_screen_matches():
+    screen = FakeFramebuffer(64, 64)
+    backend = FakeBackend()
+    recorder = InputRecorder(backend=backend, verbosity=0)
+    threading.Timer(0.1, screen.fill, (0, 0, 16, 16, BLUE)).start()
+
+    started = time.perf_counter()
+    report = recorder.play_plan(sync_plan(screen, BLUE), sync=ScreenSync(screen, timeout=2.0))
+    elapsed = time.perf_counter() - started
+
+    assert report['completed']
+    assert report['sync_matched'] == 1 and report['sync_timeouts'] == 0
+    assert report['warnings'] == []
+    # 同步点之后以匹配时刻为起点，不再等待录制中的 5 秒
+    assert elapsed < 1.0
+    # 先把光标移到点击位置再比较画面
+    assert [call[1:] for call in backend.calls] == [
+        ('position', 8, 8), ('position', 8, 8), ('press', 'Button.left'),
+        ('position', 8, 8), ('release', 'Button.left')]
+
+
+class HoverScreen(FakeFramebuffer):
+    """光标位于按钮上时按钮高亮，用于检查同步前是否已移动光标"""
+
+    def __init__(self, backend, button, width=64, height=64):
+        super().__init__(width, height)
+        self.backend = backend
+        self.button = button    # (left, top, width, height)
+        self.hovered = None
+
+    def grab(self, left, top, width, height):
+        x, y = self.backend.position
+        bx, by, bw, bh = self.button
+        hovered = bx <= x < bx + bw and by <= y < by + bh
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.fill(bx, by, bw, bh, RED if hovered else BLUE)
+        return super().grab(left, top, width, height)
+
+
+def test_sync_matches_hover_state_at_click_point():
+    # 录制时光标在按钮上，按钮处于高亮状态
+    recorded = HoverScreen(FakeBackend(), (24, 24, 16, 16))
+    recorded.backend.position = (32, 32)
+    expected = region_hash(recorded.grab(*region_around(32, 32, 16, recorded.size)))
+
+    backend = FakeBackend()
+    screen = HoverScreen(backend, (24, 24, 16, 16))
+    events = [
+        {'type': 'mouse_move', 'x': 0, 'y': 0, 'modifiers': [], 'timestamp': 0.0},
+        {'type': 'sync', 'x': 32, 'y': 32, 'width': 16, 'height': 16, 'hash': expected,
+         'timestamp': 0.1},
+        {'type': 'mouse', 'event': 'pressed', 'button': 'Button.left', 'x': 32, 'y': 32,
+         'modifiers': [], 'timestamp': 0.1},
+    ]
+    recorder = InputRecorder(backend=backend, verbosity=0)
+    report = recorder.play_plan(list(iter_plan(events, backend)),
+                                sync=ScreenSync(screen, timeout=0.5))
+
+    assert report['sync_matched'] == 1 and report['sync_timeouts'] == 0
+
+
+def test_sync_timeout_is_reported():
+    screen = FakeFramebuffer(64, 64)
+    recorder = InputRecorder(backend=FakeBackend(), verbosity=0)
+    report = recorder.play_plan(sync_plan(screen, RED), sync=ScreenSync(screen, timeout=0.05))
+
+    assert report['completed']
+    assert report['sync_timeouts'] == 1
+    assert len(report['warnings']) == 1
@@ -0,0 +1,27 @@
+from seekindex import SeekIndex, index_path, load_index
+from recformat import save_recording
+from synthgen import generate_events
+
+
+def test_index_cache_round_trip(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'recording_seek.jsonl')
+    events = generate_events(300, seed=6)
+    save_recording(filename, events, 1000.0)
+    built = SeekIndex.build(filename, interval=16)
+
+    first = load_index(filename, interval=16)
+    with open(index_path(filename), 'rb') as f:
+        assert f.read(1) == b'{'
+    # 第二次必须直接读取索引文件
+    monkeypatch.setattr(SeekIndex, 'build', None)
+    cached = load_index(filename, interval=16)
+
+    for index in (first, cached):
+        assert index.kind == built.kind == 'ndjson'
+        assert index.timestamps == built.timestamps
+        assert index.checkpoints == built.checkpoints
+        assert index.offsets == built.offsets
+
+    state, rest = cached.seek(filename, 100)
+    assert next(rest) == events[100]
+    assert state.snapshot() == built.seek(filename, 100)[0].snapshot()
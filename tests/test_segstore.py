@@ -0,0 +1,66 @@
+import os
+import threading
+
+from segstore import (SegmentedRecording, collect_garbage, registered_manifests, save_segmented,
+                      store_lock)
+from synthgen import generate_events
+
+
+def same_events(recording, events):
+    """分段内使用相对时间，时间戳允许浮点误差"""
+    loaded = list(recording)
+    return (len(loaded) == len(events)
+            and all(abs(a.pop('timestamp') - b['timestamp']) < 1e-6
+                    and a == {k: v for k, v in b.items() if k != 'timestamp'}
+                    for a, b in zip(loaded, events)))
+
+
+def pack(tmp_path, name, events):
+    filename = str(tmp_path / name)
+    save_segmented(filename, events, 1000.0, split_gap=0.5)
+    return filename
+
+
+def test_gc_removes_segments_of_deleted_manifest(tmp_path):
+    store = str(tmp_path / 'segments')
+    shared = generate_events(20, seed=1)
+    kept = pack(tmp_path, 'kept.segs', shared)
+    deleted = pack(tmp_path, 'deleted.segs', generate_events(20, seed=2))
+    os.remove(deleted)
+
+    # 新写入的分段在宽限期内不会被回收
+    assert collect_garbage(store, dry_run=True, grace_period=600) == (
+        [], [os.path.abspath(deleted)])
+
+    garbage, missing = collect_garbage(store, grace_period=0)
+    assert garbage and missing == [os.path.abspath(deleted)]
+    assert not any(os.path.exists(path) for path in garbage)
+    assert registered_manifests(store) == [os.path.abspath(kept)]
+    with SegmentedRecording(kept) as recording:
+        assert same_events(recording, shared)
+
+
+def test_gc_and_save_wait_for_store_lock(tmp_path):
+    store = str(tmp_path / 'segments')
+    pack(tmp_path, 'first.segs', generate_events(10, seed=3))
+    late = str(tmp_path / 'late.segs')
+    late_events = generate_events(10, seed=4)
+
+    with store_lock(store):
+        workers = [
+            threading.Thread(target=collect_garbage, args=(store,), kwargs={'grace_period': 0}),
+            threading.Thread(target=save_segmented, args=(late, late_events, 1000.0, store)),
+        ]
+        for worker in workers:
+            worker.start()
+        workers[0].join(0.2)
+        # 持有仓库锁时回收和保存都必须等待
+        assert all(worker.is_alive() for worker in workers)
+        assert not os.path.exists(late)
+    for worker in workers:
+        worker.join()
+
+    # 无论两者谁先拿到锁，新清单的登记和分段都必须保留
+    assert os.path.abspath(late) in registered_manifests(store)
+    with SegmentedRecording(late) as recording:
+        assert same_events(recording, late_events)
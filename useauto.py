@@ -1,22 +1,55 @@
 from autorecorder import InputRecorder
-import json
+from playmetrics import PlaybackMetrics
+from playplan import iter_plan
+from ratelimit import RateGovernor
+from screensync import DEFAULT_SYNC_TIMEOUT, MssScreen, ScreenSync
 import time
 
 
-def play_recording(filename, speed=1.0):
+def play_recording(filename, speed=1.0, coalesce_modifiers=False, batch_typing=False,
+                   idle_threshold=None, max_idle=0.5, max_throughput=False, stream=False,
+                   metrics_file=None, start_at=None, start_event=None, screen_sync=False,
+                   sync_timeout=DEFAULT_SYNC_TIMEOUT, max_rate=None, rate_feedback=False):
     # 创建 InputRecorder 实例, 用来调用回放函数
     recorder = InputRecorder()
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        events = data['events']
+    # coalesce_modifiers: 修饰键只在状态变化时按下/释放; batch_typing: 连续字符合并为一次输入
+    options = {'coalesce_modifiers': coalesce_modifiers, 'batch_typing': batch_typing}
+
+    if start_at is not None or start_event is not None:
+        # 从中途(秒或事件序号)开始回放，例如上次在第 14 分钟失败时从失败处继续
+        plan = recorder.seek_plan(filename, start_at, start_event, **options)
+    elif stream:
+        # 边读边编译边回放，适合非常大的录制文件
+        plan = iter_plan(recorder.stream_recording(filename), recorder.backend, **options)
+    else:
+        # 兼容各种录制格式，编译好的回放计划会缓存在录制文件旁边
+        plan = recorder.load_plan(filename, **options)
 
     print(f"准备回放{filename},速度:{speed}x")
     print("3秒后开始回放...")
     time.sleep(3)
 
     # 开始回放
-    recorder.play_events(events, speed)
+    # idle_threshold: 超过该秒数的空闲间隔缩短为 max_idle; max_throughput: 以最小安全间隔尽快回放
+    # metrics_file: 指定时记录每个事件的延迟与调用耗时，导出为 <metrics_file>.json 和 <metrics_file>.prom
+    metrics = PlaybackMetrics() if metrics_file else None
+    # screen_sync: 在录制的屏幕同步点等待画面就绪后立即继续，最多等待 sync_timeout 秒
+    sync = ScreenSync(MssScreen(), timeout=sync_timeout) if screen_sync else None
+    # max_rate: 每秒最多发出的输入事件数，可以是一个数或 {'mouse': ..., 'keyboard': ...};
+    # rate_feedback: 根据控制器调用耗时判断输入队列是否饱和并自动降速
+    governor = None
+    if max_rate is not None or rate_feedback:
+        if max_rate is not None and not isinstance(max_rate, dict):
+            max_rate = {'mouse': max_rate, 'keyboard': max_rate}
+        governor = RateGovernor(max_rate, adaptive=rate_feedback)
+    recorder.play_plan(plan, speed, idle_threshold, max_idle, max_throughput, metrics, sync,
+                       governor)
+
+    if metrics:
+        metrics.export_json(f"{metrics_file}.json")
+        metrics.export_prometheus(f"{metrics_file}.prom")
+        print(f"回放指标已保存到: {metrics_file}.json, {metrics_file}.prom")
 
 
 if __name__ == "__main__":